@@ -0,0 +1,99 @@
+import os
+import time
+import numpy as np
+
+
+# Binary trace of the analyzer inputs and outputs, for replaying sessions offline (see replayTrace.py).
+# The file is a 16 bytes header (magic, version, record size) followed by fixed size little-endian records,
+# in the order the analyzer was called. Records are only appended, so the file can be read with np.memmap
+# while it is written. A trace cut by a crash loses the records of the last flush interval (1 s by default)
+# and a partial last record.
+traceMagic = 'VMPTRACE'
+traceVersion = 1
+headerSize = 16
+
+# record kinds
+MoveRecord = 0
+EyesRecord = 1
+
+# stamp - frame timestamp, seconds. Move records: tracked point delta (headDx, headDy) and the filtered pointer
+# move (moveX, moveY). Eyes records: eye openness probabilities and the BlinkEvent the analyzer returned.
+# Fields not used by the kind are NaN (event is 0)
+traceDtype = np.dtype([('stamp', '<f8'), ('kind', 'u1'), ('event', 'u1'),
+                       ('headDx', '<f4'), ('headDy', '<f4'), ('moveX', '<f4'), ('moveY', '<f4'),
+                       ('openLeft', '<f4'), ('openRight', '<f4')])
+
+
+def _header():
+    return traceMagic + np.array([traceVersion, traceDtype.itemsize], '<u4').tostring()
+
+
+def _check_header(header, fileName):
+    if len(header) < headerSize or header[:8] != traceMagic:
+        raise ValueError('%s is not an analyzer trace' % fileName)
+    version, itemSize = np.fromstring(header[8:headerSize], '<u4')
+    if version != traceVersion or itemSize != traceDtype.itemsize:
+        raise ValueError('%s: unsupported trace version %d' % (fileName, version))
+
+
+# appends records to the trace file. Records are collected in a preallocated array and written in blocks,
+# when it is full or flushInterval seconds passed, so that recording costs the frame processing a few array stores
+class TraceWriter:
+    def __init__(self, fileName, bufferSize=4096, flushInterval=1.):
+        self.fileName = fileName
+        if os.path.exists(fileName) and os.path.getsize(fileName) > 0:
+            # continue the existing trace, dropping a partial last record
+            with open(fileName, 'rb') as f:
+                _check_header(f.read(headerSize), fileName)
+            self.__file = open(fileName, 'r+b')
+            size = os.path.getsize(fileName)
+            self.__file.truncate(size - (size - headerSize) % traceDtype.itemsize)
+            self.__file.seek(0, os.SEEK_END)
+        else:
+            self.__file = open(fileName, 'wb')
+            self.__file.write(_header())
+            # readers can open the trace before the first records are written
+            self.__file.flush()
+        self.__buffer = np.zeros(bufferSize, traceDtype)
+        self.__count = 0
+        self.recordCount = 0
+        self.flushInterval = flushInterval
+        self.__lastFlush = time.time()
+
+    def add_move(self, stamp, headDx, headDy, moveX, moveY):
+        self.__buffer[self.__count] = (stamp, MoveRecord, 0, headDx, headDy, moveX, moveY, np.nan, np.nan)
+        self.__added()
+
+    def add_eyes(self, stamp, openLeft, openRight, event):
+        self.__buffer[self.__count] = (stamp, EyesRecord, event, np.nan, np.nan, np.nan, np.nan, openLeft, openRight)
+        self.__added()
+
+    def __added(self):
+        self.__count += 1
+        self.recordCount += 1
+        if self.__count == len(self.__buffer) or time.time() - self.__lastFlush >= self.flushInterval:
+            self.flush()
+
+    # writes the collected records
+    def flush(self):
+        if self.__count > 0:
+            self.__file.write(self.__buffer[:self.__count].tostring())
+            self.__count = 0
+        self.__file.flush()
+        self.__lastFlush = time.time()
+
+    def close(self):
+        if self.__file is not None:
+            self.flush()
+            self.__file.close()
+            self.__file = None
+
+
+# returns the trace records as a read-only memory-mapped traceDtype array
+def read_trace(fileName):
+    with open(fileName, 'rb') as f:
+        _check_header(f.read(headerSize), fileName)
+    count = (os.path.getsize(fileName) - headerSize) // traceDtype.itemsize
+    if count == 0:
+        return np.zeros(0, traceDtype)
+    return np.memmap(fileName, traceDtype, 'r', headerSize, (count,))
@@ -0,0 +1,39 @@
+import threading
+import time
+
+
+# runs slow startup steps (model loading, camera opening) in parallel threads, the results are picked up by name.
+# dlib and OpenCV release the GIL while reading the models and opening the camera, so the steps overlap.
+# Load durations are added to the timings as 'load <name>' stages
+class BackgroundLoader:
+    def __init__(self, timings=None):
+        self.timings = timings
+        self.__threads = {}
+        self.__results = {}
+        self.__errors = {}
+
+    # starts function(*args) in a new thread
+    def add(self, name, function, *args):
+        thread = threading.Thread(target=self.__run, args=(name, function, args))
+        thread.daemon = True
+        self.__threads[name] = thread
+        thread.start()
+
+    def is_done(self, name):
+        return not self.__threads[name].is_alive()
+
+    # waits for the step and returns its result, re-raises its exception
+    def get(self, name, timeout=None):
+        self.__threads[name].join(timeout)
+        if name in self.__errors:
+            raise self.__errors[name]
+        return self.__results.get(name)
+
+    def __run(self, name, function, args):
+        start = time.time()
+        try:
+            self.__results[name] = function(*args)
+        except Exception as e:
+            self.__errors[name] = e
+        if self.timings is not None:
+            self.timings.add('load ' + name, time.time() - start)
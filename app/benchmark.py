@@ -0,0 +1,443 @@
+__author__ = "Roman Semenyk"
+__copyright__ = "Copyright 2017, VirtualMousePad"
+__license__ = "GPLv3"
+
+# Headless replay harness for the processing pipeline.
+# Replays a recorded session (video file, image directory or .npz) through the same processing chain as main.py,
+# without preview window and mouse control, and reports per-stage timings and frame-to-event latencies.
+# usage:
+#   python ./app/benchmark.py session.avi [--frames 1000] [--realtime] [--json result.json]
+#   python ./app/benchmark.py 0 --record session.npz --frames 300    (records a session from the web camera)
+#   python ./app/benchmark.py session.npz --trace session.trace         (records the analyzer trace, see replayTrace.py)
+#   python ./app/benchmark.py a.npz,b.npz,c.npz --multi-source [--no-batch]  (several cameras in one SourcePool)
+#   python ./app/benchmark.py --preprocessing                           (eye images preprocessing micro benchmark)
+#   python ./app/benchmark.py --compare-backends caffe,opencv,numpy      (inference backends speed and agreement)
+
+import argparse
+import json
+import time
+import cv2
+import numpy as np
+from frameSource import open_frame_source, record_npz, PacedSource
+from frameBuffer import FrameRingBuffer
+from metrics import StageTimings
+from motionAndBlinkAnalyzer import BlinkEvent, accelerationCurves
+
+landmarks_fn = './classifier/shape_predictor_68_face_landmarks.dat'
+nn_definition_file = 'classifier/model_deploy.prototxt'
+nn_weights_file = 'classifier/model_weights_97.22.caffemodel'
+
+
+# runs the pipeline over all frames of the source, returns benchmark results dictionary.
+# With useRoi only the region around the face is converted to gray, as in the application
+def run_benchmark(source, processor, maxFrames=0, warmupFrames=10, useRoi=False):
+    fd = processor.fd
+    timings = processor.timings
+    frameBuffer = FrameRingBuffer()
+    events = {}
+    prevFrame = None
+    frameCount = 0
+    processedCount = 0
+    confidenceSum = 0.
+    headMoves = []
+    startTime = time.time()
+    while maxFrames <= 0 or frameCount < maxFrames:
+        ret, img = source.read()
+        frameStamp = time.time()
+        if not ret:
+            break
+        frameCount += 1
+        if frameCount == warmupFrames:
+            # exclude model warm up from the statistics
+            timings.reset()
+            events = {}
+            processedCount = 0
+            confidenceSum = 0.
+            headMoves = []
+            startTime = frameStamp
+
+        with timings.measure('grab'):
+            frame = frameBuffer.publish(img, frameStamp)
+        if prevFrame is None:
+            prevFrame = frame
+            continue
+
+        if not fd.isFaceDetected or fd.is_detection_due(int(round(time.time() * 1000))):
+            fd.detect_face(frame.gray)
+
+        if fd.isFaceDetected:
+            relMove, blinkEvents = processor.process(frame.gray, prevFrame.gray, frame.timestamp)
+            timings.add('frame to move', time.time() - frameStamp)
+            confidenceSum += fd.motionConfidence
+            headMoves.append(processor.lastHeadMove)
+            for blinkEvent in blinkEvents:
+                eventName = BlinkEvent.blink_event_to_text(blinkEvent)
+                events[eventName] = events.get(eventName, 0) + 1
+            processedCount += 1
+        if useRoi:
+            frameBuffer.track_face(fd.current_face_area() if fd.isFaceDetected else None)
+        prevFrame = frame
+
+    elapsed = time.time() - startTime
+    return {'frames': frameCount,
+            'processedFrames': processedCount,
+            'fps': processedCount / elapsed if elapsed > 0 else 0.,
+            'stages': timings.summary(),
+            'localFaceDetections': fd.localDetectionCount,
+            'fullFaceDetections': fd.fullDetectionCount,
+            'landmarkPredictions': fd.landmarksPredictionCount,
+            'motionConfidence': confidenceSum / processedCount if processedCount > 0 else 0.,
+            'convertedPixels': frameBuffer.converted_ratio(),
+            'events': events,
+            'headMoves': headMoves}
+
+
+# runs the multi-face tracker over all frames of the source, the faces are detected synchronously when due.
+# Returns benchmark results dictionary with the events per track id
+def run_multi_face_benchmark(source, tracker, maxFrames=0, warmupFrames=10):
+    timings = tracker.timings
+    frameBuffer = FrameRingBuffer()
+    events = {}
+    trackIds = set()
+    maxTracks = 0
+    prevFrame = None
+    frameCount = 0
+    processedCount = 0
+    startTime = time.time()
+    while maxFrames <= 0 or frameCount < maxFrames:
+        ret, img = source.read()
+        frameStamp = time.time()
+        if not ret:
+            break
+        frameCount += 1
+        if frameCount == warmupFrames:
+            timings.reset()
+            events = {}
+            processedCount = 0
+            startTime = frameStamp
+
+        with timings.measure('grab'):
+            frame = frameBuffer.publish(img, frameStamp)
+        if prevFrame is None:
+            prevFrame = frame
+            continue
+        if tracker.is_detection_due(int(round(time.time() * 1000))):
+            tracker.update_detections(tracker.fd.detect_faces(frame.gray), frame.gray.shape)
+
+        results = tracker.process(frame.gray, prevFrame.gray, frame.timestamp)
+        if results:
+            timings.add('frame to move', time.time() - frameStamp)
+            processedCount += 1
+        maxTracks = max(maxTracks, len(results))
+        for track, relMove, blinkEvents in results:
+            trackIds.add(track.trackId)
+            for blinkEvent in blinkEvents:
+                eventName = '%d %s' % (track.trackId, BlinkEvent.blink_event_to_text(blinkEvent))
+                events[eventName] = events.get(eventName, 0) + 1
+        prevFrame = frame
+
+    elapsed = time.time() - startTime
+    return {'frames': frameCount,
+            'processedFrames': processedCount,
+            'fps': processedCount / elapsed if elapsed > 0 else 0.,
+            'stages': timings.summary(),
+            'tracks': len(trackIds),
+            'maxTracks': maxTracks,
+            'events': events}
+
+
+# runs the SourcePool over the sources of its stations, one frame of every source per round, the faces are detected
+# synchronously when due. Returns benchmark results dictionary with the events per 'source user event'
+def run_multi_source_benchmark(pool, maxFrames=0, warmupFrames=10):
+    timings = pool.timings
+    sources = [open_frame_source(station.sourceSpec) for station in pool.stations]
+    events = {}
+    roundCount = 0
+    startTime = time.time()
+    while maxFrames <= 0 or roundCount < maxFrames:
+        frameStamp = time.time()
+        ended = True
+        for station, source in zip(pool.stations, sources):
+            ret, img = source.read()
+            if ret:
+                ended = False
+                with timings.measure('grab'):
+                    station.frameBuffer.publish(img, frameStamp)
+        if ended:
+            break
+        roundCount += 1
+        if roundCount == warmupFrames:
+            timings.reset()
+            events = {}
+            for station in pool.stations:
+                station.processedCount = 0
+            startTime = frameStamp
+
+        pool.detect_faces()
+        with timings.measure('round'):
+            processed = pool.process_frames(pool.ready_frames())
+        for station, frame, results in processed:
+            for track, relMove, blinkEvents in results:
+                for blinkEvent in blinkEvents:
+                    eventName = '%d %d %s' % (station.sourceId, track.trackId,
+                                              BlinkEvent.blink_event_to_text(blinkEvent))
+                    events[eventName] = events.get(eventName, 0) + 1
+    for source in sources:
+        source.release()
+
+    elapsed = time.time() - startTime
+    processedCount = sum(station.processedCount for station in pool.stations)
+    return {'rounds': roundCount,
+            'processedFrames': processedCount,
+            'fps': processedCount / elapsed if elapsed > 0 else 0.,
+            'stages': timings.summary(),
+            'classifiedFaces': timings.counters.get('classified faces', 0),
+            'sources': [{'source': station.sourceSpec, 'processedFrames': station.processedCount,
+                         'tracks': len(station.tracker.tracks)} for station in pool.stations],
+            'events': events}
+
+
+# replays the recorded head moves through the pointer filters with every acceleration level.
+# Returns the list of {'level', 'pathLength', 'maxMove', 'replayUs'}, path and moves in pixels
+def compare_acceleration_levels(analyzer, headMoves):
+    results = []
+    for level in sorted(accelerationCurves):
+        analyzer.set_acceleration_level(level)
+        startTime = time.time()
+        moves = analyzer.replay_pointer_moves(headMoves)
+        elapsed = time.time() - startTime
+        lengths = np.hypot(moves[:, 0], moves[:, 1])
+        results.append({'level': level,
+                        'pathLength': float(lengths.sum()),
+                        'maxMove': float(lengths.max()) if len(lengths) else 0.,
+                        'replayUs': elapsed * 1e6})
+    return results
+
+
+# per eye preprocessing, as it was done before batching. Reference for the preprocessing benchmark
+def legacy_preprocess_eye(roi):
+    img = cv2.equalizeHist(cv2.resize(roi.copy(), (32, 32)))
+    img = cv2.subtract(img.astype('float'), np.mean(img))
+    img *= 1.0 / 255
+    return img.astype(np.float32)
+
+
+# compares per eye and batched preprocessing of eye images, returns mean times in microseconds and max difference
+def benchmark_preprocessing(iterations=5000, eyeHalfSize=20):
+    from blinkDetector import preprocess_eyes
+
+    gray = (np.random.rand(480, 640) * 255).astype(np.uint8)
+    rois = [gray[200:200 + 2 * eyeHalfSize, 250:250 + 2 * eyeHalfSize],
+            gray[200:200 + 2 * eyeHalfSize, 350:350 + 2 * eyeHalfSize]]
+    legacyOut = np.empty((len(rois), 1, 32, 32), np.float32)
+    batchOut = np.empty((len(rois), 1, 32, 32), np.float32)
+    work = np.empty((len(rois), 32, 32), np.uint8)
+
+    startTime = time.time()
+    for _ in range(iterations):
+        for i, roi in enumerate(rois):
+            legacyOut[i] = legacy_preprocess_eye(roi)
+    legacyTime = time.time() - startTime
+
+    startTime = time.time()
+    for _ in range(iterations):
+        preprocess_eyes(rois, batchOut, work)
+    batchTime = time.time() - startTime
+
+    return {'legacyUs': legacyTime * 1e6 / iterations,
+            'batchedUs': batchTime * 1e6 / iterations,
+            'maxDiff': float(np.abs(legacyOut - batchOut).max())}
+
+
+# runs the same random eye images through the inference backends, returns for every backend
+# load time, mean forward time (ms) and max difference of probabilities against the first backend
+def compare_backends(names, definitionFile, weightsFile, iterations=200, batchSize=2):
+    from blinkDetector import preprocess_eyes
+    from inferenceBackends import create_backend
+
+    rois = [(np.random.rand(40, 40) * 255).astype(np.uint8) for _ in range(batchSize)]
+    data = np.empty((batchSize, 1, 32, 32), np.float32)
+    preprocess_eyes(rois, data, np.empty((batchSize, 32, 32), np.uint8))
+    results = []
+    reference = None
+    for name in names:
+        startTime = time.time()
+        backend = create_backend(name, definitionFile, weightsFile)
+        loadTime = time.time() - startTime
+        output = None
+        startTime = time.time()
+        for _ in range(iterations):
+            buf = backend.input_buffer(batchSize)
+            buf[...] = data
+            output = backend.forward(buf).copy()
+        forwardTime = (time.time() - startTime) / iterations
+        if reference is None:
+            reference = output
+        results.append({'backend': name,
+                        'loadMs': loadTime * 1000.,
+                        'forwardMs': forwardTime * 1000.,
+                        'maxDiff': float(np.abs(output - reference).max())})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='VirtualMousePad pipeline benchmark')
+    parser.add_argument('source', nargs='?', help='camera index, video file, image directory or .npz archive')
+    parser.add_argument('--frames', type=int, default=0, help='max number of frames to process, 0 - all')
+    parser.add_argument('--warmup', type=int, default=10, help='number of frames excluded from statistics')
+    parser.add_argument('--realtime', action='store_true', help='replay at the recorded frame rate')
+    parser.add_argument('--json', help='write results to this json file')
+    parser.add_argument('--metrics', help='save the stage timings with histograms into this .json or .csv file')
+    parser.add_argument('--record', help='record the source into this .npz file instead of benchmarking')
+    parser.add_argument('--trace', help='record the analyzer inputs and outputs into this trace file, '
+                                        'see replayTrace.py')
+    parser.add_argument('--preprocessing', action='store_true',
+                        help='run eye images preprocessing micro benchmark instead')
+    parser.add_argument('--compare-backends', metavar='NAMES',
+                        help='compare comma separated inference backends instead, first one is the reference')
+    parser.add_argument('--async-blink', action='store_true', help='classify eye states in background thread')
+    parser.add_argument('--no-eye-cache', action='store_true',
+                        help='classify every eye image, even if it did not change since the last classification')
+    parser.add_argument('--pointer-levels', action='store_true',
+                        help='replay the head moves through the pointer filters with every acceleration level')
+    parser.add_argument('--blink-process', action='store_true', help='classify eye states in separate process')
+    parser.add_argument('--full-frame-flow', action='store_true',
+                        help='calculate optical flow on whole frames instead of the window around the face')
+    parser.add_argument('--roi', action='store_true', help='convert only the region around the face to gray')
+    parser.add_argument('--multi-face', type=int, default=0, metavar='N',
+                        help='track up to N faces with the multi-face tracker')
+    parser.add_argument('--multi-source', action='store_true',
+                        help='source is a comma separated list, all the sources are processed by one SourcePool')
+    parser.add_argument('--workers', type=int, default=4, help='SourcePool optical flow worker threads')
+    parser.add_argument('--no-batch', action='store_true',
+                        help='SourcePool classifies the eyes of every source apart instead of one batch')
+    parser.add_argument('--motion-estimator', default='median',
+                        help='head motion estimator: median, ransac or nose (nose point only)')
+    parser.add_argument('--backend', default='opencv', help='eye state classifier backend: opencv, numpy or caffe')
+    parser.add_argument('--landmarks', default=landmarks_fn)
+    parser.add_argument('--nn-definition', default=nn_definition_file)
+    parser.add_argument('--nn-weights', default=nn_weights_file)
+    args = parser.parse_args()
+
+    if args.preprocessing:
+        result = benchmark_preprocessing()
+        print "Eye preprocessing, 2 eyes: per eye %.1f us, batched %.1f us, max difference %g" % (
+            result['legacyUs'], result['batchedUs'], result['maxDiff'])
+        return
+    if args.compare_backends:
+        for r in compare_backends(args.compare_backends.split(','), args.nn_definition, args.nn_weights):
+            print "%-8s load %7.1f ms, forward %6.2f ms, max probability difference %g" % (
+                r['backend'], r['loadMs'], r['forwardMs'], r['maxDiff'])
+        return
+    if args.source is None:
+        parser.error('source is required')
+
+    if args.multi_source:
+        from faceDetector import FaceAndMovementDetector
+        from blinkDetector import BlinkDetector
+        from sourcePool import SourcePool
+        timings = StageTimings()
+        fd = FaceAndMovementDetector(args.landmarks)
+        fd.timings = timings
+        fd.flowWindowEnabled = not args.full_frame_flow
+        fd.motionEstimator = args.motion_estimator
+        pool = SourcePool(fd, BlinkDetector(args.nn_definition, args.nn_weights, args.backend), timings,
+                          workers=args.workers)
+        pool.maxFacesPerSource = max(args.multi_face, 1)
+        pool.batchEnabled = not args.no_batch
+        for sourceId, spec in enumerate(args.source.split(',')):
+            pool.add_source(sourceId, spec)
+        results = run_multi_source_benchmark(pool, args.frames, args.warmup)
+        pool.stop()
+        print "Sources: %d, rounds: %d, processed frames: %d, processing FPS of all sources: %.1f" % (
+            len(pool.stations), results['rounds'], results['processedFrames'], results['fps'])
+        print timings.report()
+        print "Faces classified: %d, %s" % (results['classifiedFaces'],
+                                            'one batch per round' if pool.batchEnabled else 'one batch per source')
+        print "Events:", ', '.join('%s: %d' % (k, v) for k, v in sorted(results['events'].items())) or 'none'
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        return
+
+    source = open_frame_source(args.source)
+    if args.record:
+        count = record_npz(source, args.record, args.frames if args.frames > 0 else 300)
+        source.release()
+        print "Recorded %d frames to %s" % (count, args.record)
+        return
+
+    if args.realtime and not source.isLive:
+        source = PacedSource(source)
+
+    # heavy imports are done here, so that recording works without dlib and caffe
+    from faceDetector import FaceAndMovementDetector
+    from blinkDetector import BlinkDetector
+    from motionAndBlinkAnalyzer import MotionAndBlinkAnalyzer
+    from pipeline import FrameProcessor
+    from analyzerTrace import TraceWriter
+
+    processor = FrameProcessor(FaceAndMovementDetector(args.landmarks),
+                               BlinkDetector(args.nn_definition, args.nn_weights, args.backend),
+                               MotionAndBlinkAnalyzer(), StageTimings())
+    processor.fd.flowWindowEnabled = not args.full_frame_flow
+    processor.fd.motionEstimator = args.motion_estimator
+    processor.fd.timings = processor.timings
+    processor.bd.cacheEnabled = not args.no_eye_cache
+    if args.multi_face > 0:
+        from multiFaceTracker import MultiFaceTracker
+        tracker = MultiFaceTracker(processor.fd, processor.bd, processor.timings)
+        tracker.maxFaces = args.multi_face
+        results = run_multi_face_benchmark(source, tracker, args.frames, args.warmup)
+        source.release()
+        print "Frames read: %d, processed: %d, processing FPS: %.1f" % (
+            results['frames'], results['processedFrames'], results['fps'])
+        print tracker.timings.report()
+        print "Tracks: %d, max tracked at once: %d" % (results['tracks'], results['maxTracks'])
+        print "Events:", ', '.join('%s: %d' % (k, v) for k, v in sorted(results['events'].items())) or 'none'
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        return
+    if args.trace:
+        processor.trace = TraceWriter(args.trace)
+    if args.async_blink or args.blink_process:
+        processor.bd.start_async(timings=processor.timings, useProcess=args.blink_process)
+    results = run_benchmark(source, processor, args.frames, args.warmup, args.roi)
+    source.release()
+    if processor.trace is not None:
+        processor.trace.close()
+    if args.async_blink or args.blink_process:
+        processor.bd.stop_async()
+        results['droppedBlinkRequests'] = processor.bd.dropped_count()
+        results['failedBlinkRequests'] = processor.bd.failedCount
+
+    print "Frames read: %d, processed: %d, processing FPS: %.1f" % (
+        results['frames'], results['processedFrames'], results['fps'])
+    print processor.timings.report()
+    print "Face detections: %d in the local window, %d full frame scans" % (
+        results['localFaceDetections'], results['fullFaceDetections'])
+    print "Landmark predictions: %d" % results['landmarkPredictions']
+    if not args.blink_process:
+        print "Eye images classified: %d, cached results reused: %d" % (processor.bd.classifiedCount,
+                                                                      processor.bd.cachedCount)
+    print "Gray pixels converted: %.0f%%" % (results['convertedPixels'] * 100)
+    print "Mean head motion confidence: %.2f" % results['motionConfidence']
+    if 'droppedBlinkRequests' in results:
+        print "Blink classification requests dropped: %d, failed: %d" % (results['droppedBlinkRequests'],
+                                                                          results['failedBlinkRequests'])
+    print "Events:", ', '.join('%s: %d' % (k, v) for k, v in sorted(results['events'].items())) or 'none'
+    if args.pointer_levels:
+        results['pointerLevels'] = compare_acceleration_levels(processor.ma, results['headMoves'])
+        for r in results['pointerLevels']:
+            print "Acceleration level %d: path %8.1f px, max move %5.1f px, replay %7.1f us" % (
+                r['level'], r['pathLength'], r['maxMove'], r['replayUs'])
+    if args.metrics:
+        processor.timings.save(args.metrics)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
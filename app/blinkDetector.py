@@ -1,48 +1,269 @@
-import numpy as np
-import cv2
-import time
-import math
-import caffe
-
-# we want to use cpu
-caffe.set_mode_cpu()
-
-
-# performs eye state detection and maps the state to blink events
-class BlinkDetector:
-    def __init__(self, nn_definition_file, nn_weights_file):
-        self.__net = caffe.Net(nn_definition_file, nn_weights_file, caffe.TEST)
-        self.__transformer = caffe.io.Transformer({'data': self.__net.blobs['data'].data.shape})
-
-        # prepare the net
-        self.__net.forward()
-
-    # outputs 'openness' probabilities for eye images
-    def __predictEyeStates(self, leftEyeImg, rightEyeImg):
-        # prepare images
-        leftEyeImg = cv2.equalizeHist(cv2.resize(leftEyeImg, (32, 32)))
-        rightEyeImg = cv2.equalizeHist(cv2.resize(rightEyeImg, (32, 32)))
-
-        # transform scale and unit variance
-        img1 = cv2.subtract(leftEyeImg.astype('float'), np.mean(leftEyeImg))
-        img2 = cv2.subtract(rightEyeImg.astype('float'), np.mean(rightEyeImg))
-        img1 *= 1.0 / 255
-        img2 *= 1.0 / 255
-
-        self.__net.blobs['data'].data[0] = self.__transformer.preprocess('data', img1)
-        self.__net.blobs['data'].data[1] = self.__transformer.preprocess('data', img2)
-
-        # millisStart = int(round(time.time() * 1000))
-        self.__net.forward()
-        # obtain the output probabilities
-        output_probL = self.__net.blobs['softmax'].data[0][1]
-        output_probR = self.__net.blobs['softmax'].data[1][1]
-
-        # print "Classification delay ", int(round(time.time() * 1000)) - millisStart, ' ms'
-
-        return output_probL, output_probR
-
-    def predict_states(self, grayImg, leftEyeArea, rightEyeArea):
-        roiL = grayImg[leftEyeArea[1]:leftEyeArea[3], leftEyeArea[0]:leftEyeArea[2]]
-        roiR = grayImg[rightEyeArea[1]:rightEyeArea[3], rightEyeArea[0]:rightEyeArea[2]]
-        return self.__predictEyeStates(roiL.copy(), roiR.copy())
+import numpy as np
+import cv2
+import time
+import math
+import threading
+import multiprocessing
+import Queue
+from collections import deque
+from queues import DropOldestQueue
+from inferenceBackends import create_backend
+
+
+# side of the square eye image the classifier takes
+eyeImageSize = 32
+
+
+# prepares eye images for the classifier: resizes to 32x32, equalizes histogram, subtracts the mean and scales by 1/255.
+# Results are written as float32 into 'out' array of shape (N, 1, 32, 32), 'work' is uint8 (N, 32, 32) scratch buffer
+def preprocess_eyes(rois, out, work):
+    resize_eyes(rois, work)
+    normalize_eyes(work[:len(rois)], out)
+
+
+# first preprocessing step: resizes eye images to 32x32 and equalizes histogram into uint8 'work' (N, 32, 32)
+def resize_eyes(rois, work):
+    for i in range(len(rois)):
+        cv2.resize(rois[i], (eyeImageSize, eyeImageSize), work[i])
+        cv2.equalizeHist(work[i], work[i])
+
+
+# second preprocessing step: subtracts the mean of resized eye images 'batch' and scales by 1/255 into 'out'
+def normalize_eyes(batch, out):
+    n = len(batch)
+    means = batch.reshape(n, -1).mean(axis=1)
+    np.subtract(batch, means[:, np.newaxis, np.newaxis], out=out[:n, 0])
+    out[:n] *= 1.0 / 255
+
+
+# True if all the (x1, y1, x2, y2) eye areas are not empty and lie inside the frame of frameShape.
+# Eye areas of a face at the frame edge may reach out of the frame, their images can not be classified
+def eye_areas_in_frame(eyeAreas, frameShape):
+    height, width = frameShape[:2]
+    return all(0 <= a[0] < a[2] <= width and 0 <= a[1] < a[3] <= height for a in eyeAreas)
+
+
+# performs eye state detection and maps the state to blink events
+class BlinkDetector:
+    # backend is one of the inference backends names: 'caffe', 'opencv' or 'numpy'.
+    # Without loadModel the detector classifies only through the process of start_async(useProcess=True),
+    # which loads its own copy of the model
+    def __init__(self, nn_definition_file, nn_weights_file, backend='caffe', loadModel=True):
+        self.__backend = create_backend(backend, nn_definition_file, nn_weights_file) if loadModel else None
+        # the classifier process creates its own copy of the model
+        self.__modelArgs = (nn_definition_file, nn_weights_file, backend)
+        self.__work = np.empty((2, eyeImageSize, eyeImageSize), np.uint8)
+        # asynchronous classification
+        self.isAsync = False
+        self.__requests = None
+        self.__results = deque()
+        self.__workerThread = None
+        self.__timings = None
+        self.__workerProcess = None
+        self.__processResults = None
+        self.__processDroppedCount = 0
+        # requests the worker failed to classify
+        self.failedCount = 0
+        self.__isWorkerDeathReported = False
+
+        # eyes which resized image differs from the last classified one less than changeThreshold
+        # (mean absolute difference of gray levels) reuse the cached probability, until it is older than cacheTimeout
+        self.cacheEnabled = True
+        self.changeThreshold = 4.
+        self.cacheTimeout = 500
+        self.__cachedEyes = np.zeros((2, eyeImageSize, eyeImageSize), np.uint8)
+        self.__cachedProbs = np.zeros(2, np.float32)
+        self.__cacheStamps = [None, None]
+        self.classifiedCount = 0
+        self.cachedCount = 0
+
+        # prepare the net
+        if self.__backend is not None:
+            self.__backend.forward(self.__backend.input_buffer(2))
+
+    # outputs 'openness' probabilities for a batch of eye images
+    def predict_batch(self, rois):
+        data = self.__backend.input_buffer(len(rois))
+        if len(self.__work) < len(rois):
+            self.__work = np.empty((len(rois), eyeImageSize, eyeImageSize), np.uint8)
+        preprocess_eyes(rois, data, self.__work)
+        output = self.__backend.forward(data)
+        # obtain the output probabilities
+        return output[:, 1].copy()
+
+    @staticmethod
+    def __eye_rois(grayImg, leftEyeArea, rightEyeArea):
+        roiL = grayImg[leftEyeArea[1]:leftEyeArea[3], leftEyeArea[0]:leftEyeArea[2]]
+        roiR = grayImg[rightEyeArea[1]:rightEyeArea[3], rightEyeArea[0]:rightEyeArea[2]]
+        return roiL, roiR
+
+    # outputs 'openness' probabilities of the left and right eye images of the frame taken at nowMs.
+    # Only the eyes that changed since their last classification go through the classifier
+    def predict_cached(self, rois, nowMs):
+        work = self.__work[:2]
+        resize_eyes(rois, work)
+        changed = [i for i in range(2) if not self.cacheEnabled or self.__cacheStamps[i] is None
+                   or nowMs - self.__cacheStamps[i] >= self.cacheTimeout
+                   or cv2.absdiff(work[i], self.__cachedEyes[i]).mean() > self.changeThreshold]
+        if changed:
+            data = self.__backend.input_buffer(len(changed))
+            normalize_eyes(work[changed], data)
+            output = self.__backend.forward(data)
+            for j, i in enumerate(changed):
+                self.__cachedProbs[i] = output[j, 1]
+                self.__cachedEyes[i] = work[i]
+                self.__cacheStamps[i] = nowMs
+        self.classifiedCount += len(changed)
+        self.cachedCount += 2 - len(changed)
+        return self.__cachedProbs.copy()
+
+    # outputs (left, right) 'openness' probabilities for the eyes of several faces, eyeAreas is the list of
+    # (left eye area, right eye area). All the eyes go through the classifier in one batch, the cache is not used
+    def predict_faces(self, grayImg, eyeAreas):
+        return self.predict_frames([(grayImg, areas) for areas in eyeAreas])
+
+    # predict_faces() for the faces of several frames, e.g. of several cameras: faces is the list of
+    # (gray image, (left eye area, right eye area)). The eyes of all the frames are classified in one batch
+    def predict_frames(self, faces):
+        rois = []
+        for grayImg, (leftEyeArea, rightEyeArea) in faces:
+            rois.extend(self.__eye_rois(grayImg, leftEyeArea, rightEyeArea))
+        if not rois:
+            return []
+        probs = self.predict_batch(rois)
+        self.classifiedCount += len(rois)
+        return [(probs[2 * i], probs[2 * i + 1]) for i in range(len(faces))]
+
+    # nowMs is the frame timestamp, current time if not given
+    def predict_states(self, grayImg, leftEyeArea, rightEyeArea, nowMs=None):
+        if nowMs is None:
+            nowMs = int(round(time.time() * 1000))
+        probs = self.predict_cached(self.__eye_rois(grayImg, leftEyeArea, rightEyeArea), nowMs)
+        return probs[0], probs[1]
+
+    # Asynchronous classification part
+    # starts the background worker. Requests queue is bounded, the oldest requests are dropped when it is full.
+    # If timings (metrics.StageTimings) are given, the worker adds the inference time to them.
+    # With useProcess the classifier runs in a separate process, so the inference does not hold the GIL
+    def start_async(self, maxQueueSize=2, timings=None, useProcess=False):
+        self.isAsync = True
+        self.__timings = timings
+        if useProcess:
+            self.__requests = multiprocessing.Queue()
+            self.__processResults = multiprocessing.Queue()
+            self.__workerProcess = multiprocessing.Process(
+                target=_classify_process,
+                args=self.__modelArgs + (maxQueueSize, self.__requests, self.__processResults))
+            self.__workerProcess.daemon = True
+            self.__workerProcess.start()
+            return
+        self.__requests = DropOldestQueue(maxQueueSize)
+        self.__workerThread = threading.Thread(target=self.__classifyAsync)
+        self.__workerThread.daemon = True
+        self.__workerThread.start()
+
+    def stop_async(self):
+        self.isAsync = False
+        if self.__workerThread:
+            self.__workerThread.join(1)
+        if self.__workerProcess:
+            self.__requests.put(None)
+            self.__workerProcess.join(1)
+            if self.__workerProcess.is_alive():
+                self.__workerProcess.terminate()
+
+    # queues the eye areas of the frame for classification, returns immediately. Stamp identifies the frame.
+    # The eye areas should be checked with eye_areas_in_frame() first. Nothing is queued once the worker is dead
+    def submit(self, grayImg, leftEyeArea, rightEyeArea, stamp):
+        if not self.is_worker_alive():
+            return
+        # eye images are copied, the frame buffer may reuse the frame memory before the worker gets to it
+        roiL, roiR = self.__eye_rois(grayImg, leftEyeArea, rightEyeArea)
+        self.__requests.put((stamp, roiL.copy(), roiR.copy()))
+
+    # False if the worker thread or process of the asynchronous classification has exited
+    def is_worker_alive(self):
+        worker = self.__workerProcess or self.__workerThread
+        return worker is not None and worker.is_alive()
+
+    # returns the list of (stamp, left eye probability, right eye probability) classified since the last call.
+    # A dead worker is reported once, blinks are not detected after it
+    def results(self):
+        results = []
+        if self.isAsync and not self.__isWorkerDeathReported and not self.is_worker_alive():
+            self.__isWorkerDeathReported = True
+            exitCode = self.__workerProcess.exitcode if self.__workerProcess else None
+            print "Blink classifier worker has exited (exit code %s), blinks are not detected" % exitCode
+        if self.__workerProcess:
+            while True:
+                try:
+                    stamp, probL, probR, inferenceTime, self.__processDroppedCount, self.failedCount = \
+                        self.__processResults.get_nowait()
+                except Queue.Empty:
+                    break
+                if probL is None:
+                    continue
+                if self.__timings is not None:
+                    self.__timings.add('blink inference', inferenceTime)
+                results.append((stamp, probL, probR))
+        while self.__results:
+            results.append(self.__results.popleft())
+        return results
+
+    # number of requests dropped because the worker was busy
+    def dropped_count(self):
+        if self.__workerProcess:
+            return self.__processDroppedCount
+        return self.__requests.droppedCount if self.__requests is not None else 0
+
+    def __classifyAsync(self):
+        while self.isAsync:
+            request = self.__requests.get(0.1)
+            if request is None:
+                continue
+            startTime = time.time()
+            try:
+                probs = self.predict_cached(request[1:], int(round(request[0] * 1000)))
+            except Exception as e:
+                # a failed request must not stop the worker, the next frames are classified as usual
+                self.failedCount += 1
+                if self.failedCount == 1:
+                    print "Blink classification failed: %s" % e
+                continue
+            if self.__timings is not None:
+                self.__timings.add('blink inference', time.time() - startTime)
+            self.__results.append((request[0], probs[0], probs[1]))
+
+
+# classifier process main function. Takes (stamp, left eye image, right eye image) requests, None stops it.
+# Like in DropOldestQueue, only maxQueueSize newest requests are kept when the classifier falls behind.
+# Puts (stamp, left probability, right probability, inference seconds, dropped requests count, failed requests count)
+# results, the probabilities are None for a failed request
+def _classify_process(nn_definition_file, nn_weights_file, backend, maxQueueSize, requests, results):
+    detector = BlinkDetector(nn_definition_file, nn_weights_file, backend)
+    pending = deque([], maxlen=maxQueueSize)
+    droppedCount = 0
+    while True:
+        if not pending:
+            pending.append(requests.get())
+        while True:
+            try:
+                request = requests.get_nowait()
+            except Queue.Empty:
+                break
+            if len(pending) == pending.maxlen:
+                droppedCount += 1
+            pending.append(request)
+        if None in pending:
+            break
+        request = pending.popleft()
+        startTime = time.time()
+        try:
+            probs = detector.predict_cached(request[1:], int(round(request[0] * 1000)))
+        except Exception as e:
+            # as in the worker thread, a failed request does not stop the process
+            detector.failedCount += 1
+            if detector.failedCount == 1:
+                print "Blink classification failed: %s" % e
+            probs = (None, None)
+        results.put((request[0], probs[0], probs[1], time.time() - startTime, droppedCount, detector.failedCount))
@@ -0,0 +1,178 @@
+__author__ = "Roman Semenyk"
+__copyright__ = "Copyright 2017, VirtualMousePad"
+__license__ = "GPLv3"
+
+# Accuracy and throughput benchmark of the eye state classifier.
+# Runs every inference backend over labelled eye crops (CEW format directory, see eyeDataset.load_eye_crops,
+# or a synthetic fixture) and reports the accuracy, the ROC of the closed eye detection and the best threshold,
+# then the per-batch latency and throughput for every batch size. A closed eye decision on an open eye may end up
+# as a false click, so the false closed rate is reported at the default and at the best threshold.
+# usage:
+#   python ./app/classifierBenchmark.py --dataset cew_dir [--backends opencv,numpy] [--json result.json]
+#   python ./app/classifierBenchmark.py --synthetic 2000 --batch-sizes 1,2,8,32
+
+import argparse
+import json
+import time
+import cv2
+import numpy as np
+from eyeDataset import load_eye_crops, preprocess_crops, synthetic_eye_crops
+from blinkDetector import preprocess_eyes, eyeImageSize
+from inferenceBackends import create_backend
+from metrics import StageTimings
+
+nn_definition_file = 'classifier/model_deploy.prototxt'
+nn_weights_file = 'classifier/model_weights_97.22.caffemodel'
+
+
+# ROC of the closed eye detection: an eye is taken as closed if its open probability is below the threshold.
+# Returns (thresholds, false closed rates - open eyes taken as closed, true closed rates), thresholds ascending
+def closed_eye_roc(openProbs, labels):
+    order = np.argsort(openProbs, kind='mergesort')
+    probs = openProbs[order]
+    isClosed = labels[order] == 0
+    # eyes below the i-th threshold are the first i eyes
+    closedBelow = np.concatenate(([0], np.cumsum(isClosed)))
+    openBelow = np.concatenate(([0], np.cumsum(~isClosed)))
+    # threshold between the neighbouring distinct probabilities, so that each one splits the sorted list
+    bounds = np.concatenate(([0.], (probs[1:] + probs[:-1]) / 2, [1.]))
+    distinct = np.concatenate(([True], probs[1:] != probs[:-1], [True]))
+    return (bounds[distinct],
+            openBelow[distinct] / float(max(np.sum(~isClosed), 1)),
+            closedBelow[distinct] / float(max(np.sum(isClosed), 1)))
+
+
+# area under the ROC curve
+def roc_auc(falseRates, trueRates):
+    return float(np.sum(np.diff(falseRates) * (trueRates[1:] + trueRates[:-1]) / 2))
+
+
+# returns {'threshold', 'accuracy', 'falseClosedRate', 'missedClosedRate'} of the decisions at the threshold
+def threshold_report(openProbs, labels, threshold):
+    isOpen = labels == 1
+    takenOpen = openProbs >= threshold
+    return {'threshold': float(threshold),
+            'accuracy': float(np.mean(takenOpen == isOpen)),
+            'falseClosedRate': float(np.mean(~takenOpen[isOpen])) if np.any(isOpen) else 0.,
+            'missedClosedRate': float(np.mean(takenOpen[~isOpen])) if np.any(~isOpen) else 0.}
+
+
+# accuracy report of the open probabilities against the labels (unlabelled images are ignored):
+# the decisions at the default threshold, at the threshold of the best accuracy, ROC AUC and the ROC points
+def accuracy_report(openProbs, labels, defaultThreshold=0.5):
+    isLabelled = labels >= 0
+    openProbs = openProbs[isLabelled]
+    labels = labels[isLabelled]
+    thresholds, falseRates, trueRates = closed_eye_roc(openProbs, labels)
+    closedCount = np.sum(labels == 0)
+    openCount = len(labels) - closedCount
+    accuracies = (trueRates * closedCount + (1. - falseRates) * openCount) / max(len(labels), 1)
+    best = thresholds[int(np.argmax(accuracies))]
+    return {'images': len(labels),
+            'default': threshold_report(openProbs, labels, defaultThreshold),
+            'best': threshold_report(openProbs, labels, best),
+            'auc': roc_auc(falseRates, trueRates),
+            'roc': {'thresholds': thresholds.tolist(),
+                    'falseClosedRates': falseRates.tolist(),
+                    'trueClosedRates': trueRates.tolist()}}
+
+
+# runs the backend over the data in batches, returns the open probabilities
+def classify(backend, data, batchSize=32):
+    probs = np.empty(len(data), np.float32)
+    for i in range(0, len(data), batchSize):
+        batch = data[i:i + batchSize]
+        buf = backend.input_buffer(len(batch))
+        buf[...] = batch
+        probs[i:i + len(batch)] = backend.forward(buf)[:, 1]
+    return probs
+
+
+# measures preprocessing and inference of batches of eye crops, at least minImages images.
+# Durations per batch go into the timings as 'preprocess N' and 'forward N' stages.
+# Returns {'batchSize', 'preprocessMs', 'forwardMs', 'p99Ms', 'imagesPerSecond'}, times are p50 per batch
+def measure_throughput(backend, crops, batchSize, timings, minImages=2000):
+    if len(crops) < batchSize:
+        crops = crops * (batchSize // len(crops) + 1)
+    work = np.empty((batchSize, eyeImageSize, eyeImageSize), np.uint8)
+    # warm up
+    backend.forward(backend.input_buffer(batchSize))
+    preprocessStage = 'preprocess %d' % batchSize
+    forwardStage = 'forward %d' % batchSize
+    images = 0
+    startTime = time.time()
+    while images < minImages:
+        for i in range(0, len(crops) - batchSize + 1, batchSize):
+            data = backend.input_buffer(batchSize)
+            with timings.measure(preprocessStage):
+                preprocess_eyes(crops[i:i + batchSize], data, work)
+            with timings.measure(forwardStage):
+                backend.forward(data)
+            images += batchSize
+    elapsed = time.time() - startTime
+    summary = timings.summary()
+    return {'batchSize': batchSize,
+            'preprocessMs': summary[preprocessStage]['p50'],
+            'forwardMs': summary[forwardStage]['p50'],
+            'p99Ms': summary[preprocessStage]['p99'] + summary[forwardStage]['p99'],
+            'imagesPerSecond': images / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Eye state classifier accuracy and throughput benchmark')
+    parser.add_argument('--dataset', help='directory with eye images, "open"/"closed" in the path gives the label')
+    parser.add_argument('--synthetic', type=int, default=0, help='number of synthetic eye images to use instead')
+    parser.add_argument('--max-images', type=int, default=0, help='max number of dataset images, 0 - all')
+    parser.add_argument('--backends', default='opencv,numpy', help='comma separated inference backends')
+    parser.add_argument('--batch-sizes', default='1,2,8,32', help='comma separated batch sizes')
+    parser.add_argument('--threshold', type=float, default=0.5, help='default open probability threshold')
+    parser.add_argument('--json', help='write results, with the ROC points, to this json file')
+    parser.add_argument('--nn-definition', default=nn_definition_file)
+    parser.add_argument('--nn-weights', default=nn_weights_file)
+    args = parser.parse_args()
+
+    if args.dataset:
+        crops, labels = load_eye_crops(args.dataset, args.max_images)
+    elif args.synthetic > 0:
+        crops, labels = synthetic_eye_crops(args.synthetic)
+    else:
+        parser.error('--dataset or --synthetic is required')
+    if not crops:
+        parser.error('no eye images found in %s' % args.dataset)
+    data = preprocess_crops(crops)
+    batchSizes = [int(b) for b in args.batch_sizes.split(',')]
+    print "%d images, %d open, %d closed, %d unlabelled" % (
+        len(labels), np.sum(labels == 1), np.sum(labels == 0), np.sum(labels < 0))
+
+    results = []
+    for name in args.backends.split(','):
+        try:
+            backend = create_backend(name, args.nn_definition, args.nn_weights)
+        # missing weights or libraries skip the backend: cv2.error from OpenCV DNN, OSError from the weights cache
+        except (ImportError, EnvironmentError, ValueError, cv2.error) as e:
+            print "%s backend is not available: %s" % (name, e)
+            continue
+        result = {'backend': name}
+        print "%s:" % name
+        if np.any(labels >= 0):
+            report = accuracy_report(classify(backend, data), labels, args.threshold)
+            result.update(report)
+            for key in ('default', 'best'):
+                r = report[key]
+                print "    threshold %.3f: accuracy %.2f%%, open eyes taken as closed %.2f%%, closed missed %.2f%%" % (
+                    r['threshold'], r['accuracy'] * 100, r['falseClosedRate'] * 100, r['missedClosedRate'] * 100)
+            print "    ROC AUC %.4f" % report['auc']
+        timings = StageTimings()
+        result['throughput'] = [measure_throughput(backend, crops, b, timings) for b in batchSizes]
+        for r in result['throughput']:
+            print "    batch %3d: preprocess %6.3f ms, forward %7.3f ms, p99 %7.3f ms, %8.0f images/s" % (
+                r['batchSize'], r['preprocessMs'], r['forwardMs'], r['p99Ms'], r['imagesPerSecond'])
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+import json
+import socket
+import SocketServer
+import threading
+from queues import DropOldestQueue
+
+
+# Local control API: newline separated JSON over TCP on the loopback interface (works on all platforms,
+# unlike UNIX sockets). Each request line is a JSON object with 'cmd', each gets one JSON response line.
+# {"cmd": "subscribe"} makes the connection receive the published messages (events, metrics) as well,
+# {"cmd": "subscribe", "source": 1} only the messages of that source and the messages without a source.
+# Requests are handled by the handler function, called from the connection threads
+
+
+# typed request fields for the handlers: KeyError if the field is missing, ValueError if its JSON type is wrong.
+# JSON booleans are not taken as numbers, nor strings like "false" as booleans
+def bool_field(request, key):
+    value = request[key]
+    if not isinstance(value, bool):
+        raise ValueError('%s must be true or false' % key)
+    return value
+
+
+def number_field(request, key):
+    value = request[key]
+    if isinstance(value, bool) or not isinstance(value, (int, long, float)):
+        raise ValueError('%s must be a number' % key)
+    return float(value)
+
+
+def int_field(request, key):
+    value = request[key]
+    if isinstance(value, bool) or not isinstance(value, (int, long)):
+        raise ValueError('%s must be an integer' % key)
+    return value
+
+
+# one connection: reads request lines until the client disconnects. Responses are written by the connection
+# thread, so a client that does not read blocks its own thread only
+class _ControlRequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        control = self.server.control
+        connection = _Connection(self.wfile)
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    break
+                line = line.strip()
+                if line:
+                    connection.write(control.handle_line(line, connection))
+        finally:
+            control.unsubscribe(connection)
+
+    # the client may be gone with unsent data in the buffer
+    def finish(self):
+        try:
+            SocketServer.StreamRequestHandler.finish(self)
+        except socket.error:
+            pass
+
+
+class _ControlTCPServer(SocketServer.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+# output side of one connection. Published messages go to a bounded queue, written by the connection's own
+# writer thread, so publishing never blocks the caller. When the client reads slower than the messages come,
+# the oldest queued messages are dropped
+class _Connection:
+    def __init__(self, out, maxQueued=256):
+        self.out = out
+        # source id filter of the subscription, None - all the sources
+        self.sourceFilter = None
+        self.isClosed = False
+        self.__messages = DropOldestQueue(maxQueued)
+        self.__writeLock = threading.Lock()
+        self.__writerThread = None
+
+    # writes one message line, returns False if the connection is gone
+    def write(self, message):
+        try:
+            with self.__writeLock:
+                self.out.write(json.dumps(message) + '\n')
+                self.out.flush()
+            return True
+        except (IOError, ValueError):
+            self.isClosed = True
+            return False
+
+    # queues the message for the writer thread, returns immediately
+    def queue(self, message):
+        if self.__writerThread is None:
+            self.__writerThread = threading.Thread(target=self.__write_queued)
+            self.__writerThread.daemon = True
+            self.__writerThread.start()
+        self.__messages.put(message)
+
+    def close(self):
+        self.isClosed = True
+
+    def __write_queued(self):
+        while not self.isClosed:
+            message = self.__messages.get(0.5)
+            if message is not None:
+                self.write(message)
+
+
+# handler is called with the request dict and returns the response dict,
+# KeyError, ValueError and TypeError raised by the handler are returned to the client as errors
+class ControlServer:
+    def __init__(self, handler, port=7007, host='127.0.0.1'):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        # subscribed connections, the lock guards the list only and is never held while writing
+        self.__subscribers = []
+        self.__lock = threading.Lock()
+        self.__server = None
+        self.__thread = None
+
+    def start(self):
+        self.__server = _ControlTCPServer((self.host, self.port), _ControlRequestHandler)
+        self.__server.control = self
+        # port 0 picks a free one
+        self.port = self.__server.server_address[1]
+        self.__thread = threading.Thread(target=self.__server.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+        with self.__lock:
+            for connection in self.__subscribers:
+                connection.close()
+            self.__subscribers = []
+
+    # true if any connection subscribed, to skip building the messages nobody receives
+    def has_subscribers(self):
+        return len(self.__subscribers) > 0
+
+    # queues the message for all subscribed connections, the message with 'source' for the ones subscribed to it.
+    # Returns immediately, the messages are written by the connection writer threads
+    def publish(self, message):
+        source = message.get('source')
+        with self.__lock:
+            subscribers = list(self.__subscribers)
+        for connection in subscribers:
+            if connection.isClosed:
+                self.unsubscribe(connection)
+            elif source is None or connection.sourceFilter is None or connection.sourceFilter == source:
+                connection.queue(message)
+
+    def unsubscribe(self, connection):
+        connection.close()
+        with self.__lock:
+            if connection in self.__subscribers:
+                self.__subscribers.remove(connection)
+
+    def handle_line(self, line, connection):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('request must be an object')
+            if request.get('cmd') == 'subscribe':
+                connection.sourceFilter = int_field(request, 'source') if 'source' in request else None
+                with self.__lock:
+                    if connection not in self.__subscribers:
+                        self.__subscribers.append(connection)
+                return {'ok': True}
+            response = self.handler(request)
+            return response if response is not None else {'ok': True}
+        except KeyError as e:
+            return {'error': 'missing or unknown %s' % e}
+        except (ValueError, TypeError) as e:
+            return {'error': str(e)}
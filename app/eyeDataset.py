@@ -0,0 +1,60 @@
+import os
+import cv2
+import numpy as np
+from blinkDetector import preprocess_eyes, eyeImageSize
+
+imageExtensions = ('.png', '.jpg', '.jpeg', '.bmp', '.pgm')
+
+
+# loads gray eye images from the directory tree. Labels are taken from the directory names as in CEW dataset:
+# 1 - 'open' in the path, 0 - 'closed' in the path, -1 - unknown. Returns (list of images, labels array)
+def load_eye_crops(dirName, maxImages=0):
+    crops = []
+    labels = []
+    for root, dirs, files in sorted(os.walk(dirName)):
+        dirs.sort()
+        relPath = os.path.relpath(root, dirName).lower()
+        label = 0 if 'closed' in relPath else (1 if 'open' in relPath else -1)
+        for f in sorted(files):
+            if os.path.splitext(f)[1].lower() not in imageExtensions:
+                continue
+            img = cv2.imread(os.path.join(root, f), cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                continue
+            crops.append(img)
+            labels.append(label)
+            if 0 < maxImages <= len(crops):
+                return crops, np.array(labels)
+    return crops, np.array(labels)
+
+
+# preprocesses eye images the same way BlinkDetector does, returns float32 array (N, 1, 32, 32)
+def preprocess_crops(crops):
+    data = np.empty((len(crops), 1, eyeImageSize, eyeImageSize), np.float32)
+    preprocess_eyes(crops, data, np.empty((len(crops), eyeImageSize, eyeImageSize), np.uint8))
+    return data
+
+
+# synthetic labelled eye crops for smoke tests and speed measurements without a dataset: open eyes are a dark iris
+# with a pupil and a highlight inside the eye opening, closed eyes are a dark lid line. Size, position, lighting
+# and noise vary. Returns (list of uint8 images, labels array), half of them open
+def synthetic_eye_crops(n, size=40, seed=0):
+    rng = np.random.RandomState(seed)
+    crops = []
+    labels = np.arange(n) % 2
+    for label in labels:
+        img = np.empty((size, size), np.uint8)
+        img[...] = rng.randint(120, 220)
+        center = (size // 2 + rng.randint(-3, 4), size // 2 + rng.randint(-3, 4))
+        width = int(size * rng.uniform(0.3, 0.45))
+        if label == 1:
+            cv2.ellipse(img, center, (width, int(width * 0.5)), 0, 0, 360, int(img[0, 0]) + 30, -1)
+            radius = int(width * rng.uniform(0.4, 0.55))
+            cv2.circle(img, center, radius, rng.randint(30, 90), -1)
+            cv2.circle(img, center, max(1, radius // 2), rng.randint(0, 30), -1)
+            cv2.circle(img, (center[0] + radius // 3, center[1] - radius // 3), 1, 255, -1)
+        else:
+            cv2.ellipse(img, center, (width, int(width * 0.2)), 0, 0, 180, rng.randint(30, 90), 2)
+        noise = rng.normal(0, rng.uniform(2, 8), img.shape)
+        crops.append(np.clip(img + noise, 0, 255).astype(np.uint8))
+    return crops, labels
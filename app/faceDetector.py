@@ -1,130 +1,421 @@
-import threading
-import time
-import cv2
-import numpy as np
-import utils as u
-import dlib
-
-
-class FaceAndMovementDetector:
-    def __init__(self, landmarks_file):
-        self.isDetecting = False
-        self.lastResultStamp = 0
-        self.isFaceDetected = False
-        self.detectedFaceArea = (0, 0, 0, 0)
-        self.detectedEyeAreas = [[0, 0, 0, 0], [0, 0, 0, 0]]
-
-        self.lastEyeCenters = [[0, 0], [0, 0]]
-
-        self.__faceDetector = dlib.get_frontal_face_detector()
-        self.__landmarksPredictor = dlib.shape_predictor(landmarks_file)
-        self.__lastEyeHalfSize = 0
-        self.__image_container = None
-        self.__accumulatedMovement = 0.
-        self.__moveAccumulatorThreshold = 40
-        self.__intervalFound = 6000
-        self.__intervalNotFound = 500
-        self.__backgroundThread = None
-
-        # motion detection
-        self.trackedPoint = np.array([[0., 0.]], dtype=np.float32)  # nose
-        self.__termCriteria = (cv2.TERM_CRITERIA_MAX_ITER | cv2.TERM_CRITERIA_EPS, 40, 0.03)
-
-    # detects face and eye positions in background thread
-    def __detectFaceAsync(self):
-        while self.isDetecting:
-            self.__accumulatedMovement = 0.
-            startStamp = int(round(time.time() * 1000))
-            self.isFaceDetected = False
-            workImage = cv2.equalizeHist(self.__image_container['gray'])
-            detections = self.__faceDetector(workImage, 0)
-            if len(detections) > 0:
-                face = u.biggest_dlib_rect(detections)
-                self.isFaceDetected = True
-                self.faceDetectionStamp = int(round(time.time() * 1000))
-                x1 = face.left()
-                y1 = face.top()
-                x2 = face.right()
-                y2 = face.bottom()
-                self.detectedFaceArea = (x1, y1, x2, y2)
-
-                # update eye size
-                expectedEyeHalfSize = int((x2 - x1 + y2 - y1) / 16)
-                if abs(self.__lastEyeHalfSize - expectedEyeHalfSize) > 3:
-                    self.__lastEyeHalfSize = expectedEyeHalfSize
-                else:
-                    self.__lastEyeHalfSize = int((self.__lastEyeHalfSize + expectedEyeHalfSize) / 2)
-
-                self.__doDetectLandmarks = True
-
-            self.lastResultStamp = int(round(time.time() * 1000))
-            # sleep some time, depending on the last detection result and accumulated move
-            delay = (self.__intervalFound if self.isFaceDetected else self.__intervalNotFound) - (
-                self.lastResultStamp - startStamp)
-            while delay > 0 and self.__accumulatedMovement < self.__moveAccumulatorThreshold and self.isDetecting:
-                time.sleep(0.1)
-                delay -= 100
-
-    def start_detect_face_async(self, image_container):
-        self.isDetecting = True
-        self.__image_container = image_container
-        self.__backgroundThread = threading.Thread(target=self.__detectFaceAsync)
-        self.__backgroundThread.daemon = True
-        self.__backgroundThread.start()
-
-    def stop(self):
-        self.isDetecting = False
-        if self.__backgroundThread:
-            self.__backgroundThread.join(1)
-
-    # Movement detection part
-    # returns relative nose point move, called every frame
-    def get_relative_motion(self, curr_frame, prev_frame):
-        landmarkPoints = self.__landmarksPredictor(curr_frame, dlib.rectangle(
-                left=self.detectedFaceArea[0],
-                top=self.detectedFaceArea[1],
-                right=self.detectedFaceArea[2],
-                bottom=self.detectedFaceArea[3]))
-        self.__set_areas_from_landmarks(landmarkPoints, prev_frame)
-
-        newPoints, status, err = cv2.calcOpticalFlowPyrLK(prevImg=prev_frame, nextImg=curr_frame,
-                                                          prevPts=self.trackedPoint, nextPts=None,
-                                                          winSize=(25, 25), maxLevel=4,
-                                                          criteria=self.__termCriteria)
-        relativeMove = [0., 0.]
-        # point is found on new frame
-        if status[0]:
-            relativeMove[0] = newPoints[0][0]-self.trackedPoint[0][0]
-            relativeMove[1] = newPoints[0][1]-self.trackedPoint[0][1]
-            self.trackedPoint[0] = newPoints[0]
-
-        self.__accumulatedMovement += u.distance(relativeMove, (0, 0))
-
-        # return the nose point move
-        return relativeMove
-
-    def __set_areas_from_landmarks(self, landm, frame):
-        # left eye landmarks  36, 39
-        newCLeft = [(landm.part(36).x + landm.part(39).x) / 2, (landm.part(36).y + landm.part(39).y) / 2]
-        self.lastEyeCenters[0] = u.updateCenter(self.lastEyeCenters[0], newCLeft)
-
-        # right eye landmarks  42, 45
-        newCRight = [(landm.part(42).x + landm.part(45).x) / 2, (landm.part(42).y + landm.part(45).y) / 2]
-        self.lastEyeCenters[1] = u.updateCenter(self.lastEyeCenters[1], newCRight)
-
-        self.detectedEyeAreas[0] = u.rect_around_center(self.lastEyeCenters[0],
-                                                        self.__lastEyeHalfSize, self.__lastEyeHalfSize)
-        self.detectedEyeAreas[1] = u.rect_around_center(self.lastEyeCenters[1],
-                                                        self.__lastEyeHalfSize, self.__lastEyeHalfSize)
-        # nose tip  landmark 33
-        noseTip = [landm.part(33).x, landm.part(33).y]
-        # fa = self.detectedFaceArea
-        # self.detectedFaceArea = u.rect_around_center(noseTip, (fa[2]-fa[0])/2, (fa[3]-fa[1])/2)
-        # if tracked point drifted too far from nose tip, adjust it
-        dist = u.distance(self.trackedPoint[0], noseTip)
-        if dist > self.__lastEyeHalfSize / 2:
-            self.trackedPoint[0] = noseTip
-            self.__accumulatedMovement += dist
-            cv2.cornerSubPix(frame, self.trackedPoint,
-                             (int(self.__lastEyeHalfSize / 2), int(self.__lastEyeHalfSize / 2)),
-                             (-1, -1), self.__termCriteria)
+import threading
+import time
+import cv2
+import numpy as np
+import utils as u
+from metrics import StageTimings
+
+
+class FaceAndMovementDetector:
+    # dlib 68 face landmarks used: nose tip, left eye corners, right eye corners
+    trackedLandmarks = (33, 36, 39, 42, 45)
+
+    # modelsFrom is another detector whose dlib models are reused, for the per-face detectors of several users
+    def __init__(self, landmarks_file, modelsFrom=None):
+        self.isDetecting = False
+        self.lastResultStamp = 0
+        self.isFaceDetected = False
+        self.detectedFaceArea = (0, 0, 0, 0)
+        self.detectedEyeAreas = [[0, 0, 0, 0], [0, 0, 0, 0]]
+        # size of the image the face was found on
+        self.detectionFrameShape = None
+
+        self.lastEyeCenters = [[0, 0], [0, 0]]
+
+        # dlib is imported on the first use, it takes a while
+        import dlib
+        self.__dlib = dlib
+        if modelsFrom is not None:
+            self.__faceDetector, self.__landmarksPredictor = modelsFrom.__faceDetector, modelsFrom.__landmarksPredictor
+        else:
+            self.__faceDetector = dlib.get_frontal_face_detector()
+            self.__landmarksPredictor = None
+        self.__lastEyeHalfSize = 0
+        self.__frame_buffer = None
+        self.__accumulatedMovement = 0.
+        self.__moveAccumulatorThreshold = 40
+        self.__intervalFound = 6000
+        self.__intervalNotFound = 500
+        self.__backgroundThread = None
+        # face detection, landmarks and optical flow durations
+        self.timings = StageTimings()
+
+        # re-detection in the window around the last found face, full frame is scanned only if it fails
+        self.useLocalSearch = True
+        # window margin around the face, relative to the face size
+        self.localSearchMargin = 0.5
+        # window is downscaled so that the face is about this size in pixels, dlib detects faces from 80 px
+        self.localSearchFaceSize = 100
+        self.localDetectionCount = 0
+        self.fullDetectionCount = 0
+        # tracked point move since the last face detection
+        self.__moveSinceDetection = [0., 0.]
+
+        # motion detection
+        self.trackedPoint = np.array([[0., 0.]], dtype=np.float32)  # nose
+        self.__termCriteria = (cv2.TERM_CRITERIA_MAX_ITER | cv2.TERM_CRITERIA_EPS, 40, 0.03)
+
+        # landmarks are moved by optical flow between shape predictions
+        self.__landmarks = np.zeros((len(FaceAndMovementDetector.trackedLandmarks), 2), dtype=np.float32)
+        self.__landmarksFaceArea = None
+        self.__framesSinceLandmarks = 0
+        # run the shape predictor every N frames, 1 - every frame
+        self.landmarksInterval = 5
+        # optical flow error above this forces the shape prediction
+        self.landmarksMaxFlowError = 20.
+        # relative change of the eye widths since the last prediction above this forces the shape prediction
+        self.landmarksMaxDrift = 0.2
+        self.__predictedEyeWidths = None
+        self.landmarksPredictionCount = 0
+        # False postpones the periodic shape prediction, e.g. to spread the predictions of several faces over frames.
+        # Predictions forced by the detection or the unreliable flow are not postponed
+        self.periodicLandmarksEnabled = True
+
+        # optical flow is calculated in the window around the tracked points, expanded by the margin
+        # relative to the face size, but not less than the min margin in pixels
+        self.flowWindowEnabled = True
+        self.flowWindowMargin = 0.5
+        self.flowWindowMinMargin = 64
+
+        # head move is estimated from a set of features tracked on the face.
+        # Estimator: 'median' - robust median move, 'ransac' - RANSAC similarity transform, 'nose' - nose point only
+        self.motionEstimator = 'median'
+        self.motionPoints = np.zeros((0, 2), dtype=np.float32)
+        self.minMotionPoints = 8
+        self.maxMotionPoints = 30
+        # 0..1, how reliable the last head move estimate is
+        self.motionConfidence = 0.
+        self.__motionPointsFaceArea = None
+
+        # landmarks file may be None if the detector is used for the face detection only,
+        # or if the landmarks are loaded later by load_landmarks()
+        if landmarks_file:
+            self.load_landmarks(landmarks_file)
+
+    # returns the window around the last detected face, shifted by the tracked point move since that detection
+    def __local_search_area(self, imgShape):
+        x1, y1, x2, y2 = self.detectedFaceArea
+        dx = int(self.__moveSinceDetection[0])
+        dy = int(self.__moveSinceDetection[1])
+        mx = int((x2 - x1) * self.localSearchMargin)
+        my = int((y2 - y1) * self.localSearchMargin)
+        return (max(0, x1 + dx - mx), max(0, y1 + dy - my),
+                min(imgShape[1], x2 + dx + mx), min(imgShape[0], y2 + dy + my))
+
+    # searches the face in the downscaled window, returns face rectangle in image coordinates or None
+    def __detect_face_local(self, grayImg):
+        x1, y1, x2, y2 = self.__local_search_area(grayImg.shape)
+        if x2 - x1 < self.localSearchFaceSize or y2 - y1 < self.localSearchFaceSize:
+            return None
+        scale = min(1., float(self.localSearchFaceSize) / (self.detectedFaceArea[2] - self.detectedFaceArea[0]))
+        workImage = grayImg[y1:y2, x1:x2]
+        if scale < 1.:
+            workImage = cv2.resize(workImage, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        detections = self.__faceDetector(cv2.equalizeHist(workImage), 0)
+        if len(detections) == 0:
+            return None
+        face = u.biggest_dlib_rect(detections)
+        return (x1 + int(face.left() / scale), y1 + int(face.top() / scale),
+                x1 + int(face.right() / scale), y1 + int(face.bottom() / scale))
+
+    # scans the whole frame, returns face rectangle or None
+    def __detect_face_full(self, grayImg):
+        detections = self.__faceDetector(cv2.equalizeHist(grayImg), 0)
+        if len(detections) == 0:
+            return None
+        face = u.biggest_dlib_rect(detections)
+        return face.left(), face.top(), face.right(), face.bottom()
+
+    # loads the dlib shape predictor, the ~100 MB model takes a second or more. Can be called from a loader thread
+    # while the face detection already runs, the motion detection needs it
+    def load_landmarks(self, landmarks_file):
+        self.__landmarksPredictor = self.__dlib.shape_predictor(landmarks_file)
+
+    # scans the whole frame for all the faces, returns the list of face rectangles, biggest first
+    def detect_faces(self, grayImg):
+        with self.timings.measure('face detection'):
+            detections = self.__faceDetector(cv2.equalizeHist(grayImg), 0)
+        faces = [(d.left(), d.top(), d.right(), d.bottom()) for d in detections]
+        return sorted(faces, key=lambda f: (f[2] - f[0]) * (f[3] - f[1]), reverse=True)
+
+    # searches the face on the gray image, in the window around the last found face first.
+    # Returns the face rectangle or None
+    def search_face(self, grayImg):
+        faceArea = None
+        if self.useLocalSearch and self.isFaceDetected and self.detectedFaceArea[2] > self.detectedFaceArea[0]:
+            faceArea = self.__detect_face_local(grayImg)
+            if faceArea is not None:
+                self.localDetectionCount += 1
+        if faceArea is None:
+            faceArea = self.__detect_face_full(grayImg)
+            self.fullDetectionCount += 1
+        return faceArea
+
+    # detects face and eye positions on the gray image, returns True if the face was found
+    def detect_face(self, grayImg):
+        with self.timings.measure('face detection'):
+            faceArea = self.search_face(grayImg)
+        return self.set_detected_face(faceArea, grayImg.shape)
+
+    # takes the face found on the image of the given shape, e.g. by the detection process. None - face not found.
+    # Returns True if the face was found
+    def set_detected_face(self, faceArea, frameShape):
+        self.isFaceDetected = False
+        self.__accumulatedMovement = 0.
+        if faceArea is not None:
+            self.faceDetectionStamp = int(round(time.time() * 1000))
+            x1, y1, x2, y2 = faceArea
+            self.detectedFaceArea = faceArea
+            self.detectionFrameShape = frameShape
+            self.__moveSinceDetection = [0., 0.]
+            # set after the frame shape, the main loop compares the shape of detected faces with its frames
+            self.isFaceDetected = True
+
+            # update eye size
+            expectedEyeHalfSize = int((x2 - x1 + y2 - y1) / 16)
+            if abs(self.__lastEyeHalfSize - expectedEyeHalfSize) > 3:
+                self.__lastEyeHalfSize = expectedEyeHalfSize
+            else:
+                self.__lastEyeHalfSize = int((self.__lastEyeHalfSize + expectedEyeHalfSize) / 2)
+
+            self.__doDetectLandmarks = True
+
+        self.lastResultStamp = int(round(time.time() * 1000))
+        return self.isFaceDetected
+
+    # returns the last detected face area, shifted by the tracked point move since that detection
+    def current_face_area(self):
+        x1, y1, x2, y2 = self.detectedFaceArea
+        dx = int(self.__moveSinceDetection[0])
+        dy = int(self.__moveSinceDetection[1])
+        return x1 + dx, y1 + dy, x2 + dx, y2 + dy
+
+    # forgets the found face, e.g. when the frame resolution changes. The next detection scans the full frame
+    def reset(self):
+        self.isFaceDetected = False
+        self.detectedFaceArea = (0, 0, 0, 0)
+        self.__landmarksFaceArea = None
+        self.__motionPointsFaceArea = None
+        self.motionPoints = np.zeros((0, 2), dtype=np.float32)
+        # wakes up the background detection
+        self.__accumulatedMovement = self.__moveAccumulatorThreshold
+
+    # tells if the face detection should be repeated, following the same policy as the background thread
+    def is_detection_due(self, nowMs):
+        interval = self.__intervalFound if self.isFaceDetected else self.__intervalNotFound
+        return nowMs - self.lastResultStamp >= interval \
+            or self.__accumulatedMovement >= self.__moveAccumulatorThreshold
+
+    # detects face and eye positions in background thread
+    def __detectFaceAsync(self):
+        while self.isDetecting:
+            startStamp = int(round(time.time() * 1000))
+            frame = self.__frame_buffer.latest()
+            if frame is None:
+                time.sleep(0.01)
+                continue
+            with self.timings.measure('face detection'):
+                faceArea = self.search_face(frame.gray)
+            # the ring buffer reuses the frame memory, a scan slower than the buffer may have read newer frame data.
+            # Such result is dropped and the detection runs again on the latest frame
+            if not self.__frame_buffer.is_valid(frame):
+                self.timings.count('overwritten face detections')
+                continue
+            self.set_detected_face(faceArea, frame.gray.shape)
+            # sleep some time, depending on the last detection result and accumulated move
+            delay = (self.__intervalFound if self.isFaceDetected else self.__intervalNotFound) - (
+                self.lastResultStamp - startStamp)
+            while delay > 0 and self.__accumulatedMovement < self.__moveAccumulatorThreshold and self.isDetecting:
+                time.sleep(0.1)
+                delay -= 100
+
+    # starts the background detection on the latest frames of the FrameRingBuffer
+    def start_detect_face_async(self, frame_buffer):
+        self.isDetecting = True
+        self.__frame_buffer = frame_buffer
+        self.__backgroundThread = threading.Thread(target=self.__detectFaceAsync)
+        self.__backgroundThread.daemon = True
+        self.__backgroundThread.start()
+
+    def stop(self):
+        self.isDetecting = False
+        if self.__backgroundThread:
+            self.__backgroundThread.join(1)
+
+    # Movement detection part
+    # returns relative head move, called every frame
+    def get_relative_motion(self, curr_frame, prev_frame):
+        # tracked point, the used landmarks and the motion points are moved by optical flow in one call
+        nLandmarks = len(self.__landmarks)
+        prevPoints = np.vstack((self.trackedPoint, self.__landmarks, self.motionPoints))
+        newPoints, status, err = self.__flow_points(prev_frame, curr_frame, prevPoints)
+        status = status.ravel().astype(bool)
+        landmarksSlice = slice(1, 1 + nLandmarks)
+        motionSlice = slice(1 + nLandmarks, None)
+
+        # landmarks are predicted again periodically, after face detection and when the flow is not reliable
+        isPeriodicDue = self.__framesSinceLandmarks + 1 >= self.landmarksInterval and self.periodicLandmarksEnabled
+        isPredictionDue = isPeriodicDue \
+            or self.__landmarksFaceArea != self.detectedFaceArea \
+            or not status[landmarksSlice].all() or err[landmarksSlice].max() > self.landmarksMaxFlowError \
+            or self.__landmarks_drift(newPoints[landmarksSlice]) > self.landmarksMaxDrift
+        if isPredictionDue:
+            self.__predict_landmarks(curr_frame)
+        else:
+            self.__landmarks = newPoints[landmarksSlice]
+            self.__framesSinceLandmarks += 1
+        isReseeded = self.__set_areas_from_landmarks(self.__landmarks, prev_frame)
+
+        newNose, noseStatus = newPoints[0], status[0]
+        if isReseeded:
+            reseededPoints, reseededStatus, _ = self.__flow_points(prev_frame, curr_frame, self.trackedPoint)
+            newNose, noseStatus = reseededPoints[0], reseededStatus[0][0]
+        noseMove = newNose - self.trackedPoint[0] if noseStatus else None
+
+        relativeMove = [0., 0.]
+        move = self.__estimate_head_move(self.motionPoints, newPoints[motionSlice], status[motionSlice], noseMove)
+        if move is not None:
+            relativeMove = [float(move[0]), float(move[1])]
+            self.__moveSinceDetection[0] += relativeMove[0]
+            self.__moveSinceDetection[1] += relativeMove[1]
+        # point is found on new frame
+        if noseStatus:
+            self.trackedPoint[0] = newNose
+        if len(self.motionPoints) < self.minMotionPoints or self.__motionPointsFaceArea != self.detectedFaceArea:
+            self.__find_motion_points(curr_frame)
+
+        self.__accumulatedMovement += u.distance(relativeMove, (0, 0))
+
+        # return the head move
+        return relativeMove
+
+    # estimates the head translation from the motion points moves, keeps the inlier points only.
+    # Falls back to the nose point move when there are not enough points. Sets motionConfidence
+    def __estimate_head_move(self, prevPts, newPts, status, noseMove):
+        prevPts = prevPts[status]
+        newPts = newPts[status]
+        move = None
+        inliers = np.zeros(len(prevPts), dtype=bool)
+        if self.motionEstimator != 'nose' and len(prevPts) >= self.minMotionPoints:
+            deltas = newPts - prevPts
+            if self.motionEstimator == 'ransac':
+                transform, mask = cv2.estimateAffinePartial2D(prevPts, newPts, method=cv2.RANSAC,
+                                                              ransacReprojThreshold=2.0)
+                if transform is not None:
+                    # move of the nose point under the estimated similarity transform
+                    nose = self.trackedPoint[0]
+                    move = transform[:, :2].dot(nose) + transform[:, 2] - nose
+                    inliers = mask.ravel().astype(bool)
+            else:
+                # median move, points farther than 3 median deviations from it are outliers
+                median = np.median(deltas, axis=0)
+                deviations = np.hypot(deltas[:, 0] - median[0], deltas[:, 1] - median[1])
+                inliers = deviations <= max(3 * np.median(deviations), 0.5)
+                move = deltas[inliers].mean(axis=0)
+
+        if move is None:
+            self.motionConfidence = 0.5 if noseMove is not None else 0.
+            move = noseMove
+        else:
+            # share of consistent points, scaled down when few points are tracked
+            self.motionConfidence = float(inliers.sum()) / len(inliers) * \
+                min(1., float(len(inliers)) / self.maxMotionPoints)
+        self.motionPoints = newPts[inliers] if inliers.any() else newPts
+        return move
+
+    # finds good features to track on the face, excluding the eyes as they move when blinking
+    def __find_motion_points(self, frame):
+        # features are searched in the face window only, eye areas are masked out
+        x1, y1, x2, y2 = [int(v) for v in self.detectedFaceArea]
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(frame.shape[1], x2), min(frame.shape[0], y2)
+        corners = None
+        if x2 > x1 and y2 > y1:
+            mask = np.full((y2 - y1, x2 - x1), 255, dtype=np.uint8)
+            for ex1, ey1, ex2, ey2 in self.detectedEyeAreas:
+                mask[max(0, ey1 - y1):max(0, ey2 - y1), max(0, ex1 - x1):max(0, ex2 - x1)] = 0
+            with self.timings.measure('motion points'):
+                corners = cv2.goodFeaturesToTrack(frame[y1:y2, x1:x2], self.maxMotionPoints, 0.01, 5, mask=mask)
+        if corners is not None:
+            self.motionPoints = corners.reshape(-1, 2) + np.array([x1, y1], dtype=np.float32)
+        else:
+            self.motionPoints = np.zeros((0, 2), np.float32)
+        self.__motionPointsFaceArea = self.detectedFaceArea
+
+    # calculates pyramidal Lucas-Kanade optical flow of the points. Image pyramids are built for the window
+    # around the points only: OpenCV python bindings can't take prebuilt pyramids, so the window keeps
+    # the pyramid building cheap instead of reusing it
+    def __flow_points(self, prev_frame, curr_frame, points):
+        x1, y1, x2, y2 = 0, 0, curr_frame.shape[1], curr_frame.shape[0]
+        if self.flowWindowEnabled:
+            margin = max(int((self.detectedFaceArea[2] - self.detectedFaceArea[0]) * self.flowWindowMargin),
+                         self.flowWindowMinMargin)
+            x1 = max(x1, int(points[:, 0].min()) - margin)
+            y1 = max(y1, int(points[:, 1].min()) - margin)
+            x2 = min(x2, int(points[:, 0].max()) + margin)
+            y2 = min(y2, int(points[:, 1].max()) + margin)
+            if x2 <= x1 or y2 <= y1:
+                x1, y1, x2, y2 = 0, 0, curr_frame.shape[1], curr_frame.shape[0]
+        offset = np.array([x1, y1], dtype=np.float32)
+        with self.timings.measure('optical flow'):
+            newPoints, status, err = cv2.calcOpticalFlowPyrLK(prevImg=prev_frame[y1:y2, x1:x2],
+                                                              nextImg=curr_frame[y1:y2, x1:x2],
+                                                              prevPts=points - offset, nextPts=None,
+                                                              winSize=(25, 25), maxLevel=4,
+                                                              criteria=self.__termCriteria)
+        return newPoints + offset, status, err
+
+    # runs the full shape predictor and keeps the used landmarks
+    def __predict_landmarks(self, frame):
+        with self.timings.measure('landmarks'):
+            landm = self.__landmarksPredictor(frame, self.__dlib.rectangle(
+                    left=self.detectedFaceArea[0],
+                    top=self.detectedFaceArea[1],
+                    right=self.detectedFaceArea[2],
+                    bottom=self.detectedFaceArea[3]))
+        for i, partIdx in enumerate(FaceAndMovementDetector.trackedLandmarks):
+            self.__landmarks[i] = (landm.part(partIdx).x, landm.part(partIdx).y)
+        self.__landmarksFaceArea = self.detectedFaceArea
+        self.__predictedEyeWidths = self.__eye_widths(self.__landmarks)
+        self.__framesSinceLandmarks = 0
+        self.landmarksPredictionCount += 1
+
+    @staticmethod
+    def __eye_widths(landm):
+        return u.distance(landm[1], landm[2]), u.distance(landm[3], landm[4])
+
+    # max relative change of the eye widths of the propagated landmarks against the last predicted ones
+    def __landmarks_drift(self, landm):
+        if self.__predictedEyeWidths is None or min(self.__predictedEyeWidths) <= 0:
+            return 0.
+        widths = self.__eye_widths(landm)
+        return max(abs(widths[0] / self.__predictedEyeWidths[0] - 1), abs(widths[1] / self.__predictedEyeWidths[1] - 1))
+
+    # takes landmarks in trackedLandmarks order, returns True if the tracked point was moved to the nose tip
+    def __set_areas_from_landmarks(self, landm, frame):
+        # left eye landmarks  36, 39
+        newCLeft = [int((landm[1][0] + landm[2][0]) / 2), int((landm[1][1] + landm[2][1]) / 2)]
+        self.lastEyeCenters[0] = u.updateCenter(self.lastEyeCenters[0], newCLeft)
+
+        # right eye landmarks  42, 45
+        newCRight = [int((landm[3][0] + landm[4][0]) / 2), int((landm[3][1] + landm[4][1]) / 2)]
+        self.lastEyeCenters[1] = u.updateCenter(self.lastEyeCenters[1], newCRight)
+
+        self.detectedEyeAreas[0] = u.rect_around_center(self.lastEyeCenters[0],
+                                                        self.__lastEyeHalfSize, self.__lastEyeHalfSize)
+        self.detectedEyeAreas[1] = u.rect_around_center(self.lastEyeCenters[1],
+                                                        self.__lastEyeHalfSize, self.__lastEyeHalfSize)
+        # nose tip  landmark 33
+        noseTip = [landm[0][0], landm[0][1]]
+        # fa = self.detectedFaceArea
+        # self.detectedFaceArea = u.rect_around_center(noseTip, (fa[2]-fa[0])/2, (fa[3]-fa[1])/2)
+        # if tracked point drifted too far from nose tip, adjust it
+        dist = u.distance(self.trackedPoint[0], noseTip)
+        if dist > self.__lastEyeHalfSize / 2:
+            self.trackedPoint[0] = noseTip
+            self.__accumulatedMovement += dist
+            cv2.cornerSubPix(frame, self.trackedPoint,
+                             (int(self.__lastEyeHalfSize / 2), int(self.__lastEyeHalfSize / 2)),
+                             (-1, -1), self.__termCriteria)
+            return True
+        return False
@@ -0,0 +1,324 @@
+import ctypes
+import multiprocessing
+import threading
+import time
+from multiprocessing import sharedctypes
+from collections import deque
+import cv2
+import numpy as np
+
+
+# single captured frame: sequence number, capture timestamp (seconds), gray and colour (BGR) images.
+# Frames are never modified after publishing, image arrays are read-only views.
+# Consumers must draw on a copy of the colour image.
+# If roi (x1, y1, x2, y2) is set, only this region of the gray image holds the frame data, the rest is black
+class Frame:
+    def __init__(self, sequence, timestamp, gray, color, roi=None):
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.gray = gray
+        self.color = color
+        self.roi = roi
+
+
+# flips the camera image horizontally into 'color' and converts it to gray into 'gray', only inside roi if it is set.
+# clearGray blackens the gray image first, when it may hold the data of the frame with another region.
+# Returns the number of converted gray pixels
+def convert_frame(bgrImage, color, gray, roi=None, clearGray=False):
+    cv2.flip(bgrImage, 1, color)
+    if roi is None:
+        cv2.cvtColor(color, cv2.COLOR_BGR2GRAY, gray)
+        return gray.size
+    if clearGray:
+        gray.fill(0)
+    x1, y1, x2, y2 = roi
+    cv2.cvtColor(color[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY, gray[y1:y2, x1:x2])
+    return (x2 - x1) * (y2 - y1)
+
+
+# returns the gray conversion region for the face area on the frame of the given size. The current region is kept
+# while the face with the min margin (relative to the face size) is inside it, otherwise the face padded
+# by the padding is the new region. Returns None, the whole frame, if there is no face
+def face_roi(faceArea, roi, width, height, padding, minMargin):
+    if faceArea is None or faceArea[2] <= faceArea[0]:
+        return None
+    x1, y1, x2, y2 = faceArea
+    if roi is not None and (roi[2] > width or roi[3] > height):
+        roi = None
+    mx = int((x2 - x1) * minMargin)
+    my = int((y2 - y1) * minMargin)
+    if roi is not None and roi[0] <= max(0, x1 - mx) and roi[1] <= max(0, y1 - my) \
+            and roi[2] >= min(width, x2 + mx) and roi[3] >= min(height, y2 + my):
+        return roi
+    mx = int((x2 - x1) * padding)
+    my = int((y2 - y1) * padding)
+    return max(0, x1 - mx), max(0, y1 - my), min(width, x2 + mx), min(height, y2 + my)
+
+
+# ring buffer of the last captured frames, written by the grabber thread only.
+# Image storage is preallocated once and reused, so grabbing does not allocate new arrays every frame.
+# Readers get consistent snapshots without locking: a frame is published by a single reference assignment
+# after all its data is written. A slot is overwritten after 'size' newer frames are published,
+# so consumers holding a frame longer should check it with is_valid().
+class FrameRingBuffer:
+    def __init__(self, size=8, maxLag=2):
+        self.size = size
+        # consumer falling behind more than this number of frames skips to the newer frames
+        self.maxLag = maxLag
+        self.droppedCount = 0
+        self.__frames = [None] * size
+        self.__grayStorage = [None] * size
+        self.__colorStorage = [None] * size
+        self.__latest = None
+        self.__sequence = 0
+        self.__stamps = deque([], maxlen=6)
+        self.__cond = threading.Condition()
+
+        # once the face is found, only the padded region around it is converted to gray, None - the whole frame
+        self.roi = None
+        # region margin relative to the face size, the region is moved only when the face comes close to its border
+        self.roiPadding = 0.5
+        self.roiMinMargin = 0.25
+        self.__slotRois = [None] * size
+        # converted and total gray pixels, to measure the saved work
+        self.convertedPixels = 0
+        self.totalPixels = 0
+
+    # flips the camera image horizontally, converts to gray and publishes as the new frame. Called by the grabber.
+    def publish(self, bgrImage, timestamp=None):
+        seq = self.__sequence + 1
+        idx = seq % self.size
+        color = self.__colorStorage[idx]
+        if color is None or color.shape != bgrImage.shape:
+            color = self.__colorStorage[idx] = np.empty(bgrImage.shape, np.uint8)
+            self.__grayStorage[idx] = np.empty(bgrImage.shape[:2], np.uint8)
+            self.__slotRois[idx] = None
+        gray = self.__grayStorage[idx]
+        # invalidate the slot before overwriting its data
+        self.__frames[idx] = None
+        roi = self.roi
+        self.convertedPixels += convert_frame(bgrImage, color, gray, roi, self.__slotRois[idx] != roi)
+        self.__slotRois[idx] = roi
+        self.totalPixels += gray.size
+
+        grayView = gray.view()
+        grayView.flags.writeable = False
+        colorView = color.view()
+        colorView.flags.writeable = False
+        frame = Frame(seq, time.time() if timestamp is None else timestamp, grayView, colorView, roi)
+        self.__frames[idx] = frame
+        self.__stamps.append(frame.timestamp)
+        # publish
+        self.__sequence = seq
+        self.__latest = frame
+        with self.__cond:
+            self.__cond.notify_all()
+        return frame
+
+    # sets the gray conversion region around the face area (x1, y1, x2, y2) in frame coordinates.
+    # None switches back to full frames, e.g. when the face is lost
+    def track_face(self, faceArea):
+        latest = self.__latest
+        if latest is None:
+            self.roi = None
+            return
+        height, width = latest.gray.shape
+        self.roi = face_roi(faceArea, self.roi, width, height, self.roiPadding, self.roiMinMargin)
+
+    # share of the gray pixels converted since the start, 1 - every frame was converted in full
+    def converted_ratio(self):
+        return float(self.convertedPixels) / self.totalPixels if self.totalPixels > 0 else 1.
+
+    # returns the most recent frame or None if nothing was captured yet
+    def latest(self):
+        return self.__latest
+
+    # returns the frame with the given sequence number, or None if it was overwritten already
+    def get(self, sequence):
+        frame = self.__frames[sequence % self.size]
+        if frame is None or frame.sequence != sequence:
+            return None
+        return frame
+
+    # tells if frame data was not overwritten by newer frames yet
+    def is_valid(self, frame):
+        return self.__frames[frame.sequence % self.size] is frame
+
+    # returns the frame following lastSequence as soon as it is published, waits up to timeout seconds.
+    # Returns None on timeout
+    def wait_next(self, lastSequence, timeout=None):
+        if self.__sequence <= lastSequence:
+            with self.__cond:
+                if timeout is not None:
+                    endTime = time.time() + timeout
+                while self.__sequence <= lastSequence:
+                    if timeout is None:
+                        self.__cond.wait()
+                    else:
+                        remaining = endTime - time.time()
+                        if remaining <= 0:
+                            return None
+                        self.__cond.wait(remaining)
+
+        latestSeq = self.__sequence
+        nextSeq = max(lastSequence + 1, latestSeq - self.maxLag + 1)
+        frame = self.get(nextSeq)
+        if frame is None:
+            frame = self.__latest
+        if lastSequence > 0:
+            self.droppedCount += frame.sequence - lastSequence - 1
+        return frame
+
+    # returns camera frame rate measured over the last frames
+    def fps(self):
+        stamps = list(self.__stamps)
+        if len(stamps) < 2 or stamps[-1] <= stamps[0]:
+            return 0.
+        return (len(stamps) - 1) / (stamps[-1] - stamps[0])
+
+
+# FrameRingBuffer counterpart for the multi-process mode: the grabber publishes from the capture process,
+# other processes read the frames as numpy views of the shared memory, without copying.
+# Storage is allocated for the max frame size, smaller frames use its top left part.
+# Must be created before the processes are started and passed to them as an argument.
+class SharedFrameRingBuffer:
+    # per slot metadata: sequence, timestamp, height, width, region x1, y1, x2, y2 (x1 < 0 - no region)
+    metaSize = 8
+
+    def __init__(self, size=8, maxLag=2, maxWidth=640, maxHeight=480):
+        self.size = size
+        self.maxLag = maxLag
+        self.maxWidth = maxWidth
+        self.maxHeight = maxHeight
+        self.droppedCount = 0
+        self.roiPadding = 0.5
+        self.roiMinMargin = 0.25
+        self.__gray = sharedctypes.RawArray(ctypes.c_uint8, size * maxHeight * maxWidth)
+        self.__color = sharedctypes.RawArray(ctypes.c_uint8, size * maxHeight * maxWidth * 3)
+        self.__meta = sharedctypes.RawArray(ctypes.c_double, size * SharedFrameRingBuffer.metaSize)
+        # latest sequence, converted and total gray pixels
+        self.__counters = sharedctypes.RawArray(ctypes.c_double, 3)
+        # gray conversion region set by the consumer, x1 < 0 - whole frame
+        self.__roi = sharedctypes.RawArray(ctypes.c_int, 4)
+        self.__roi[0] = -1
+        self.__cond = multiprocessing.Condition()
+        self.__create_views()
+
+    # numpy views are process local, they are recreated after the buffer is passed to another process
+    def __create_views(self):
+        self.__grayViews = np.frombuffer(self.__gray, np.uint8).reshape(self.size, self.maxHeight, self.maxWidth)
+        self.__colorViews = np.frombuffer(self.__color, np.uint8).reshape(
+            self.size, self.maxHeight, self.maxWidth, 3)
+        self.__metaView = np.frombuffer(self.__meta, np.float64).reshape(self.size, SharedFrameRingBuffer.metaSize)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('__grayViews', '__colorViews', '__metaView'):
+            del state['_SharedFrameRingBuffer' + name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__create_views()
+
+    # gray conversion region, None - whole frame
+    def __current_roi(self):
+        if self.__roi[0] < 0:
+            return None
+        return tuple(self.__roi)
+
+    # called by the grabber in the capture process
+    def publish(self, bgrImage, timestamp=None):
+        height, width = bgrImage.shape[:2]
+        if width > self.maxWidth or height > self.maxHeight:
+            raise ValueError("Frame %dx%d is bigger than the shared buffer" % (width, height))
+        seq = int(self.__counters[0]) + 1
+        idx = seq % self.size
+        meta = self.__metaView[idx]
+        prevRoi = None if meta[4] < 0 or meta[2] != height or meta[3] != width else tuple(meta[4:].astype(int))
+        # invalidate the slot before overwriting its data
+        meta[0] = -1
+        roi = self.__current_roi()
+        self.__counters[1] += convert_frame(bgrImage, self.__colorViews[idx, :height, :width],
+                                            self.__grayViews[idx, :height, :width], roi, prevRoi != roi)
+        self.__counters[2] += height * width
+        meta[1:4] = time.time() if timestamp is None else timestamp, height, width
+        meta[4:] = roi if roi is not None else (-1, -1, -1, -1)
+        meta[0] = seq
+        # publish
+        self.__counters[0] = seq
+        with self.__cond:
+            self.__cond.notify_all()
+        return self.get(seq)
+
+    # sets the gray conversion region around the face area, see FrameRingBuffer.track_face()
+    def track_face(self, faceArea):
+        latest = self.latest()
+        roi = None
+        if latest is not None:
+            height, width = latest.gray.shape
+            roi = face_roi(faceArea, self.__current_roi(), width, height, self.roiPadding, self.roiMinMargin)
+        if roi == self.__current_roi():
+            return
+        # the region is disabled while its coordinates are written, the grabber never reads a mixed one
+        self.__roi[0] = -1
+        if roi is not None:
+            self.__roi[1], self.__roi[2], self.__roi[3] = roi[1:]
+            self.__roi[0] = roi[0]
+
+    def converted_ratio(self):
+        return self.__counters[1] / self.__counters[2] if self.__counters[2] > 0 else 1.
+
+    def latest(self):
+        seq = int(self.__counters[0])
+        return self.get(seq) if seq > 0 else None
+
+    def get(self, sequence):
+        idx = sequence % self.size
+        meta = self.__metaView[idx]
+        if meta[0] != sequence:
+            return None
+        height, width = int(meta[2]), int(meta[3])
+        roi = None if meta[4] < 0 else tuple(meta[4:].astype(int))
+        grayView = self.__grayViews[idx, :height, :width]
+        grayView.flags.writeable = False
+        colorView = self.__colorViews[idx, :height, :width]
+        colorView.flags.writeable = False
+        frame = Frame(sequence, meta[1], grayView, colorView, roi)
+        # the slot could be overwritten while the metadata was read
+        return frame if self.is_valid(frame) else None
+
+    def is_valid(self, frame):
+        return self.__metaView[frame.sequence % self.size, 0] == frame.sequence
+
+    def wait_next(self, lastSequence, timeout=None):
+        if self.__counters[0] <= lastSequence:
+            with self.__cond:
+                if timeout is not None:
+                    endTime = time.time() + timeout
+                while self.__counters[0] <= lastSequence:
+                    if timeout is None:
+                        self.__cond.wait()
+                    else:
+                        remaining = endTime - time.time()
+                        if remaining <= 0:
+                            return None
+                        self.__cond.wait(remaining)
+
+        latestSeq = int(self.__counters[0])
+        frame = self.get(max(lastSequence + 1, latestSeq - self.maxLag + 1))
+        if frame is None:
+            frame = self.latest()
+            if frame is None:
+                return None
+        if lastSequence > 0:
+            self.droppedCount += frame.sequence - lastSequence - 1
+        return frame
+
+    def fps(self):
+        latestSeq = int(self.__counters[0])
+        stamps = [self.__metaView[seq % self.size, 1] for seq in range(max(1, latestSeq - 5), latestSeq + 1)
+                  if self.__metaView[seq % self.size, 0] == seq]
+        if len(stamps) < 2 or stamps[-1] <= stamps[0]:
+            return 0.
+        return (len(stamps) - 1) / (stamps[-1] - stamps[0])
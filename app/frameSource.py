@@ -0,0 +1,214 @@
+import os
+import time
+from collections import deque
+import cv2
+import numpy as np
+
+
+# base class for all frame sources. Every source defines read(), which mimics cv2.VideoCapture.read()
+# and returns (ok, bgrImage)
+class FrameSource:
+    def __init__(self):
+        # live sources are paced by the device, recorded ones can be replayed at any speed
+        self.isLive = False
+        # nominal frame rate, used to pace recorded sources in real time mode
+        self.fps = 25.
+
+    # changes capture resolution and frame rate, returns False if the source does not support it
+    def set_mode(self, width, height, fps):
+        return False
+
+    def release(self):
+        pass
+
+
+# web camera, or any other device supported by cv2.VideoCapture
+class CameraSource(FrameSource):
+    def __init__(self, deviceId=0, fps=25, width=640, height=480):
+        FrameSource.__init__(self)
+        self.isLive = True
+        self.fps = float(fps)
+        self.__cam = cv2.VideoCapture(deviceId)
+        self.__cam.set(cv2.CAP_PROP_FPS, fps)
+        self.__cam.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.__cam.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+    def read(self):
+        return self.__cam.read()
+
+    def set_mode(self, width, height, fps):
+        self.fps = float(fps)
+        self.__cam.set(cv2.CAP_PROP_FPS, fps)
+        self.__cam.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.__cam.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        return True
+
+    def release(self):
+        self.__cam.release()
+
+
+# recorded video file
+class VideoFileSource(FrameSource):
+    def __init__(self, fileName):
+        FrameSource.__init__(self)
+        if not os.path.isfile(fileName):
+            raise IOError("Video file not found: %s" % fileName)
+        self.__cap = cv2.VideoCapture(fileName)
+        fps = self.__cap.get(cv2.CAP_PROP_FPS)
+        if fps > 0:
+            self.fps = fps
+
+    def read(self):
+        return self.__cap.read()
+
+    def release(self):
+        self.__cap.release()
+
+
+# directory of still images, replayed in file name order
+class ImageDirectorySource(FrameSource):
+    extensions = ('.png', '.jpg', '.jpeg', '.bmp', '.pgm', '.ppm')
+
+    def __init__(self, dirName, fps=25.):
+        FrameSource.__init__(self)
+        self.fps = float(fps)
+        self.__files = [os.path.join(dirName, f) for f in sorted(os.listdir(dirName))
+                        if os.path.splitext(f)[1].lower() in ImageDirectorySource.extensions]
+        self.__idx = 0
+
+    def read(self):
+        if self.__idx >= len(self.__files):
+            return False, None
+        img = cv2.imread(self.__files[self.__idx], cv2.IMREAD_COLOR)
+        self.__idx += 1
+        return img is not None, img
+
+
+# numpy archive with 'frames' array of shape (N, H, W) gray or (N, H, W, 3) BGR and optional 'fps' value
+class NpzSource(FrameSource):
+    def __init__(self, fileName):
+        FrameSource.__init__(self)
+        archive = np.load(fileName)
+        self.__frames = archive['frames']
+        if 'fps' in archive.files:
+            self.fps = float(archive['fps'])
+        self.__idx = 0
+
+    def read(self):
+        if self.__idx >= len(self.__frames):
+            return False, None
+        img = self.__frames[self.__idx]
+        self.__idx += 1
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        return True, img
+
+
+# creates the frame source from a command line style spec: device number, video file, image dir or .npz
+def open_frame_source(spec):
+    if isinstance(spec, int) or str(spec).isdigit():
+        return CameraSource(int(spec))
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec)
+    if spec.lower().endswith('.npz'):
+        return NpzSource(spec)
+    return VideoFileSource(spec)
+
+
+# records up to maxFrames from the source into a compressed .npz archive, returns number of recorded frames
+def record_npz(source, fileName, maxFrames):
+    frames = []
+    while len(frames) < maxFrames:
+        ret, img = source.read()
+        if not ret:
+            break
+        frames.append(img)
+    np.savez_compressed(fileName, frames=np.array(frames), fps=source.fps)
+    return len(frames)
+
+
+# wraps a recorded source and delays read() calls so that frames are delivered at the source frame rate
+class PacedSource(FrameSource):
+    def __init__(self, source):
+        FrameSource.__init__(self)
+        self.isLive = True
+        self.fps = source.fps
+        self.__source = source
+        self.__nextFrameTime = 0.
+
+    def read(self):
+        now = time.time()
+        if self.__nextFrameTime > now:
+            time.sleep(self.__nextFrameTime - now)
+            now = self.__nextFrameTime
+        self.__nextFrameTime = now + 1.0 / self.fps
+        return self.__source.read()
+
+    def release(self):
+        self.__source.release()
+
+
+# chooses the camera resolution from the face size and the frame rate from the measured processing time.
+# The lowest resolution where the face is still big enough for the landmarks and the eye classifier is used,
+# the frame rate is lowered when processing takes most of the frame interval
+class AdaptiveCaptureMode:
+    resolutions = ((320, 240), (640, 480))
+    frameRates = (15, 20, 25, 30)
+
+    def __init__(self, width=640, height=480, fps=25):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        # face width in pixels, below it a higher resolution is used
+        self.minFaceWidth = 100
+        # lower resolution is chosen only if the face stays this much bigger than the min width there
+        self.downscaleMargin = 1.25
+        # processing time relative to the frame interval, above max the frame rate is lowered, below min raised
+        self.maxLoad = 0.8
+        self.minLoad = 0.4
+        # seconds between the mode changes
+        self.switchInterval = 3.
+        self.__faceWidths = deque([], maxlen=30)
+        self.__processingTimes = deque([], maxlen=30)
+        self.__lastSwitch = time.time()
+
+    # adds a processed frame: face width in pixels and processing time in seconds.
+    # Returns the new mode (width, height, fps) when it should be changed, None otherwise.
+    # The current mode changes only when set_applied() reports that the camera took the new one
+    def update(self, faceWidth, processingTime):
+        self.__faceWidths.append(faceWidth)
+        self.__processingTimes.append(processingTime)
+        now = time.time()
+        if now - self.__lastSwitch < self.switchInterval or len(self.__faceWidths) < self.__faceWidths.maxlen:
+            return None
+
+        width, height = self.width, self.height
+        faceWidth = np.median(self.__faceWidths)
+        for w, h in AdaptiveCaptureMode.resolutions:
+            scaledWidth = faceWidth * w / self.width
+            if scaledWidth >= self.minFaceWidth:
+                if w >= self.width or scaledWidth >= self.minFaceWidth * self.downscaleMargin:
+                    width, height = w, h
+                break
+        else:
+            width, height = AdaptiveCaptureMode.resolutions[-1]
+
+        fps = self.fps
+        rates = AdaptiveCaptureMode.frameRates
+        load = np.median(self.__processingTimes) * self.fps
+        if load > self.maxLoad and fps > rates[0]:
+            fps = max(r for r in rates if r < fps)
+        elif load < self.minLoad and fps < rates[-1]:
+            fps = min(r for r in rates if r > fps)
+
+        if (width, height, fps) == (self.width, self.height, self.fps):
+            return None
+        self.__lastSwitch = now
+        return width, height, fps
+
+    # the camera switched to the mode returned by update(), the measurements of the old mode are dropped
+    def set_applied(self, width, height, fps):
+        self.width, self.height, self.fps = width, height, fps
+        self.__faceWidths.clear()
+        self.__processingTimes.clear()
+        self.__lastSwitch = time.time()
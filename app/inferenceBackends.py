@@ -0,0 +1,412 @@
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import numpy as np
+import cv2
+from numpy.lib.stride_tricks import as_strided
+
+
+# Inference engines for the eye state classifier.
+# Every backend takes a float32 batch of shape (N, 1, 32, 32) and returns softmax probabilities of shape (N, 2).
+# Input should be written into the array returned by input_buffer(), this avoids a copy for the caffe backend.
+# Every backend defines forward(data), which runs the classifier and returns the softmax output.
+class InferenceBackend:
+    name = ''
+
+    def __init__(self):
+        self._input = np.zeros((0, 1, 32, 32), np.float32)
+
+    # returns float32 array of shape (n, 1, 32, 32) to write the preprocessed images into
+    def input_buffer(self, n):
+        if self._input.shape[0] != n:
+            self._input = np.zeros((n,) + self._input.shape[1:], np.float32)
+        return self._input
+
+
+# original Caffe net
+class CaffeBackend(InferenceBackend):
+    name = 'caffe'
+
+    def __init__(self, nn_definition_file, nn_weights_file):
+        InferenceBackend.__init__(self)
+        import caffe
+        # we want to use cpu
+        caffe.set_mode_cpu()
+        self.__net = caffe.Net(nn_definition_file, nn_weights_file, caffe.TEST)
+
+    def input_buffer(self, n):
+        dataBlob = self.__net.blobs['data']
+        if dataBlob.data.shape[0] != n:
+            dataBlob.reshape(n, 1, dataBlob.data.shape[2], dataBlob.data.shape[3])
+            self.__net.reshape()
+        return dataBlob.data
+
+    def forward(self, data):
+        dataBlob = self.__net.blobs['data']
+        if data is not dataBlob.data:
+            self.input_buffer(len(data))[...] = data
+        self.__net.forward()
+        return self.__net.blobs['softmax'].data
+
+
+# OpenCV DNN module, reads the same prototxt and caffemodel files
+class OpenCvDnnBackend(InferenceBackend):
+    name = 'opencv'
+
+    def __init__(self, nn_definition_file, nn_weights_file):
+        InferenceBackend.__init__(self)
+        self.__net = cv2.dnn.readNetFromCaffe(nn_definition_file, nn_weights_file)
+        self.__net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.__net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def forward(self, data):
+        self.__net.setInput(data)
+        return self.__net.forward()
+
+
+# reads the protobuf text format file (prototxt) into nested dicts, every field value is a list
+def parse_prototxt(fileName):
+    with open(fileName) as f:
+        text = re.sub(r'#[^\n]*', '', f.read())
+    tokens = re.findall(r'"[^"]*"|[{}:]|[^\s{}:"]+', text)
+    result, pos = _parse_prototxt_block(tokens, 0)
+    return result
+
+
+def _parse_prototxt_block(tokens, pos):
+    block = {}
+    while pos < len(tokens) and tokens[pos] != '}':
+        key = tokens[pos]
+        pos += 1
+        if tokens[pos] == ':':
+            pos += 1
+        if tokens[pos] == '{':
+            value, pos = _parse_prototxt_block(tokens, pos + 1)
+        else:
+            value = _parse_prototxt_value(tokens[pos])
+        pos += 1
+        block.setdefault(key, []).append(value)
+    return block, pos
+
+
+def _parse_prototxt_value(token):
+    if token.startswith('"'):
+        return token[1:-1]
+    for valueType in (int, float):
+        try:
+            return valueType(token)
+        except ValueError:
+            pass
+    return token
+
+
+# returns the single value of the prototxt field or the default one
+def prototxt_field(block, key, default=None):
+    return block[key][0] if key in block else default
+
+
+# loads net layers weights as {layerName: [weights, bias]}, from .npz file or from the caffemodel using OpenCV
+def load_weights(nn_definition_file, nn_weights_file):
+    if nn_weights_file.endswith('.npz'):
+        archive = np.load(nn_weights_file)
+        weights = {}
+        for key in archive.files:
+            layerName, idx = key.rsplit('_', 1)
+            weights.setdefault(layerName, [None, None])[int(idx)] = archive[key].astype(np.float32)
+        return weights
+
+    net = cv2.dnn.readNetFromCaffe(nn_definition_file, nn_weights_file)
+    weights = {}
+    for layer in parse_prototxt(nn_definition_file)['layer']:
+        if layer['type'][0] in ('Convolution', 'InnerProduct'):
+            name = layer['name'][0]
+            weights[name] = [net.getParam(name, 0).astype(np.float32),
+                             net.getParam(name, 1).astype(np.float32).ravel()]
+    return weights
+
+
+# saves weights returned by load_weights() into .npz file usable instead of the caffemodel by the numpy backend
+def save_weights(weights, npzFileName):
+    arrays = {}
+    for name, params in weights.items():
+        for idx, param in enumerate(params):
+            arrays['%s_%d' % (name, idx)] = param
+    np.savez(npzFileName, **arrays)
+
+
+# converted weights of the numpy backend are cached in this directory as .npy files and loaded memory-mapped,
+# so that restarts neither parse the caffemodel nor copy the weights. None disables the cache
+weightsCacheDir = 'classifier/cache'
+
+
+# load_weights() through the cache. The cache entry is named after the model files paths, sizes and modification
+# times, so changed files are converted again. Arrays are read-only memory-mapped views of the cache files
+def load_weights_cached(nn_definition_file, nn_weights_file, cacheDir=None):
+    cacheDir = cacheDir or weightsCacheDir
+    if not cacheDir:
+        return load_weights(nn_definition_file, nn_weights_file)
+    key = hashlib.md5()
+    for fileName in (nn_definition_file, nn_weights_file):
+        stat = os.stat(fileName)
+        key.update('%s %d %d\n' % (os.path.abspath(fileName), stat.st_size, int(stat.st_mtime)))
+    entryDir = os.path.join(cacheDir, '%s_%s' % (os.path.basename(nn_weights_file), key.hexdigest()[:12]))
+    manifestFile = os.path.join(entryDir, 'weights.json')
+    if not os.path.exists(manifestFile):
+        weights = load_weights(nn_definition_file, nn_weights_file)
+        try:
+            _write_weights_cache(weights, entryDir)
+        except (IOError, OSError) as e:
+            print "Weights cache is not written: %s" % e
+        return weights
+    with open(manifestFile) as f:
+        manifest = json.load(f)
+    weights = {}
+    for fileName, layerName, idx in manifest:
+        weights.setdefault(layerName, [None, None])[idx] = np.load(os.path.join(entryDir, fileName), mmap_mode='r')
+    return weights
+
+
+# writes the weights as .npy files and the manifest of (file, layer, index) into a temporary directory first,
+# which is renamed to entryDir, so that other processes never see a partial entry
+def _write_weights_cache(weights, entryDir):
+    tmpDir = '%s.%d.tmp' % (entryDir, os.getpid())
+    if os.path.exists(tmpDir):
+        shutil.rmtree(tmpDir)
+    os.makedirs(tmpDir)
+    manifest = []
+    for layerName in sorted(weights):
+        for idx, param in enumerate(weights[layerName]):
+            fileName = 'p%d.npy' % len(manifest)
+            np.save(os.path.join(tmpDir, fileName), np.ascontiguousarray(param, np.float32))
+            manifest.append((fileName, layerName, idx))
+    with open(os.path.join(tmpDir, 'weights.json'), 'w') as f:
+        json.dump(manifest, f)
+    try:
+        os.rename(tmpDir, entryDir)
+    except OSError:
+        # written by another process meanwhile
+        shutil.rmtree(tmpDir, ignore_errors=True)
+
+
+# conv layer, bias is optional
+def _conv2d(x, w, b, stride, pad):
+    if pad > 0:
+        x = np.pad(x, ((0, 0), (0, 0), (pad, pad), (pad, pad)), 'constant')
+    n, c, h, wd = x.shape
+    f, _, kh, kw = w.shape
+    oh = (h - kh) // stride + 1
+    ow = (wd - kw) // stride + 1
+    s = x.strides
+    cols = as_strided(x, (n, c, kh, kw, oh, ow), (s[0], s[1], s[2], s[3], s[2] * stride, s[3] * stride))
+    out = np.tensordot(w, cols, axes=([1, 2, 3], [1, 2, 3])).transpose(1, 0, 2, 3)
+    if b is not None:
+        out += b[np.newaxis, :, np.newaxis, np.newaxis]
+    return out
+
+
+# fully connected layer, takes transposed weights, bias is optional
+def _inner_product(x, wT, b):
+    out = x.reshape(len(x), -1).dot(wT)
+    if b is not None:
+        out += b
+    return out
+
+
+# max pooling, output size is rounded up as Caffe does
+def _max_pool(x, k, stride):
+    n, c, h, w = x.shape
+    oh = int(math.ceil(float(h - k) / stride)) + 1
+    ow = int(math.ceil(float(w - k) / stride)) + 1
+    padH = (oh - 1) * stride + k - h
+    padW = (ow - 1) * stride + k - w
+    if padH > 0 or padW > 0:
+        padValue = -np.inf if x.dtype.kind == 'f' else np.iinfo(x.dtype).min
+        x = np.pad(x, ((0, 0), (0, 0), (0, padH), (0, padW)), 'constant', constant_values=padValue)
+    # maximum over k*k shifted strided views is much faster than a reduction over the window axes
+    out = None
+    for i in range(k):
+        for j in range(k):
+            shifted = x[:, :, i:i + (oh - 1) * stride + 1:stride, j:j + (ow - 1) * stride + 1:stride]
+            if out is None:
+                out = shifted.copy()
+            else:
+                np.maximum(out, shifted, out=out)
+    return out
+
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+# reads the layer stack from the prototxt as a list of dicts with 'name', 'type' and layer parameters.
+# Only the layer types of the eye state classifier are supported
+def read_layers(nn_definition_file):
+    layers = []
+    for layer in parse_prototxt(nn_definition_file)['layer']:
+        layerType = layer['type'][0]
+        desc = {'name': layer['name'][0], 'type': layerType}
+        if layerType == 'Convolution':
+            param = prototxt_field(layer, 'convolution_param', {})
+            desc['stride'] = prototxt_field(param, 'stride', 1)
+            desc['pad'] = prototxt_field(param, 'pad', 0)
+        elif layerType == 'Pooling':
+            param = prototxt_field(layer, 'pooling_param', {})
+            if prototxt_field(param, 'pool', 'MAX') != 'MAX':
+                raise ValueError('Only MAX pooling is supported, layer %s' % desc['name'])
+            desc['kernel'] = prototxt_field(param, 'kernel_size')
+            desc['stride'] = prototxt_field(param, 'stride', 1)
+        elif layerType not in ('Input', 'ReLU', 'InnerProduct', 'Softmax'):
+            raise ValueError('Unsupported layer type %s' % layerType)
+        layers.append(desc)
+    return layers
+
+
+# dependency free implementation of the conv/pool/fc/softmax layer stack described in the prototxt
+class NumpyBackend(InferenceBackend):
+    name = 'numpy'
+
+    def __init__(self, nn_definition_file, nn_weights_file):
+        InferenceBackend.__init__(self)
+        weights = load_weights_cached(nn_definition_file, nn_weights_file)
+        # list of (function, arguments) applied one by one
+        self.__layers = []
+        for layer in read_layers(nn_definition_file):
+            if layer['type'] == 'Convolution':
+                self.__layers.append((_conv2d, weights[layer['name']] + [layer['stride'], layer['pad']]))
+            elif layer['type'] == 'ReLU':
+                self.__layers.append((_relu, []))
+            elif layer['type'] == 'Pooling':
+                self.__layers.append((_max_pool, [layer['kernel'], layer['stride']]))
+            elif layer['type'] == 'InnerProduct':
+                w, b = weights[layer['name']]
+                self.__layers.append((_inner_product, [w.T.copy(), b]))
+            elif layer['type'] == 'Softmax':
+                self.__layers.append((_softmax, []))
+
+    def forward(self, data):
+        x = data
+        for func, args in self.__layers:
+            x = func(x, *args)
+        return x
+
+
+# Quantizes the float model to int8: ReLUs are folded into the preceding conv/fc layers,
+# weights are quantized symmetrically per output channel, activations per tensor with scales calibrated
+# on the given batch of preprocessed eye images (N, 1, 32, 32). Outputs of the folded ReLUs are non-negative
+# and stored as uint8, the network input as int8. The last layer output stays float for the softmax.
+# clipPercentile below 100 ignores activation outliers when calibrating. Returns arrays for the .npz file
+def quantize_model(nn_definition_file, nn_weights_file, calibrationData, clipPercentile=99.99):
+    weights = load_weights(nn_definition_file, nn_weights_file)
+    layers = read_layers(nn_definition_file)
+    model = {}
+    x = calibrationData.astype(np.float32)
+    inputScale = np.percentile(np.abs(x), clipPercentile) / 127.
+    model['input_scale'] = np.float32(inputScale)
+    for idx, layer in enumerate(layers):
+        name = layer['name']
+        if layer['type'] == 'Convolution':
+            x = _conv2d(x, weights[name][0], weights[name][1], layer['stride'], layer['pad'])
+        elif layer['type'] == 'InnerProduct':
+            x = _inner_product(x, weights[name][0].T, weights[name][1])
+        elif layer['type'] == 'ReLU':
+            x = _relu(x)
+        elif layer['type'] == 'Pooling':
+            x = _max_pool(x, layer['kernel'], layer['stride'])
+        if layer['type'] in ('Convolution', 'InnerProduct'):
+            w, b = weights[name]
+            wScale = np.abs(w.reshape(len(w), -1)).max(axis=1) / 127.
+            wScale[wScale == 0] = 1.
+            model[name + '_w'] = np.round(w / wScale.reshape((-1,) + (1,) * (w.ndim - 1))).astype(np.int8)
+            model[name + '_wscale'] = wScale.astype(np.float32)
+            model[name + '_b'] = b.astype(np.float32)
+            isFolded = idx + 1 < len(layers) and layers[idx + 1]['type'] == 'ReLU'
+            model[name + '_relu'] = np.bool_(isFolded)
+            if isFolded:
+                # ReLU output range, calibrated after the ReLU is applied
+                model[name + '_oscale'] = np.float32(max(np.percentile(np.maximum(x, 0), clipPercentile), 1e-6) / 255.)
+    return model
+
+
+# reshapes per channel values to broadcast over (N, C, ...) accumulator
+def _channel_broadcast(values, acc):
+    return values.reshape((1, -1) + (1,) * (acc.ndim - 2))
+
+
+# integer conv/fc with the folded ReLU, returns uint8 activations
+def _requantized(x, func, args, multiplier, bias):
+    acc = func(x.astype(np.float32), *args)
+    acc *= _channel_broadcast(multiplier, acc)
+    acc += _channel_broadcast(bias, acc)
+    return np.clip(np.rint(acc), 0, 255).astype(np.uint8)
+
+
+# integer conv/fc returning float output
+def _dequantized(x, func, args, multiplier, bias):
+    acc = func(x.astype(np.float32), *args)
+    return acc * _channel_broadcast(multiplier, acc) + _channel_broadcast(bias, acc)
+
+
+# runs the model made by quantize_model(), for the accuracy report of quantizeClassifier.py. Weights and folded
+# conv/fc + ReLU outputs are integers, pooling works directly on uint8 activations. NumPy has no int8 matrix
+# product, so the integer accumulation is done by float32 BLAS on integer valued operands. Sums beyond 2^24 may
+# round, which is far below the quantization step after requantization.
+# This is no faster than the float numpy backend, so it is not one of the runtime backends of create_backend()
+class Int8Backend(InferenceBackend):
+    name = 'int8'
+
+    def __init__(self, nn_definition_file, nn_weights_file):
+        InferenceBackend.__init__(self)
+        model = np.load(nn_weights_file)
+        self.__inputScale = float(model['input_scale'])
+        # list of (function, arguments) applied one by one
+        self.__layers = []
+        scale = self.__inputScale
+        for layer in read_layers(nn_definition_file):
+            name = layer['name']
+            if layer['type'] in ('Convolution', 'InnerProduct'):
+                w = model[name + '_w'].astype(np.float32)
+                if layer['type'] == 'InnerProduct':
+                    w = w.reshape(len(w), -1).T.copy()
+                    func = _inner_product
+                    args = [w, None]
+                else:
+                    func = _conv2d
+                    args = [w, None, layer['stride'], layer['pad']]
+                multiplier = (scale * model[name + '_wscale']).astype(np.float32)
+                bias = model[name + '_b']
+                if bool(model[name + '_relu']):
+                    outScale = float(model[name + '_oscale'])
+                    self.__layers.append((_requantized, [func, args, multiplier / outScale, bias / outScale]))
+                    scale = outScale
+                else:
+                    self.__layers.append((_dequantized, [func, args, multiplier, bias]))
+            elif layer['type'] == 'Pooling':
+                self.__layers.append((_max_pool, [layer['kernel'], layer['stride']]))
+            elif layer['type'] == 'Softmax':
+                self.__layers.append((_softmax, []))
+
+    def forward(self, data):
+        x = np.clip(np.rint(data / self.__inputScale), -127, 127).astype(np.int8)
+        for func, args in self.__layers:
+            x = func(x, *args)
+        return x
+
+
+backends = {CaffeBackend.name: CaffeBackend,
+            OpenCvDnnBackend.name: OpenCvDnnBackend,
+            NumpyBackend.name: NumpyBackend}
+
+
+# creates the inference backend by its name: 'caffe', 'opencv' or 'numpy'
+def create_backend(name, nn_definition_file, nn_weights_file):
+    if name not in backends:
+        raise ValueError('Unknown inference backend %s, expected one of: %s' % (name, ', '.join(sorted(backends))))
+    return backends[name](nn_definition_file, nn_weights_file)
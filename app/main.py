@@ -1,137 +1,484 @@
-__author__ = "Roman Semenyk"
-__copyright__ = "Copyright 2017, VirtualMousePad"
-__license__ = "GPLv3"
-__version__ = "1.0.0"
-__email__ = "r.semenyk(at)gmail.com"
-
-import os
-import cv2
-import time
-import numpy as np
-import utils as u
-import threading
-import mouseAndKeyboard as mouse
-
-# paths & constants
-landmarks_fn = './classifier/shape_predictor_68_face_landmarks.dat'
-if not os.path.exists(landmarks_fn):
-    print "Please copy 'shape_predictor_68_face_landmarks.dat' from D-lib python_examples to ./classifier folder."
-    print "You can download the file here:"
-    print "http://dlib.net/files/shape_predictor_68_face_landmarks.dat.bz2"
-    exit()
-nn_definition_file = 'classifier/model_deploy.prototxt'
-nn_weights_file = 'classifier/model_weights_97.22.caffemodel'
-
-from collections import deque
-from faceDetector import FaceAndMovementDetector
-from blinkDetector import BlinkDetector
-from motionAndBlinkAnalyzer import MotionAndBlinkAnalyzer
-from motionAndBlinkAnalyzer import BlinkEvent
-
-
-# globals
-fd = FaceAndMovementDetector(landmarks_fn)
-bd = BlinkDetector(nn_definition_file, nn_weights_file)
-ma = MotionAndBlinkAnalyzer()
-imgContainer = {'gray': None, 'prev': None, 'vis': None}
-showHelpPopup = True
-mouseCaptureEnabled = False
-
-
-# method to grab frames from the web camera and show FPS
-stopFlag = False
-def grab_frames():
-    fpsQ = deque([], maxlen=5)
-    lastFrameMs = int(round(time.time() * 1000))
-
-    cam = cv2.VideoCapture(0)
-    cam.set(cv2.CAP_PROP_FPS, 25)
-    cam.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cam.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-    while not stopFlag:
-        ret, img = cam.read()
-        imgContainer['prev'] = imgContainer['gray']
-        flipped = cv2.flip(img, 1)
-        imgContainer['gray'] = cv2.cvtColor(flipped, cv2.COLOR_BGR2GRAY)
-        imgContainer['vis'] = flipped
-        # draw FPS
-        nowMs = int(round(time.time() * 1000))
-        fpsQ.append(int(round(1000 / (nowMs - lastFrameMs + 1))))
-        lastFrameMs = nowMs
-        cv2.putText(flipped, 'cam FPS: %.0f' % np.mean(fpsQ), (25, 25), cv2.FONT_HERSHEY_COMPLEX, 1, 255)
-
-
-# start the web cam grabber in separate thread
-thread = threading.Thread(target=grab_frames)
-thread.daemon = True
-thread.start()
-# wait for the first frame
-while imgContainer['vis'] is None:
-    time.sleep(0.05)
-
-# start async face detector
-fd.start_detect_face_async(image_container=imgContainer)
-
-if showHelpPopup:
-    u.showHelpMessageBox("Welcome Note")
-    mouse.center_mouse()
-
-# main loop
-# regardless of camera actual frame rate, the processing loop is maintained at 30 FPS
-# this allows smooth mouse moves even on low cam FPS. This approach should be optimized in future.
-lastFaceDetectionTs = 0
-while True:
-    startTime = time.time()
-    vis = imgContainer['vis']
-
-    if fd.isFaceDetected and fd.lastResultStamp != lastFaceDetectionTs:
-        lastFaceDetectionTs = fd.lastResultStamp
-        u.draw_rects(vis, [fd.detectedFaceArea], (0, 255, 0))
-
-    if int(round(time.time() * 1000)) - lastFaceDetectionTs > 20000:
-        lastFaceDetectionTs = 0
-
-    if lastFaceDetectionTs > 0:
-        relMove = fd.get_relative_motion(imgContainer['gray'], imgContainer['prev'])
-        relMoveFiltered = ma.get_mouse_pointer_move(relMove[0], relMove[1])
-        blinkEvent = BlinkEvent.NoBlink
-        # check state only if mouse is not moving
-        if u.distance(relMoveFiltered, [0, 0]) < 5:
-            lblink, rblink = bd.predict_states(imgContainer['gray'], fd.detectedEyeAreas[0], fd.detectedEyeAreas[1])
-            blinkEvent = ma.analyze_blink_event((lblink, rblink))
-
-        if mouseCaptureEnabled:
-            mouse.move_mouse_pointer(relMoveFiltered[0], relMoveFiltered[1])
-            if blinkEvent != BlinkEvent.NoBlink:
-                mouse.blink_event_to_action(blinkEvent)
-        else:
-            cv2.putText(vis, 'press \'z\' to toggle mouse capture', (20, 220), cv2.FONT_HERSHEY_COMPLEX, 1, 255)
-
-        # visualise
-        u.draw_rects(vis, fd.detectedEyeAreas)
-        u.draw_points(vis, fd.trackedPoint)
-        u.draw_blink_event(vis, blinkEvent)
-    else:
-        cv2.putText(vis, 'detecting face', (210, 460), cv2.FONT_HERSHEY_COMPLEX, 1, 255)
-
-    cv2.imshow('Preview', vis)
-
-    endTime = time.time()
-    # print "Processing delay ", int(round((endTime - startTime) * 1000)), " ms"
-
-    # limit processing speed up to 30 FPS
-    if endTime - startTime < 0.032:
-        time.sleep(0.032 - (endTime - startTime))
-
-    key = cv2.waitKey(2)
-    if key == 27:
-        break
-    elif key == ord('z'):
-        mouseCaptureEnabled = not mouseCaptureEnabled
-
-# stop all
-cv2.destroyAllWindows()
-stopFlag = True
-fd.stop()
-thread.join(3)
-os._exit(0)
+__author__ = "Roman Semenyk"
+__copyright__ = "Copyright 2017, VirtualMousePad"
+__license__ = "GPLv3"
+__version__ = "1.0.0"
+__email__ = "r.semenyk(at)gmail.com"
+
+import time
+# time to the first pointer move is measured from here
+startupTime = time.time()
+import os
+import sys
+import cv2
+import utils as u
+import threading
+import mouseAndKeyboard as mouse
+
+# paths & constants
+landmarks_fn = './classifier/shape_predictor_68_face_landmarks.dat'
+if not os.path.exists(landmarks_fn):
+    print "Please copy 'shape_predictor_68_face_landmarks.dat' from D-lib python_examples to ./classifier folder."
+    print "You can download the file here:"
+    print "http://dlib.net/files/shape_predictor_68_face_landmarks.dat.bz2"
+    exit()
+nn_definition_file = 'classifier/model_deploy.prototxt'
+nn_weights_file = 'classifier/model_weights_97.22.caffemodel'
+# eye state classifier inference backend: 'opencv' (OpenCV DNN), 'numpy' (no dependencies) or 'caffe'
+nn_backend = 'opencv'
+# classify eye states in a background thread, so that the pointer never waits for the classifier
+asyncBlinkDetection = True
+# capture, face detection and eye state classification run in separate processes, to use more CPU cores.
+# Relies on fork, not supported on Windows
+useProcesses = False
+if useProcesses and sys.platform == 'win32':
+    print "Multi-process mode is not supported on Windows, using threads."
+    useProcesses = False
+# track all the faces in view, e.g. on a shared workstation. One user controls the pointer, digit keys or
+# the control API hand the control over. Runs with threads, the region of interest and the adaptive capture are off.
+# The eyes of all the faces are classified synchronously, in one batch per frame, without the eye image cache
+multiFaceEnabled = False
+if multiFaceEnabled:
+    useProcesses = False
+
+from faceDetector import FaceAndMovementDetector
+from blinkDetector import BlinkDetector
+from motionAndBlinkAnalyzer import MotionAndBlinkAnalyzer
+from motionAndBlinkAnalyzer import BlinkEvent
+from frameSource import open_frame_source, PacedSource, AdaptiveCaptureMode
+from frameBuffer import FrameRingBuffer, SharedFrameRingBuffer
+from pipeline import FrameProcessor
+from processPipeline import CaptureProcess, FaceDetectionProcess
+from pointerOutput import PointerOutput
+from metrics import StageTimings, GilMonitor, MetricsLogger
+from controlServer import ControlServer, bool_field, number_field, int_field
+from backgroundLoader import BackgroundLoader
+from analyzerTrace import TraceWriter
+from multiFaceTracker import MultiFaceTracker
+
+
+# globals
+# the face detector is created after the camera is opened, the landmarks and the classifier are loaded
+# in the background meanwhile. The frame processor starts when they are ready
+fd = None
+bd = None
+processor = None
+tracker = None
+ma = MotionAndBlinkAnalyzer()
+# stage durations of all the threads, the last samples only
+timings = StageTimings(maxSamples=3000)
+loader = BackgroundLoader(timings)
+# metrics overlay on the preview is toggled with 'm' key, log line is printed every metricsLogInterval seconds
+# (0 - never), metrics are saved on exit if metricsFile is set ('.json' or '.csv')
+metricsOverlayEnabled = False
+metricsLogInterval = 10.
+metricsFile = None
+metricsLogger = MetricsLogger(timings, metricsLogInterval)
+gilMonitor = GilMonitor(timings)
+frameBuffer = SharedFrameRingBuffer() if useProcesses else FrameRingBuffer()
+showHelpPopup = True
+# mouse input backend: 'pymouse' (any OS), 'xtest' (X11, relative moves without position queries) or 'null'
+inputBackend = 'pymouse'
+mouseCaptureEnabled = False
+# pointer moves of the frames are spread over time and output at this rate (Hz), independent of the camera FPS
+interpolationEnabled = True
+pointerOutputRate = 120
+pointerOutput = PointerOutput(mouse.move_mouse_pointer, pointerOutputRate)
+ma.subPixelMoves = interpolationEnabled
+# the analyzer inputs and outputs are appended to this trace file for the offline replay (replayTrace.py)
+traceFile = None
+# once the face is found, only the region around it is processed
+roiEnabled = True
+# camera resolution and frame rate follow the face size and the processing time
+adaptiveCaptureEnabled = True
+captureMode = AdaptiveCaptureMode()
+# mode requested by adapt_capture() for the grabber, and (mode, True if the source took it) set by the grabber
+requestedCaptureMode = None
+captureModeResult = None
+# the camera mode adapts on live sources only, recorded ones can't change it. Set when the source is open
+sourceIsLive = False
+if multiFaceEnabled:
+    roiEnabled = False
+    adaptiveCaptureEnabled = False
+
+
+# headless service mode: no preview window, no drawing and no help popup, the pointer is controlled right away.
+# Capture is toggled and settings are changed through the control API instead of the keyboard
+headless = False
+# local control API port on 127.0.0.1 (0 - disabled), see controlServer.py
+controlPort = 0
+# pointer settings, changed through the control API
+pointerSettings = {'sensitivity': 25, 'smoothness': 10., 'acceleration': 3}
+quitRequested = False
+
+# usage: main.py [frame source] [--headless] [--control-port PORT]
+# frames are taken from the web camera by default. Recorded session (video, image dir or .npz) can be passed instead
+frameSourceSpec = 0
+args = sys.argv[1:]
+while args:
+    arg = args.pop(0)
+    if arg == '--headless':
+        headless = True
+    elif arg == '--control-port':
+        controlPort = int(args.pop(0))
+    else:
+        frameSourceSpec = arg
+if headless:
+    showHelpPopup = False
+    mouseCaptureEnabled = True
+
+
+# method to grab frames from the frame source into the frame buffer
+stopFlag = False
+def grab_frames():
+    global requestedCaptureMode, captureModeResult, sourceIsLive
+    cam = open_frame_source(frameSourceSpec)
+    sourceIsLive = cam.isLive
+    if not cam.isLive:
+        cam = PacedSource(cam)
+    while not stopFlag:
+        if requestedCaptureMode is not None:
+            mode = requestedCaptureMode
+            requestedCaptureMode = None
+            captureModeResult = (mode, cam.set_mode(*mode))
+        ret, img = cam.read()
+        if not ret:
+            time.sleep(0.01)
+            continue
+        frameBuffer.publish(img)
+    cam.release()
+
+
+# start the web cam grabber in separate thread or process
+if useProcesses:
+    captureProcess = CaptureProcess(frameSourceSpec, frameBuffer)
+    captureProcess.start()
+else:
+    thread = threading.Thread(target=grab_frames)
+    thread.daemon = True
+    thread.start()
+# the face detection and the classifier processes are forked before any thread starts.
+# The classifier process loads its own model, the main process does not load one
+if useProcesses:
+    faceDetectionProcess = FaceDetectionProcess(frameBuffer)
+    faceDetectionProcess.start()
+    bd = BlinkDetector(nn_definition_file, nn_weights_file, nn_backend, loadModel=False)
+    bd.start_async(timings=timings, useProcess=True)
+
+# the models load while the camera opens and the face is searched
+if not useProcesses:
+    loader.add('classifier', BlinkDetector, nn_definition_file, nn_weights_file, nn_backend)
+fd = FaceAndMovementDetector(None)
+fd.timings = timings
+loader.add('landmarks', fd.load_landmarks, landmarks_fn)
+
+# wait for the first frame
+while frameBuffer.latest() is None:
+    time.sleep(0.01)
+timings.add('startup to first frame', time.time() - startupTime)
+
+# start async face detector, the multi-face tracker starts its own when the models are loaded
+if not useProcesses and not multiFaceEnabled:
+    fd.start_detect_face_async(frame_buffer=frameBuffer)
+
+mouse.start(inputBackend).timings = timings
+gilMonitor.start()
+if interpolationEnabled:
+    pointerOutput.start()
+if showHelpPopup:
+    u.showHelpMessageBox("Welcome Note")
+    mouse.center_mouse()
+
+
+# control API requests, called from the connection threads. Returns the response dict
+def handle_control(request):
+    global mouseCaptureEnabled, quitRequested
+    cmd = request['cmd']
+    if cmd == 'capture':
+        mouseCaptureEnabled = bool_field(request, 'enabled')
+        pointerOutput.clear()
+    elif cmd == 'sensitivity':
+        pointerSettings['sensitivity'] = min(max(number_field(request, 'value'), 0.), 50.)
+        for analyzer in all_analyzers():
+            analyzer.set_sensitivity(pointerSettings['sensitivity'])
+    elif cmd == 'smoothness':
+        pointerSettings['smoothness'] = min(max(number_field(request, 'value'), 2.), 20.)
+        for analyzer in all_analyzers():
+            analyzer.set_smoothness(pointerSettings['smoothness'])
+    elif cmd == 'acceleration':
+        pointerSettings['acceleration'] = min(max(int_field(request, 'value'), 0), 5)
+        for analyzer in all_analyzers():
+            analyzer.set_acceleration_level(pointerSettings['acceleration'])
+    elif cmd == 'user':
+        if tracker is None or not tracker.set_active_track(int_field(request, 'id')):
+            raise ValueError('no tracked user %s' % request['id'])
+        pointerOutput.clear()
+    elif cmd == 'metrics':
+        return {'metrics': timings.summary(), 'counters': dict(timings.counters)}
+    elif cmd == 'quit':
+        quitRequested = True
+    elif cmd != 'status':
+        raise ValueError('unknown command %s' % cmd)
+    status = {'capture': mouseCaptureEnabled, 'faceDetected': fd.isFaceDetected, 'fps': frameBuffer.fps(),
+              'settings': pointerSettings}
+    if tracker is not None:
+        status['faceDetected'] = len(tracker.tracks) > 0
+        status['users'] = [track.trackId for track in tracker.tracks]
+        status['activeUser'] = tracker.activeTrackId
+    return status
+
+
+# pointer analyzers of the single user and of the tracked faces
+def all_analyzers():
+    return [ma] + ([track.ma for track in tracker.tracks] if tracker is not None else [])
+
+
+# analyzer for a new face of the multi-face tracker, with the current pointer settings
+def new_analyzer():
+    analyzer = MotionAndBlinkAnalyzer()
+    analyzer.subPixelMoves = interpolationEnabled
+    analyzer.set_sensitivity(pointerSettings['sensitivity'])
+    analyzer.set_smoothness(pointerSettings['smoothness'])
+    analyzer.set_acceleration_level(pointerSettings['acceleration'])
+    return analyzer
+
+
+controlServer = None
+if controlPort:
+    controlServer = ControlServer(handle_control, controlPort)
+    controlServer.start()
+    print "Control API listening on %s:%d" % (controlServer.host, controlServer.port)
+
+
+# creates the frame processor once the background loading is done. Returns True if it is ready
+def start_processing():
+    global bd, processor, tracker
+    if processor is not None:
+        return True
+    if (bd is None and not loader.is_done('classifier')) or not loader.is_done('landmarks'):
+        return False
+    loader.get('landmarks')
+    if bd is None:
+        bd = loader.get('classifier')
+        # the multi-face tracker classifies synchronously, the worker would stay idle
+        if asyncBlinkDetection and not multiFaceEnabled:
+            bd.start_async(timings=timings)
+    if multiFaceEnabled:
+        tracker = MultiFaceTracker(fd, bd, timings, new_analyzer)
+        tracker.start_detect_faces_async(frameBuffer)
+    processor = FrameProcessor(fd, bd, ma, timings)
+    if traceFile:
+        processor.trace = TraceWriter(traceFile)
+    return True
+
+
+# moves the gray conversion region with the face and adapts the camera mode to the face size and processing time.
+# The mode is applied by the grabber, the face detector is reset when the frames of the new resolution come
+def adapt_capture(processingTime):
+    global requestedCaptureMode, captureModeResult
+    if roiEnabled:
+        frameBuffer.track_face(fd.current_face_area() if fd.isFaceDetected else None)
+    if useProcesses:
+        result = captureProcess.mode_result()
+    else:
+        result, captureModeResult = captureModeResult, None
+    if result is not None and result[1]:
+        captureMode.set_applied(*result[0])
+    isLive = captureProcess.is_live() if useProcesses else sourceIsLive
+    if not adaptiveCaptureEnabled or not isLive or not fd.isFaceDetected:
+        return
+    x1, y1, x2, y2 = fd.detectedFaceArea
+    mode = captureMode.update(x2 - x1, processingTime)
+    if mode is None:
+        return
+    if useProcesses:
+        captureProcess.set_mode(*mode)
+    else:
+        requestedCaptureMode = mode
+
+
+# sends the pointer move and the blink event actions to the mouse if the capture is enabled
+def output_move(relMoveFiltered, blinkEvents, frameStamp):
+    global firstMoveTime
+    # the first pointer move is computed, whether the capture is enabled or not
+    if firstMoveTime is None and (relMoveFiltered[0] != 0 or relMoveFiltered[1] != 0):
+        firstMoveTime = time.time()
+        timings.add('startup to first move', firstMoveTime - startupTime)
+        print "First pointer move %.2f s after the start" % (firstMoveTime - startupTime)
+    if not mouseCaptureEnabled:
+        return
+    if interpolationEnabled:
+        pointerOutput.add_move(relMoveFiltered[0], relMoveFiltered[1], frameStamp)
+    else:
+        mouse.move_mouse_pointer(relMoveFiltered[0], relMoveFiltered[1])
+    for blinkEvent in blinkEvents:
+        mouse.blink_event_to_action(blinkEvent)
+
+
+# streams the blink events to the control API subscribers. userId is the multi-face track id
+def publish_events(blinkEvents, frameStamp, userId=None):
+    if controlServer is None or not controlServer.has_subscribers():
+        return
+    for blinkEvent in blinkEvents:
+        message = {'event': BlinkEvent.blink_event_to_text(blinkEvent), 'stamp': frameStamp,
+                   'capture': mouseCaptureEnabled}
+        if userId is not None:
+            message['user'] = userId
+        controlServer.publish(message)
+
+
+# multi-face mode: every tracked face is processed, the active user moves the pointer
+def process_faces(frame, prevFrame, vis):
+    results = []
+    if start_processing():
+        results = tracker.process(frame.gray, prevFrame.gray, frame.timestamp)
+    if results:
+        timings.add('frame to move', time.time() - frame.timestamp)
+    for track, relMoveFiltered, blinkEvents in results:
+        isActive = track.trackId == tracker.activeTrackId
+        if isActive:
+            output_move(relMoveFiltered, blinkEvents, frame.timestamp)
+        publish_events(blinkEvents, frame.timestamp, track.trackId)
+        if vis is not None:
+            x1, y1, x2, y2 = track.fd.current_face_area()
+            u.draw_rects(vis, [(x1, y1, x2, y2)], (0, 255, 0) if isActive else (0, 160, 255))
+            u.draw_rects(vis, track.fd.detectedEyeAreas)
+            cv2.putText(vis, '%d' % track.trackId, (x1, y1 - 5), cv2.FONT_HERSHEY_COMPLEX, 1, 255)
+            # events of every user are drawn under its face
+            u.draw_blink_event(vis, blinkEvents[-1] if blinkEvents else BlinkEvent.NoBlink, key=track.trackId,
+                               origin=(x1, min(y2 + 30, vis.shape[0] - 10)))
+
+    if vis is None:
+        return
+    if not results:
+        cv2.putText(vis, 'detecting faces' if processor is not None else 'loading models', (210, 460),
+                    cv2.FONT_HERSHEY_COMPLEX, 1, 255)
+    elif not mouseCaptureEnabled:
+        cv2.putText(vis, 'press \'z\' to toggle mouse capture', (20, 220), cv2.FONT_HERSHEY_COMPLEX, 1, 255)
+    if metricsOverlayEnabled:
+        u.draw_text_lines(vis, metricsLogger.lines)
+    cv2.imshow('Preview', vis)
+
+
+# processes the frame, moves the pointer and draws the results on the preview image
+def process_frame(frame, prevFrame):
+    global lastFaceDetectionTs
+    # frame images are shared with other threads, draw on a copy. Nothing is drawn in the headless mode
+    vis = None
+    if not headless:
+        vis = frame.color.copy()
+        cv2.putText(vis, 'cam FPS: %.0f' % frameBuffer.fps(), (25, 25), cv2.FONT_HERSHEY_COMPLEX, 1, 255)
+    if multiFaceEnabled:
+        process_faces(frame, prevFrame, vis)
+        return
+
+    if fd.isFaceDetected and fd.detectionFrameShape != frame.gray.shape:
+        # the camera switched the resolution, face coordinates are not valid on the new frames
+        fd.reset()
+        frameBuffer.track_face(None)
+        lastFaceDetectionTs = 0
+    if fd.isFaceDetected and fd.lastResultStamp != lastFaceDetectionTs:
+        lastFaceDetectionTs = fd.lastResultStamp
+        if vis is not None:
+            u.draw_rects(vis, [fd.detectedFaceArea], (0, 255, 0))
+
+    if int(round(time.time() * 1000)) - lastFaceDetectionTs > 20000:
+        lastFaceDetectionTs = 0
+
+    if lastFaceDetectionTs > 0 and fd.detectionFrameShape == frame.gray.shape and start_processing():
+        processingStart = time.time()
+        relMoveFiltered, blinkEvents = processor.process(frame.gray, prevFrame.gray, frame.timestamp)
+        adapt_capture(time.time() - processingStart)
+        timings.add('frame to move', time.time() - frame.timestamp)
+        output_move(relMoveFiltered, blinkEvents, frame.timestamp)
+        if not mouseCaptureEnabled and vis is not None:
+            cv2.putText(vis, 'press \'z\' to toggle mouse capture', (20, 220), cv2.FONT_HERSHEY_COMPLEX, 1, 255)
+        publish_events(blinkEvents, frame.timestamp)
+
+        if vis is None:
+            return
+        # visualise
+        u.draw_rects(vis, fd.detectedEyeAreas)
+        u.draw_points(vis, fd.motionPoints, (0, 200, 255), 1)
+        u.draw_points(vis, fd.trackedPoint)
+        u.draw_blink_event(vis, blinkEvents[-1] if blinkEvents else BlinkEvent.NoBlink)
+    elif vis is not None:
+        cv2.putText(vis, 'detecting face' if processor is not None else 'loading models', (210, 460),
+                    cv2.FONT_HERSHEY_COMPLEX, 1, 255)
+
+    if vis is None:
+        return
+    if metricsOverlayEnabled:
+        u.draw_text_lines(vis, metricsLogger.lines)
+    cv2.imshow('Preview', vis)
+
+
+# main loop
+# every camera frame is processed once, as soon as the grabber hands it over.
+# Between frames the pointer output moves the pointer, this allows smooth mouse moves even on low cam FPS.
+lastFaceDetectionTs = 0
+lastMetricsPublish = 0.
+firstMoveTime = None
+prevFrame = None
+# the trace is closed on any exit from the loop, so that Ctrl-C or an error does not lose the buffered records
+try:
+    while not quitRequested:
+        if useProcesses:
+            faceDetectionProcess.update(fd)
+        frame = frameBuffer.wait_next(prevFrame.sequence if prevFrame else 0, 0.1)
+        if frame is not None:
+            # optical flow is calculated against the last processed frame, even if some frames were dropped.
+            # If its data was overwritten meanwhile, the motion of this frame is skipped
+            if prevFrame is None or not frameBuffer.is_valid(prevFrame) or prevFrame.gray.shape != frame.gray.shape:
+                prevFrame = frame
+            process_frame(frame, prevFrame)
+            prevFrame = frame
+        timings.set_count('dropped frames', frameBuffer.droppedCount)
+        if bd is not None:
+            timings.set_count('dropped blink requests', bd.dropped_count())
+            timings.set_count('failed blink requests', bd.failedCount)
+        metricsLogger.update()
+        # metrics stream of the control API, once per second
+        if controlServer is not None and controlServer.has_subscribers() and time.time() - lastMetricsPublish >= 1.:
+            lastMetricsPublish = time.time()
+            controlServer.publish({'metrics': timings.summary(), 'counters': dict(timings.counters)})
+
+        if headless:
+            continue
+        key = cv2.waitKey(1)
+        if key == 27:
+            break
+        elif key == ord('z'):
+            mouseCaptureEnabled = not mouseCaptureEnabled
+            pointerOutput.clear()
+        elif key == ord('m'):
+            metricsOverlayEnabled = not metricsOverlayEnabled
+        elif ord('1') <= key <= ord('9') and tracker is not None:
+            # hand the pointer control to the user with this track id
+            if tracker.set_active_track(key - ord('0')):
+                pointerOutput.clear()
+finally:
+    if processor is not None and processor.trace is not None:
+        processor.trace.close()
+
+# stop all
+if not headless:
+    cv2.destroyAllWindows()
+if controlServer is not None:
+    controlServer.stop()
+stopFlag = True
+gilMonitor.stop()
+if metricsFile:
+    timings.save(metricsFile)
+pointerOutput.stop()
+mouse.stop()
+if bd is not None:
+    bd.stop_async()
+if tracker is not None:
+    tracker.stop()
+if useProcesses:
+    faceDetectionProcess.stop()
+    captureProcess.stop()
+else:
+    fd.stop()
+    thread.join(3)
+os._exit(0)
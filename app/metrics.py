@@ -0,0 +1,189 @@
+import csv
+import json
+import threading
+import time
+from collections import deque
+import numpy as np
+
+# monotonic clock in seconds where available, wall clock on Python 2
+try:
+    clock = time.monotonic
+except AttributeError:
+    clock = time.time
+
+# upper bounds of the latency histogram bins, ms. The last bin takes everything above
+histogramBins = (0.1, 0.2, 0.5, 1., 2., 5., 10., 20., 50., 100., 200., 500., 1000.)
+
+
+# context manager returned by StageTimings.measure(), adds the elapsed time to the stage on exit
+class _StageMeasure:
+    def __init__(self, timings, stage):
+        self.__timings = timings
+        self.__stage = stage
+        self.__start = 0.
+
+    def __enter__(self):
+        self.__start = clock()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.__timings.add(self.__stage, clock() - self.__start)
+        return False
+
+
+# collects per-stage durations (in seconds) and event counters, reports the duration percentiles in milliseconds.
+# Stages may be measured from several threads
+class StageTimings:
+    def __init__(self, maxSamples=100000):
+        self.maxSamples = maxSamples
+        # stage names in order of the first measurement
+        self.stages = []
+        self.__samples = {}
+        # named counters, e.g. dropped frames
+        self.counters = {}
+        self.__lock = threading.Lock()
+
+    # usage: with timings.measure('motion'): ...
+    def measure(self, stage):
+        return _StageMeasure(self, stage)
+
+    def add(self, stage, seconds):
+        # the samples are looked up once, reset() may replace the dictionary meanwhile
+        samples = self.__samples.get(stage)
+        if samples is None:
+            with self.__lock:
+                samples = self.__samples.get(stage)
+                if samples is None:
+                    # a new stage is visible to summary() only with its first sample
+                    samples = deque([seconds], maxlen=self.maxSamples)
+                    self.__samples[stage] = samples
+                    self.stages.append(stage)
+                    return
+        samples.append(seconds)
+
+    # adds n to the counter
+    def count(self, name, n=1):
+        with self.__lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    # sets the counter, for the values counted elsewhere
+    def set_count(self, name, value):
+        self.counters[name] = value
+
+    def reset(self):
+        with self.__lock:
+            self.stages = []
+            self.__samples = {}
+            self.counters = {}
+
+    # returns {stage: {'count', 'mean', 'p50', 'p90', 'p99', 'max'}}, times in ms
+    def summary(self):
+        result = {}
+        with self.__lock:
+            stages = list(self.stages)
+            samples = self.__samples
+        for stage in stages:
+            values = np.array(samples[stage]) * 1000.
+            result[stage] = {'count': len(values),
+                             'mean': float(np.mean(values)),
+                             'p50': float(np.percentile(values, 50)),
+                             'p90': float(np.percentile(values, 90)),
+                             'p99': float(np.percentile(values, 99)),
+                             'max': float(np.max(values))}
+        return result
+
+    # returns the stage sample counts in histogramBins, len(histogramBins) + 1 values
+    def histogram(self, stage):
+        values = np.array(self.__samples.get(stage, [])) * 1000.
+        return np.bincount(np.searchsorted(histogramBins, values), minlength=len(histogramBins) + 1).tolist()
+
+    # returns a printable table of the summary
+    def report(self):
+        summary = self.summary()
+        lines = ['%-20s %8s %8s %8s %8s %8s %8s' % ('stage, ms', 'count', 'mean', 'p50', 'p90', 'p99', 'max')]
+        for stage in [stage for stage in self.stages if stage in summary]:
+            s = summary[stage]
+            lines.append('%-20s %8d %8.2f %8.2f %8.2f %8.2f %8.2f' %
+                         (stage, s['count'], s['mean'], s['p50'], s['p90'], s['p99'], s['max']))
+        for name in sorted(self.counters):
+            lines.append('%-20s %8d' % (name, self.counters[name]))
+        return '\n'.join(lines)
+
+    # returns one line summary: p50/p99 of the stages and the counters
+    def log_line(self):
+        summary = self.summary()
+        parts = ['%s %.1f/%.1f' % (stage, summary[stage]['p50'], summary[stage]['p99'])
+                 for stage in self.stages if stage in summary]
+        parts += ['%s %d' % (name, self.counters[name]) for name in sorted(self.counters)]
+        return 'ms p50/p99: ' + ', '.join(parts)
+
+    # saves the summary, histograms and counters as JSON, or the summary and counters as CSV if the name ends with .csv
+    def save(self, fileName):
+        summary = self.summary()
+        if fileName.lower().endswith('.csv'):
+            with open(fileName, 'wb') as f:
+                writer = csv.writer(f)
+                writer.writerow(['stage', 'count', 'mean', 'p50', 'p90', 'p99', 'max'])
+                for stage in [stage for stage in self.stages if stage in summary]:
+                    s = summary[stage]
+                    writer.writerow([stage, s['count'], s['mean'], s['p50'], s['p90'], s['p99'], s['max']])
+                for name in sorted(self.counters):
+                    writer.writerow([name, self.counters[name]])
+            return
+        for stage in summary:
+            summary[stage]['histogram'] = self.histogram(stage)
+        with open(fileName, 'w') as f:
+            json.dump({'stages': summary, 'histogramBinsMs': histogramBins, 'counters': self.counters},
+                      f, indent=2, sort_keys=True)
+
+
+# estimates how long threads wait for the GIL and the scheduler: a background thread sleeps for short intervals
+# and adds the oversleep to the 'gil wait' stage. Busy Python threads holding the GIL make it grow
+class GilMonitor:
+    def __init__(self, timings, interval=0.005):
+        self.timings = timings
+        self.interval = interval
+        self.__isRunning = False
+        self.__thread = None
+
+    def start(self):
+        self.__isRunning = True
+        self.__thread = threading.Thread(target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        self.__isRunning = False
+        if self.__thread:
+            self.__thread.join(1)
+
+    def __run(self):
+        while self.__isRunning:
+            start = clock()
+            time.sleep(self.interval)
+            self.timings.add('gil wait', max(0., clock() - start - self.interval))
+
+
+# prints the timings log line every 'interval' seconds (0 - never) and keeps the overlay text lines
+# refreshed every second. update() is called from the main loop
+class MetricsLogger:
+    def __init__(self, timings, interval=10.):
+        self.timings = timings
+        self.interval = interval
+        self.refreshInterval = 1.
+        # 'stage p50 / p99 ms' and counter lines for the on-screen overlay
+        self.lines = []
+        self.__lastLog = clock()
+        self.__lastRefresh = 0.
+
+    def update(self):
+        now = clock()
+        if now - self.__lastRefresh >= self.refreshInterval:
+            self.__lastRefresh = now
+            summary = self.timings.summary()
+            self.lines = ['%s %.1f / %.1f' % (stage, summary[stage]['p50'], summary[stage]['p99'])
+                          for stage in self.timings.stages if stage in summary]
+            self.lines += ['%s %d' % (name, value) for name, value in sorted(self.timings.counters.items())]
+        if self.interval > 0 and now - self.__lastLog >= self.interval:
+            self.__lastLog = now
+            print self.timings.log_line()
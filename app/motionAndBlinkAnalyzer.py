@@ -1,280 +1,356 @@
-import math
-import time
-from collections import deque
-
-
-# enumeration class
-class BlinkEvent:
-    # nothing happened
-    NoBlink = 0
-    # blink detected, but considered as natural blinking
-    NaturalBlink = 1
-    # regular both eyes blink. This and below treated as user input
-    BlinkBoth = 2
-    # long blink both eyes
-    LongBlink = 3
-    # quick 2-time blink
-    DoubleBlink = 4
-    # only left eye closed
-    LeftEyeClosed = 5
-    # only left eye opened
-    LeftEyeOpened = 6
-    # only right eye closed
-    RightEyeClosed = 7
-    # only right eye opened
-    RightEyeOpened = 8
-
-    @staticmethod
-    def blink_event_to_text(blinkEventValue):
-        if blinkEventValue == BlinkEvent.NoBlink:
-            return "NoBlink"
-        elif blinkEventValue == BlinkEvent.NaturalBlink:
-            return "NaturalBlink"
-        elif blinkEventValue == BlinkEvent.BlinkBoth:
-            return "BlinkBoth"
-        elif blinkEventValue == BlinkEvent.LongBlink:
-            return "LongBlink"
-        elif blinkEventValue == BlinkEvent.DoubleBlink:
-            return "DoubleBlink"
-        elif blinkEventValue == BlinkEvent.LeftEyeClosed:
-            return "LeftEyeClosed"
-        elif blinkEventValue == BlinkEvent.LeftEyeOpened:
-            return "LeftEyeOpened"
-        elif blinkEventValue == BlinkEvent.RightEyeClosed:
-            return "RightEyeClosed"
-        elif blinkEventValue == BlinkEvent.RightEyeOpened:
-            return "RightEyeOpened"
-
-
-# Class aggregates filtering algorithms for pointer movement and detected eye openness probabilities.
-# basically, it maps the tracked point delta move to mouse pointer delta move
-# and eye open state estimates to one of the BlinkEvents
-class MotionAndBlinkAnalyzer:
-    def __init__(self):
-        self.filterNaturalBlinks = True
-        self.naturalBlinkDelay = 6000
-        self.longBlinkDelay = 400
-        self.doubleBlinkDelay = 370
-
-        nowMs = int(round(time.time() * 1000))
-        # timestamps of last blink event start % end. Starting from now by default
-        self.__lastBlinkBothStamp = nowMs
-        self.__lastBlinkOneStamp = nowMs
-        self.__lastBlinkEventStartStamp = nowMs
-        # detected ongoing blink event
-        self.__startedBlinkEvent = BlinkEvent.NoBlink
-        # accumulated pointer move since last blink event
-        self.__accumulatedMovement = 0.
-        # minimal time allowed between consequent blink detections
-        self.__minBLinkBothInterval = 210
-        # minimal time allowed between consequent one eye blink detections
-        self.__minBlinkOneInterval = 350
-        # stored eye openness probabilities
-        self.__predictions = deque([], maxlen=10)
-        self.__predictions.append([1.0, 1.0])
-
-        # mouse pointer movement public settings
-        self.reverseX = False
-        self.reverseY = False
-        self.mouseMoveEnabled = True
-
-        # last delta moves
-        self.__m_dxLast = 0.
-        self.__m_dyLast = 0.
-        # sensitivity factors
-        self.__m_sensFactorX = 1
-        self.__m_sensFactorY = 1
-        # pointer 'mass', used in smoothness
-        self.__m_actualMotionWeight = 0.
-        # jitter threshold
-        self.__m_minDeltaThreshold = 0.7
-        # pointer acceleration values
-        self.__m_accelerationLevel = 0
-        self.__m_accelerationArray = [1] * 10
-
-        # set initial settings
-        self.set_acceleration_level(3)
-        self.set_sensitivity(25)
-        self.set_smoothness(10.)
-
-    # fills the __m_accelerationArray with desired factors
-    def __fill_acceleration_array(self, delta1, factor1, delta2=9999, factor2=1.0):
-        listLen = len(self.__m_accelerationArray)
-        if delta1 > listLen:
-            delta1 = listLen
-        if delta2 > listLen:
-            delta2 = listLen
-
-        for i in range(delta1):
-            self.__m_accelerationArray[i] = 1
-        for i in range(delta1, delta2):
-            self.__m_accelerationArray[i] = factor1
-        j = 0.
-        for i in range(delta2, listLen):
-            self.__m_accelerationArray[i] = factor1 * factor2 + j
-            j += 0.1
-
-    # sets the pointer acceleration setting level from 0 to 5
-    def set_acceleration_level(self, accelLevel=2):
-        if accelLevel > 5:
-            accelLevel = 5
-        self.__m_accelerationLevel = accelLevel
-        if accelLevel == 0:
-            self.__fill_acceleration_array(9999, 1)
-        elif accelLevel == 1:
-            self.__fill_acceleration_array(7, 1.5)
-        elif accelLevel == 2:
-            self.__fill_acceleration_array(7, 2.0)
-        elif accelLevel == 3:
-            self.__fill_acceleration_array(7, 1.5, 14, 2.0)
-        elif accelLevel == 4:
-            self.__fill_acceleration_array(7, 2.0, 14, 1.5)
-        else:
-            self.__fill_acceleration_array(7, 2.0, 14, 2.0)
-
-    # sets pointer smoothness, from 2 to 20
-    def set_smoothness(self, smoothness):
-        smoothness /= 2
-        if smoothness < 1.05:
-            smoothness = 1.05
-        elif smoothness > 9.:
-            smoothness = 9.
-        self.__m_actualMotionWeight = math.log10(smoothness)
-
-    # sets pointer sensitivity, from 0 to 50
-    def set_sensitivity(self, sens):
-        if sens > 50:
-            sens = 50
-        sensY = sens + 2
-        if sensY > 50:
-            sensY = 50
-        self.__m_sensFactorX = math.pow(math.e, sens/10.)
-        self.__m_sensFactorY = math.pow(math.e, sensY/10.)
-
-    # returns filtered delta move of mouse pointer in pixels. Input is track point dx and dy
-    def get_mouse_pointer_move(self, dx, dy):
-        # apply sensitivity
-        dx *= self.__m_sensFactorX
-        dy *= self.__m_sensFactorY
-
-        # apply low-pass filter
-        dx = dx * (1.0 - self.__m_actualMotionWeight) + self.__m_dxLast * self.__m_actualMotionWeight
-        dy = dy * (1.0 - self.__m_actualMotionWeight) + self.__m_dyLast * self.__m_actualMotionWeight
-        self.__m_dxLast = dx
-        self.__m_dyLast = dy
-
-        # apply acceleration
-        dist = math.sqrt(dx * dx + dy * dy)
-        if self.__m_accelerationLevel > 0:
-            arrIdx = int(round(dist))
-            if arrIdx >= len(self.__m_accelerationArray):
-                arrIdx = len(self.__m_accelerationArray) - 1
-            dx *= self.__m_accelerationArray[arrIdx]
-            dy *= self.__m_accelerationArray[arrIdx]
-
-        moveValue = [0, 0]
-        if self.mouseMoveEnabled:
-            # apply delta threshold
-            if abs(dx) > self.__m_minDeltaThreshold:
-                moveValue[0] = int(round(dx))
-            if abs(dy) > self.__m_minDeltaThreshold:
-                moveValue[1] = int(round(dy))
-
-            if moveValue[0] != 0 or moveValue[1] != 0:
-                if self.reverseX:
-                    moveValue[0] *= -1
-                if self.reverseY:
-                    moveValue[1] *= -1
-                self.__accumulatedMovement += math.sqrt(dx * dx + dy * dy)
-
-        return moveValue
-
-    # takes eye openness probabilities and returns the detected blink event (see BlinkEvent enum class)
-    def analyze_blink_event(self, probs):
-        # simple analysis for now, considering only current and previous probabilities
-        isOpenLPrev = self.__predictions[-1][0] > 0.5
-        isOpenRPrev = self.__predictions[-1][1] > 0.5
-        isOpenL = probs[0] > 0.5
-        isOpenR = probs[1] > 0.5
-        trendL = probs[0] - self.__predictions[-1][0]
-        trendR = probs[1] - self.__predictions[-1][1]
-        self.__predictions.append(probs)
-
-        returnedEvent = BlinkEvent.NoBlink
-        nowMs = int(round(time.time() * 1000))
-        isTimeToAnalyze = nowMs - self.__lastBlinkBothStamp > self.__minBLinkBothInterval
-        if isTimeToAnalyze:
-            # no ongoing blink event, check for start
-            if self.__startedBlinkEvent == BlinkEvent.NoBlink:
-                self.__startedBlinkEvent = \
-                    self.__checkStartEventBothEyes(nowMs, isOpenL, isOpenR) \
-                    or self.__checkStartOneEyeEvent(nowMs, BlinkEvent.LeftEyeClosed,
-                                                    isOpenL, isOpenR, isOpenLPrev, isOpenRPrev, trendR) \
-                    or self.__checkStartOneEyeEvent(nowMs, BlinkEvent.RightEyeClosed,
-                                                    isOpenR, isOpenL, isOpenRPrev, isOpenLPrev, trendL)
-                # these events are continuous
-                if self.__startedBlinkEvent == BlinkEvent.LeftEyeClosed \
-                        or self.__startedBlinkEvent == BlinkEvent.RightEyeClosed:
-                    returnedEvent = self.__startedBlinkEvent
-
-            # ongoing blink event, check for end
-            else:
-                if self.__startedBlinkEvent <= BlinkEvent.DoubleBlink:
-                    returnedEvent = self.__checkEndEventBothEyes(nowMs, isOpenL, isOpenR)
-                elif self.__startedBlinkEvent == BlinkEvent.LeftEyeClosed:
-                    returnedEvent = self.__checkEndOneEyeEvent(nowMs, BlinkEvent.LeftEyeOpened,
-                                                               isOpenL, isOpenR, isOpenLPrev, isOpenRPrev)
-                elif self.__startedBlinkEvent == BlinkEvent.RightEyeClosed:
-                    returnedEvent = self.__checkEndOneEyeEvent(nowMs, BlinkEvent.RightEyeOpened,
-                                                               isOpenR, isOpenL, isOpenRPrev, isOpenLPrev)
-
-                if returnedEvent != BlinkEvent.NoBlink:
-                    self.__startedBlinkEvent = BlinkEvent.NoBlink
-
-        return returnedEvent
-
-    def __checkStartEventBothEyes(self, nowMs, openL, openR):
-        # just reacts on both eyes closed
-        if not openL and not openR:
-            self.__lastBlinkEventStartStamp = nowMs
-            self.mouseMoveEnabled = False
-            return BlinkEvent.BlinkBoth
-        return BlinkEvent.NoBlink
-
-    def __checkStartOneEyeEvent(self, nowMs, retEvent, openLR, openOther, openLRPrev, openOtherPrev, trendOther):
-        if not openLR and not openLRPrev and openOther and openOtherPrev and trendOther > -0.1:
-            if nowMs - self.__lastBlinkOneStamp > self.__minBlinkOneInterval:
-                self.__lastBlinkEventStartStamp = nowMs
-                if retEvent == BlinkEvent.RightEyeClosed:
-                    self.mouseMoveEnabled = False
-                return retEvent
-        return BlinkEvent.NoBlink
-
-    def __checkEndEventBothEyes(self, nowMs, openL, openR):
-        retEvent = BlinkEvent.NoBlink
-        # just reacts on both eyes opened
-        if openL and openR:
-            retEvent = BlinkEvent.BlinkBoth
-            # depending on timings, this can be adjusted to the long, natural or double BlinkEvent
-            if nowMs - self.__lastBlinkEventStartStamp > self.longBlinkDelay:
-                retEvent = BlinkEvent.LongBlink
-            elif self.filterNaturalBlinks \
-                    and nowMs - self.__lastBlinkBothStamp > self.naturalBlinkDelay\
-                    and self.__accumulatedMovement < 80:
-                retEvent = BlinkEvent.NaturalBlink
-            elif nowMs - self.__lastBlinkBothStamp < self.doubleBlinkDelay:
-                retEvent = BlinkEvent.DoubleBlink
-
-            self.__lastBlinkBothStamp = nowMs
-            self.__accumulatedMovement = 0.0
-            self.mouseMoveEnabled = True
-
-        return retEvent
-
-    def __checkEndOneEyeEvent(self, nowMs, retEvent, openLR, openOther, openLRPrev, openOtherPrev):
-        if openLR and openLRPrev and openOther and openOtherPrev:
-            self.__lastBlinkOneStamp = nowMs
-            self.__accumulatedMovement = 0.0
-            self.mouseMoveEnabled = True
-            return retEvent
-        return BlinkEvent.NoBlink
+import math
+import time
+import numpy as np
+
+
+# enumeration class
+class BlinkEvent:
+    # nothing happened
+    NoBlink = 0
+    # blink detected, but considered as natural blinking
+    NaturalBlink = 1
+    # regular both eyes blink. This and below treated as user input
+    BlinkBoth = 2
+    # long blink both eyes
+    LongBlink = 3
+    # quick 2-time blink
+    DoubleBlink = 4
+    # only left eye closed
+    LeftEyeClosed = 5
+    # only left eye opened
+    LeftEyeOpened = 6
+    # only right eye closed
+    RightEyeClosed = 7
+    # only right eye opened
+    RightEyeOpened = 8
+
+    @staticmethod
+    def blink_event_to_text(blinkEventValue):
+        if blinkEventValue == BlinkEvent.NoBlink:
+            return "NoBlink"
+        elif blinkEventValue == BlinkEvent.NaturalBlink:
+            return "NaturalBlink"
+        elif blinkEventValue == BlinkEvent.BlinkBoth:
+            return "BlinkBoth"
+        elif blinkEventValue == BlinkEvent.LongBlink:
+            return "LongBlink"
+        elif blinkEventValue == BlinkEvent.DoubleBlink:
+            return "DoubleBlink"
+        elif blinkEventValue == BlinkEvent.LeftEyeClosed:
+            return "LeftEyeClosed"
+        elif blinkEventValue == BlinkEvent.LeftEyeOpened:
+            return "LeftEyeOpened"
+        elif blinkEventValue == BlinkEvent.RightEyeClosed:
+            return "RightEyeClosed"
+        elif blinkEventValue == BlinkEvent.RightEyeOpened:
+            return "RightEyeOpened"
+
+
+# pointer transfer function: pointer speed (pixels per frame, after the sensitivity and smoothing) to gain.
+# Defined by (speed, gain) points, linearly interpolated and sampled into a fine table once,
+# so evaluation is a single lookup of the sample at or below the speed. Speeds above the table use the last gain
+class TransferFunction:
+    def __init__(self, points, maxSpeed=64., resolution=0.05):
+        self.points = sorted(points, key=lambda p: p[0])
+        self.resolution = resolution
+        speeds = np.arange(0., maxSpeed + resolution, resolution)
+        self.table = np.interp(speeds, [p[0] for p in self.points], [p[1] for p in self.points])
+        self.__gains = self.table.tolist()
+
+    def gain(self, speed):
+        idx = int(speed / self.resolution)
+        return self.__gains[idx if idx < len(self.__gains) else -1]
+
+    # vectorised gain() for an array of speeds
+    def gains(self, speeds):
+        idx = (np.asarray(speeds, dtype=np.float64) / self.resolution).astype(np.int64)
+        return self.table[np.minimum(idx, len(self.table) - 1)]
+
+
+# transfer function points of the acceleration levels 0..5. Equal speeds make a step.
+# They keep the gains of the earlier 10 entry table: speeds from 6.5 pixels get the first factor,
+# the second stage was beyond the table end
+accelerationCurves = {0: [(0., 1.)],
+                      1: [(0., 1.), (6.5, 1.), (6.5, 1.5)],
+                      2: [(0., 1.), (6.5, 1.), (6.5, 2.)],
+                      3: [(0., 1.), (6.5, 1.), (6.5, 1.5)],
+                      4: [(0., 1.), (6.5, 1.), (6.5, 2.)],
+                      5: [(0., 1.), (6.5, 1.), (6.5, 2.)]}
+
+
+# two state (open / closed) hidden Markov model of one eye, updated with the classifier openness probabilities.
+# Transition probabilities depend on the time between the frames, so irregular or skipped classifications
+# are handled: the longer the gap, the more a single observation counts. The state switches with hysteresis
+class EyeStateFilter:
+    def __init__(self, meanOpenTime=1000., meanClosedTime=300.):
+        # mean time the eye stays open or closed, ms
+        self.meanOpenTime = meanOpenTime
+        self.meanClosedTime = meanClosedTime
+        # the eye is considered closed when the closed state probability rises above closeThreshold
+        # and open again when it falls below openThreshold
+        self.closeThreshold = 0.7
+        self.openThreshold = 0.3
+        # classifier output is clipped, so one confident misclassification can not switch the state
+        self.minProbability = 0.05
+        self.closedProbability = 0.
+        self.isOpen = True
+        self.__lastStamp = None
+
+    # takes the openness probability of the frame taken at nowMs, returns True if the eye is open
+    def update(self, openProbability, nowMs):
+        dt = 0. if self.__lastStamp is None else max(0., nowMs - self.__lastStamp)
+        self.__lastStamp = nowMs
+        # predict
+        closingProbability = 1. - math.exp(-dt / self.meanOpenTime)
+        openingProbability = 1. - math.exp(-dt / self.meanClosedTime)
+        prior = self.closedProbability * (1. - openingProbability) + \
+            (1. - self.closedProbability) * closingProbability
+        # correct with the observation
+        p = min(max(openProbability, self.minProbability), 1. - self.minProbability)
+        closed = prior * (1. - p)
+        self.closedProbability = closed / (closed + (1. - prior) * p)
+        if self.isOpen and self.closedProbability > self.closeThreshold:
+            self.isOpen = False
+        elif not self.isOpen and self.closedProbability < self.openThreshold:
+            self.isOpen = True
+        return self.isOpen
+
+    # filtered probability of the open eye
+    def open_probability(self):
+        return 1. - self.closedProbability
+
+
+# Class aggregates filtering algorithms for pointer movement and detected eye openness probabilities.
+# basically, it maps the tracked point delta move to mouse pointer delta move
+# and eye open state estimates to one of the BlinkEvents
+class MotionAndBlinkAnalyzer:
+    def __init__(self):
+        self.filterNaturalBlinks = True
+        self.naturalBlinkDelay = 6000
+        self.longBlinkDelay = 400
+        self.doubleBlinkDelay = 370
+
+        nowMs = int(round(time.time() * 1000))
+        # timestamps of last blink event start % end. Starting from now by default
+        self.__lastBlinkBothStamp = nowMs
+        self.__lastBlinkOneStamp = nowMs
+        self.__lastBlinkEventStartStamp = nowMs
+        # detected ongoing blink event
+        self.__startedBlinkEvent = BlinkEvent.NoBlink
+        # accumulated pointer move since last blink event
+        self.__accumulatedMovement = 0.
+        # minimal time allowed between consequent blink detections
+        self.__minBLinkBothInterval = 210
+        # minimal time allowed between consequent one eye blink detections
+        self.__minBlinkOneInterval = 350
+        # filtered eye states, eye openness probabilities are taken with the frame timestamps
+        self.eyeFilters = (EyeStateFilter(), EyeStateFilter())
+
+        # mouse pointer movement public settings
+        self.reverseX = False
+        self.reverseY = False
+        self.mouseMoveEnabled = True
+        # return moves in fractions of pixels, for the pointer output that carries the fractions over
+        self.subPixelMoves = False
+
+        # last delta moves
+        self.__m_dxLast = 0.
+        self.__m_dyLast = 0.
+        # sensitivity factors
+        self.__m_sensFactorX = 1
+        self.__m_sensFactorY = 1
+        # pointer 'mass', used in smoothness
+        self.__m_actualMotionWeight = 0.
+        # jitter threshold
+        self.__m_minDeltaThreshold = 0.7
+        # pointer acceleration
+        self.__m_accelerationLevel = 0
+        self.transferFunction = TransferFunction(accelerationCurves[0])
+
+        # set initial settings
+        self.set_acceleration_level(3)
+        self.set_sensitivity(25)
+        self.set_smoothness(10.)
+
+    # sets the pointer acceleration setting level from 0 to 5
+    def set_acceleration_level(self, accelLevel=2):
+        if accelLevel > 5:
+            accelLevel = 5
+        self.__m_accelerationLevel = accelLevel
+        self.transferFunction = TransferFunction(accelerationCurves[accelLevel])
+
+    # sets a custom pointer acceleration curve, list of (speed in pixels per frame, gain) points
+    def set_transfer_function(self, points):
+        self.__m_accelerationLevel = -1
+        self.transferFunction = TransferFunction(points)
+
+    # sets pointer smoothness, from 2 to 20
+    def set_smoothness(self, smoothness):
+        smoothness /= 2
+        if smoothness < 1.05:
+            smoothness = 1.05
+        elif smoothness > 9.:
+            smoothness = 9.
+        self.__m_actualMotionWeight = math.log10(smoothness)
+
+    # sets pointer sensitivity, from 0 to 50
+    def set_sensitivity(self, sens):
+        if sens > 50:
+            sens = 50
+        sensY = sens + 2
+        if sensY > 50:
+            sensY = 50
+        self.__m_sensFactorX = math.pow(math.e, sens/10.)
+        self.__m_sensFactorY = math.pow(math.e, sensY/10.)
+
+    # returns filtered delta move of mouse pointer in pixels. Input is track point dx and dy
+    def get_mouse_pointer_move(self, dx, dy):
+        # apply sensitivity
+        dx *= self.__m_sensFactorX
+        dy *= self.__m_sensFactorY
+
+        # apply low-pass filter
+        dx = dx * (1.0 - self.__m_actualMotionWeight) + self.__m_dxLast * self.__m_actualMotionWeight
+        dy = dy * (1.0 - self.__m_actualMotionWeight) + self.__m_dyLast * self.__m_actualMotionWeight
+        self.__m_dxLast = dx
+        self.__m_dyLast = dy
+
+        # apply acceleration
+        if self.__m_accelerationLevel != 0:
+            gain = self.transferFunction.gain(math.sqrt(dx * dx + dy * dy))
+            dx *= gain
+            dy *= gain
+
+        moveValue = [0, 0]
+        if self.mouseMoveEnabled:
+            # apply delta threshold
+            if abs(dx) > self.__m_minDeltaThreshold:
+                moveValue[0] = dx if self.subPixelMoves else int(round(dx))
+            if abs(dy) > self.__m_minDeltaThreshold:
+                moveValue[1] = dy if self.subPixelMoves else int(round(dy))
+
+            if moveValue[0] != 0 or moveValue[1] != 0:
+                if self.reverseX:
+                    moveValue[0] *= -1
+                if self.reverseY:
+                    moveValue[1] *= -1
+                self.__accumulatedMovement += math.sqrt(dx * dx + dy * dy)
+
+        return moveValue
+
+    # replays the tracked point moves trace (N, 2) through the pointer filters from the rest state,
+    # returns the pointer moves (N, 2). The analyzer state is not changed, blinks are not considered.
+    # For tuning and benchmarks: only the low-pass filter runs per move, the other steps are vectorised
+    def replay_pointer_moves(self, relMoves):
+        moves = np.array(relMoves, dtype=np.float64).reshape(-1, 2)
+        moves *= (self.__m_sensFactorX, self.__m_sensFactorY)
+        w = self.__m_actualMotionWeight
+        last = np.zeros(2)
+        for i in range(len(moves)):
+            last = moves[i] * (1.0 - w) + last * w
+            moves[i] = last
+        if self.__m_accelerationLevel != 0:
+            moves *= self.transferFunction.gains(np.hypot(moves[:, 0], moves[:, 1]))[:, np.newaxis]
+        moves[np.abs(moves) <= self.__m_minDeltaThreshold] = 0.
+        if not self.subPixelMoves:
+            moves = np.round(moves)
+        if self.reverseX:
+            moves[:, 0] *= -1
+        if self.reverseY:
+            moves[:, 1] *= -1
+        return moves
+
+    # restarts the blink event timing at nowMs instead of the creation time, to replay recorded eye states
+    def reset_blink_timing(self, nowMs):
+        self.__lastBlinkBothStamp = nowMs
+        self.__lastBlinkOneStamp = nowMs
+        self.__lastBlinkEventStartStamp = nowMs
+
+    # takes eye openness probabilities and returns the detected blink event (see BlinkEvent enum class)
+    # nowMs is the timestamp of the frame the probabilities were obtained from, current time if not given.
+    # Eye states are filtered over time, so the frames do not have to be classified at a regular rate
+    def analyze_blink_event(self, probs, nowMs=None):
+        if nowMs is None:
+            nowMs = int(round(time.time() * 1000))
+        filterL, filterR = self.eyeFilters
+        prevOpenL = filterL.open_probability()
+        prevOpenR = filterR.open_probability()
+        isOpenL = filterL.update(probs[0], nowMs)
+        isOpenR = filterR.update(probs[1], nowMs)
+        trendL = filterL.open_probability() - prevOpenL
+        trendR = filterR.open_probability() - prevOpenR
+
+        returnedEvent = BlinkEvent.NoBlink
+        isTimeToAnalyze = nowMs - self.__lastBlinkBothStamp > self.__minBLinkBothInterval
+        if isTimeToAnalyze:
+            # no ongoing blink event, check for start
+            if self.__startedBlinkEvent == BlinkEvent.NoBlink:
+                self.__startedBlinkEvent = \
+                    self.__checkStartEventBothEyes(nowMs, isOpenL, isOpenR) \
+                    or self.__checkStartOneEyeEvent(nowMs, BlinkEvent.LeftEyeClosed, isOpenL, isOpenR, trendR) \
+                    or self.__checkStartOneEyeEvent(nowMs, BlinkEvent.RightEyeClosed, isOpenR, isOpenL, trendL)
+                # these events are continuous
+                if self.__startedBlinkEvent == BlinkEvent.LeftEyeClosed \
+                        or self.__startedBlinkEvent == BlinkEvent.RightEyeClosed:
+                    returnedEvent = self.__startedBlinkEvent
+
+            # ongoing blink event, check for end
+            else:
+                if self.__startedBlinkEvent <= BlinkEvent.DoubleBlink:
+                    returnedEvent = self.__checkEndEventBothEyes(nowMs, isOpenL, isOpenR)
+                elif self.__startedBlinkEvent == BlinkEvent.LeftEyeClosed:
+                    returnedEvent = self.__checkEndOneEyeEvent(nowMs, BlinkEvent.LeftEyeOpened, isOpenL, isOpenR)
+                elif self.__startedBlinkEvent == BlinkEvent.RightEyeClosed:
+                    returnedEvent = self.__checkEndOneEyeEvent(nowMs, BlinkEvent.RightEyeOpened, isOpenR, isOpenL)
+
+                if returnedEvent != BlinkEvent.NoBlink:
+                    self.__startedBlinkEvent = BlinkEvent.NoBlink
+
+        return returnedEvent
+
+    def __checkStartEventBothEyes(self, nowMs, openL, openR):
+        # just reacts on both eyes closed
+        if not openL and not openR:
+            self.__lastBlinkEventStartStamp = nowMs
+            self.mouseMoveEnabled = False
+            return BlinkEvent.BlinkBoth
+        return BlinkEvent.NoBlink
+
+    # filtered states are already debounced, the other eye must stay open and not be closing
+    def __checkStartOneEyeEvent(self, nowMs, retEvent, openLR, openOther, trendOther):
+        if not openLR and openOther and trendOther > -0.1:
+            if nowMs - self.__lastBlinkOneStamp > self.__minBlinkOneInterval:
+                self.__lastBlinkEventStartStamp = nowMs
+                if retEvent == BlinkEvent.RightEyeClosed:
+                    self.mouseMoveEnabled = False
+                return retEvent
+        return BlinkEvent.NoBlink
+
+    def __checkEndEventBothEyes(self, nowMs, openL, openR):
+        retEvent = BlinkEvent.NoBlink
+        # just reacts on both eyes opened
+        if openL and openR:
+            retEvent = BlinkEvent.BlinkBoth
+            # depending on timings, this can be adjusted to the long, natural or double BlinkEvent
+            if nowMs - self.__lastBlinkEventStartStamp > self.longBlinkDelay:
+                retEvent = BlinkEvent.LongBlink
+            elif self.filterNaturalBlinks \
+                    and nowMs - self.__lastBlinkBothStamp > self.naturalBlinkDelay\
+                    and self.__accumulatedMovement < 80:
+                retEvent = BlinkEvent.NaturalBlink
+            elif nowMs - self.__lastBlinkBothStamp < self.doubleBlinkDelay:
+                retEvent = BlinkEvent.DoubleBlink
+
+            self.__lastBlinkBothStamp = nowMs
+            self.__accumulatedMovement = 0.0
+            self.mouseMoveEnabled = True
+
+        return retEvent
+
+    def __checkEndOneEyeEvent(self, nowMs, retEvent, openLR, openOther):
+        if openLR and openOther:
+            self.__lastBlinkOneStamp = nowMs
+            self.__accumulatedMovement = 0.0
+            self.mouseMoveEnabled = True
+            return retEvent
+        return BlinkEvent.NoBlink
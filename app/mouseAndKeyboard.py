@@ -1,48 +1,280 @@
-from pymouse import PyMouse
-from motionAndBlinkAnalyzer import BlinkEvent
-
-
-pm = PyMouse()
-
-
-# actually move the mouse pointer
-def move_mouse_pointer(dx, dy):
-    x, y = pm.position()
-    pm.move(x + dx, y + dy)
-
-
-def center_mouse():
-    x, y = pm.screen_size()
-    pm.move(x/2, y/2)
-
-
-# maps detected blink event to mouse action
-def blink_event_to_action(blinkEvent):
-    x, y = pm.position()
-    # there is a bug in PyMouse for Windows multi screen systems.
-    # Valid on-screen coordinates can be negative, depending on positioning of the screens,
-    # but PyMouse treats them as unsigned ints, and subsequent click method fails.
-    # Constants below worked for my system, may need to be changed on other systems
-    if x > 100000:
-        x -= 4294967295
-
-    print x, y, BlinkEvent.blink_event_to_text(blinkEvent)
-
-    # Button is defined as 1 = left, 2 = right, 3 = middle."""
-    if blinkEvent == BlinkEvent.BlinkBoth:
-        pm.click(x, y, 1)
-    if blinkEvent == BlinkEvent.LongBlink:
-        pm.click(x, y, 1)
-        pm.click(x, y, 1)
-    if blinkEvent == BlinkEvent.DoubleBlink:
-        pm.click(x, y, 3)
-
-    if blinkEvent == BlinkEvent.LeftEyeClosed:
-        pm.press(x, y, 1)
-    if blinkEvent == BlinkEvent.LeftEyeOpened:
-        pm.release(x, y, 1)
-    if blinkEvent == BlinkEvent.RightEyeClosed:
-        pm.press(x, y, 2)
-    if blinkEvent == BlinkEvent.RightEyeOpened:
-        pm.release(x, y, 2)
-    return
+import threading
+import time
+from motionAndBlinkAnalyzer import BlinkEvent
+from metrics import StageTimings
+
+
+# Mouse buttons are defined as 1 = left, 2 = right, 3 = middle, as in PyMouse.
+# Input backends inject the pointer moves and button actions into the OS. Moves are relative,
+# so that a backend supporting relative motion does not have to query the pointer position first.
+# Every backend defines move_relative(dx, dy), move_to(x, y), screen_size() -> (width, height),
+# click(button, n=1), press(button) and release(button). flush() is optional
+class InputBackend:
+    name = ''
+
+    # sends out the buffered input, called after each batch of actions
+    def flush(self):
+        pass
+
+
+# PyMouse backend, works on all platforms. PyMouse moves the pointer to absolute positions only,
+# the position is queried once in positionRefreshInterval seconds and tracked between the queries
+class PyMouseBackend(InputBackend):
+    name = 'pymouse'
+
+    def __init__(self):
+        from pymouse import PyMouse
+        self.__pm = PyMouse()
+        self.positionRefreshInterval = 0.5
+        self.__position = None
+        self.__positionStamp = 0.
+
+    def __current_position(self):
+        now = time.time()
+        if self.__position is None or now - self.__positionStamp >= self.positionRefreshInterval:
+            x, y = self.__pm.position()
+            # there is a bug in PyMouse for Windows multi screen systems.
+            # Valid on-screen coordinates can be negative, depending on positioning of the screens,
+            # but PyMouse treats them as unsigned ints, and subsequent click method fails.
+            # Constants below worked for my system, may need to be changed on other systems
+            if x > 100000:
+                x -= 4294967295
+            self.__position = [x, y]
+            self.__positionStamp = now
+        return self.__position
+
+    def move_relative(self, dx, dy):
+        position = self.__current_position()
+        position[0] += dx
+        position[1] += dy
+        self.__pm.move(position[0], position[1])
+
+    def move_to(self, x, y):
+        self.__position = [x, y]
+        self.__positionStamp = time.time()
+        self.__pm.move(x, y)
+
+    def screen_size(self):
+        return self.__pm.screen_size()
+
+    def click(self, button, n=1):
+        x, y = self.__current_position()
+        self.__pm.click(x, y, button, n)
+
+    def press(self, button):
+        x, y = self.__current_position()
+        self.__pm.press(x, y, button)
+
+    def release(self, button):
+        x, y = self.__current_position()
+        self.__pm.release(x, y, button)
+
+
+# X11 XTest extension backend (python-xlib): relative moves and buttons are sent without waiting for the server
+class XTestBackend(InputBackend):
+    name = 'xtest'
+    # X11 buttons: 1 = left, 2 = middle, 3 = right
+    xButtons = {1: 1, 2: 3, 3: 2}
+
+    def __init__(self):
+        from Xlib import X, display
+        from Xlib.ext import xtest
+        self.__X = X
+        self.__xtest = xtest
+        self.__display = display.Display()
+
+    def move_relative(self, dx, dy):
+        self.__xtest.fake_input(self.__display, self.__X.MotionNotify, detail=True, x=int(dx), y=int(dy))
+
+    def move_to(self, x, y):
+        self.__xtest.fake_input(self.__display, self.__X.MotionNotify, x=int(x), y=int(y))
+
+    def screen_size(self):
+        screen = self.__display.screen()
+        return screen.width_in_pixels, screen.height_in_pixels
+
+    def click(self, button, n=1):
+        for i in range(n):
+            self.press(button)
+            self.release(button)
+
+    def press(self, button):
+        self.__xtest.fake_input(self.__display, self.__X.ButtonPress, XTestBackend.xButtons[button])
+
+    def release(self, button):
+        self.__xtest.fake_input(self.__display, self.__X.ButtonRelease, XTestBackend.xButtons[button])
+
+    def flush(self):
+        self.__display.flush()
+
+
+# does not inject anything, counts the actions. For headless runs and benchmarks
+class NullBackend(InputBackend):
+    name = 'null'
+
+    def __init__(self):
+        self.moveCount = 0
+        self.buttonCount = 0
+        self.position = [0, 0]
+
+    def move_relative(self, dx, dy):
+        self.moveCount += 1
+        self.position[0] += dx
+        self.position[1] += dy
+
+    def move_to(self, x, y):
+        self.moveCount += 1
+        self.position = [x, y]
+
+    def screen_size(self):
+        return 1920, 1080
+
+    def click(self, button, n=1):
+        self.buttonCount += n
+
+    def press(self, button):
+        self.buttonCount += 1
+
+    def release(self, button):
+        self.buttonCount += 1
+
+
+backends = {PyMouseBackend.name: PyMouseBackend,
+            XTestBackend.name: XTestBackend,
+            NullBackend.name: NullBackend}
+
+
+# injects the input in its own thread, so that a slow backend never blocks the frame processing.
+# Moves queued while the thread is busy are coalesced into one move, button actions keep their order.
+# An action the backend fails on is counted and skipped, the first failure is printed
+class InputInjector:
+    def __init__(self, backend):
+        self.backend = backend
+        # (method name, args) actions waiting for the thread
+        self.__actions = []
+        self.__cond = threading.Condition()
+        self.__isRunning = True
+        self.moveCount = 0
+        self.coalescedMoveCount = 0
+        self.failedCount = 0
+        # backend call durations, per batch of actions
+        self.timings = StageTimings()
+        self.__thread = threading.Thread(target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def move(self, dx, dy):
+        if dx == 0 and dy == 0:
+            return
+        with self.__cond:
+            self.moveCount += 1
+            if self.__actions and self.__actions[-1][0] == 'move_relative':
+                lastDx, lastDy = self.__actions[-1][1]
+                self.__actions[-1] = ('move_relative', (lastDx + dx, lastDy + dy))
+                self.coalescedMoveCount += 1
+            else:
+                self.__actions.append(('move_relative', (dx, dy)))
+            self.__cond.notify()
+
+    # queues a backend method call
+    def add(self, method, *args):
+        with self.__cond:
+            self.__actions.append((method, args))
+            self.__cond.notify()
+
+    def stop(self):
+        with self.__cond:
+            self.__isRunning = False
+            self.__cond.notify()
+        self.__thread.join(1)
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                while self.__isRunning and not self.__actions:
+                    self.__cond.wait()
+                if not self.__isRunning:
+                    return
+                actions = self.__actions
+                self.__actions = []
+            with self.timings.measure('input injection'):
+                for method, args in actions:
+                    self.__call(method, *args)
+                self.__call('flush')
+
+    def __call(self, method, *args):
+        try:
+            getattr(self.backend, method)(*args)
+        except Exception as e:
+            self.failedCount += 1
+            self.timings.count('failed input actions')
+            if self.failedCount == 1:
+                print "Input backend %s failed on %s: %s" % (self.backend.name, method, e)
+
+
+# input backend name, see 'backends'. The injector is started with it on the first use, unless start() is called
+backendName = 'pymouse'
+# print the blink events
+verbose = False
+injector = None
+
+
+# starts the injector with the given backend, stops the previous one
+def start(backend=None):
+    global injector
+    stop()
+    injector = InputInjector(backends[backend or backendName]())
+    return injector
+
+
+def stop():
+    global injector
+    if injector is not None:
+        injector.stop()
+        injector = None
+
+
+def _get_injector():
+    return injector if injector is not None else start()
+
+
+# actually move the mouse pointer
+def move_mouse_pointer(dx, dy):
+    _get_injector().move(dx, dy)
+
+
+def center_mouse():
+    inj = _get_injector()
+    x, y = inj.backend.screen_size()
+    inj.add('move_to', x/2, y/2)
+
+
+# maps detected blink event to the list of input backend actions, (method name, args)
+def blink_event_actions(blinkEvent):
+    # Button is defined as 1 = left, 2 = right, 3 = middle."""
+    if blinkEvent == BlinkEvent.BlinkBoth:
+        return [('click', (1,))]
+    if blinkEvent == BlinkEvent.LongBlink:
+        return [('click', (1, 2))]
+    if blinkEvent == BlinkEvent.DoubleBlink:
+        return [('click', (3,))]
+
+    if blinkEvent == BlinkEvent.LeftEyeClosed:
+        return [('press', (1,))]
+    if blinkEvent == BlinkEvent.LeftEyeOpened:
+        return [('release', (1,))]
+    if blinkEvent == BlinkEvent.RightEyeClosed:
+        return [('press', (2,))]
+    if blinkEvent == BlinkEvent.RightEyeOpened:
+        return [('release', (2,))]
+    return []
+
+
+# maps detected blink event to mouse action
+def blink_event_to_action(blinkEvent):
+    inj = _get_injector()
+    if verbose:
+        print BlinkEvent.blink_event_to_text(blinkEvent)
+    for method, args in blink_event_actions(blinkEvent):
+        inj.add(method, *args)
+    return
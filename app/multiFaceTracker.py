@@ -0,0 +1,213 @@
+import threading
+import time
+from faceDetector import FaceAndMovementDetector
+from blinkDetector import eye_areas_in_frame
+from motionAndBlinkAnalyzer import MotionAndBlinkAnalyzer, BlinkEvent
+from metrics import StageTimings
+
+
+# one tracked face with its own detector state (face and eye areas, landmarks, motion points)
+# and its own pointer and blink analyzer. trackId is stable while the face is tracked
+class FaceTrack:
+    def __init__(self, trackId, faceDetector, analyzer):
+        self.trackId = trackId
+        self.fd = faceDetector
+        self.ma = analyzer
+        # full frame detections in a row that did not find the face
+        self.missedDetections = 0
+        self.lastHeadMove = [0., 0.]
+
+
+# intersection over union of two (x1, y1, x2, y2) rectangles
+def rect_iou(a, b):
+    w = min(a[2], b[2]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.
+    intersection = float(w * h)
+    return intersection / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection)
+
+
+# Tracks several faces, e.g. users of a shared workstation. The full frame is scanned for faces periodically
+# (in a background thread or by the caller), the found faces are matched to the tracks by their overlap with
+# the tracked face areas, so that each user keeps the track id and the detector and analyzer state.
+# One track is active: its moves and events control the pointer. Control is handed over with set_active_track().
+# Per frame, the tracks run their own optical flow, the eyes of all the tracks are classified in one batch,
+# and the periodic landmark predictions (dlib predicts one face per call) are spread over frames.
+# Classification is synchronous: process() waits for the batch, the blink detector's async worker
+# and eye image cache are not used
+class MultiFaceTracker:
+    def __init__(self, faceDetector, blinkDetector, timings=None, analyzerFactory=MotionAndBlinkAnalyzer):
+        # template detector: the dlib models and the settings are shared with the per-track detectors
+        self.fd = faceDetector
+        self.bd = blinkDetector
+        self.timings = timings if timings is not None else StageTimings()
+        self.analyzerFactory = analyzerFactory
+        self.tracks = []
+        self.activeTrackId = None
+        self.maxFaces = 4
+        # a found face continues the track if it overlaps the tracked face area at least this much
+        self.minOverlap = 0.3
+        # track is dropped after this many full frame detections without its face
+        self.maxMissedDetections = 2
+        # full frame detection intervals with and without tracked faces, ms
+        self.detectionInterval = 2000
+        self.detectionIntervalNoFaces = 500
+        # periodic landmark predictions allowed per frame, over all the tracks
+        self.landmarksPerFrame = 1
+        self.lastDetectionStamp = 0
+        self.__nextTrackId = 1
+        self.__landmarksTurn = 0
+        # (faces, frame shape) found by the background thread, taken over by process()
+        self.__pendingDetection = None
+        self.__frame_buffer = None
+        self.__backgroundThread = None
+        self.isDetecting = False
+
+    def is_detection_due(self, nowMs):
+        interval = self.detectionInterval if self.tracks else self.detectionIntervalNoFaces
+        return nowMs - self.lastDetectionStamp >= interval
+
+    # returns the active track or None
+    def active_track(self):
+        for track in self.tracks:
+            if track.trackId == self.activeTrackId:
+                return track
+        return None
+
+    # hands the pointer control to the tracked face, returns False if there is no such track
+    def set_active_track(self, trackId):
+        if not any(track.trackId == trackId for track in self.tracks):
+            return False
+        self.activeTrackId = trackId
+        return True
+
+    # forgets all the faces, e.g. when the frame resolution changes
+    def reset(self):
+        self.tracks = []
+        self.activeTrackId = None
+        self.__pendingDetection = None
+        self.lastDetectionStamp = 0
+
+    # matches the faces found on the frame of frameShape to the tracks, starts and drops the tracks
+    def update_detections(self, faces, frameShape):
+        self.lastDetectionStamp = int(round(time.time() * 1000))
+        pairs = []
+        for i, track in enumerate(self.tracks):
+            area = track.fd.current_face_area()
+            for j, face in enumerate(faces):
+                overlap = rect_iou(area, face)
+                if overlap >= self.minOverlap:
+                    pairs.append((overlap, i, j))
+        matchedTracks = set()
+        matchedFaces = set()
+        # the best overlapping pairs first
+        for overlap, i, j in sorted(pairs, reverse=True):
+            if i in matchedTracks or j in matchedFaces:
+                continue
+            matchedTracks.add(i)
+            matchedFaces.add(j)
+            self.tracks[i].fd.set_detected_face(faces[j], frameShape)
+            self.tracks[i].missedDetections = 0
+        for i, track in enumerate(self.tracks):
+            if i not in matchedTracks:
+                track.missedDetections += 1
+        self.tracks = [t for t in self.tracks if t.missedDetections <= self.maxMissedDetections]
+        for j, face in enumerate(faces):
+            if j not in matchedFaces and len(self.tracks) < self.maxFaces:
+                self.tracks.append(self.__new_track(face, frameShape))
+        # the biggest face takes the control if there is no active user
+        if self.active_track() is None:
+            self.activeTrackId = None
+            for face in faces:
+                for track in self.tracks:
+                    if track.fd.detectedFaceArea == face:
+                        self.activeTrackId = track.trackId
+                        break
+                if self.activeTrackId is not None:
+                    break
+
+    def __new_track(self, face, frameShape):
+        fd = FaceAndMovementDetector(None, modelsFrom=self.fd)
+        fd.timings = self.timings
+        fd.flowWindowEnabled = self.fd.flowWindowEnabled
+        fd.motionEstimator = self.fd.motionEstimator
+        fd.landmarksInterval = self.fd.landmarksInterval
+        fd.set_detected_face(face, frameShape)
+        track = FaceTrack(self.__nextTrackId, fd, self.analyzerFactory())
+        self.__nextTrackId += 1
+        return track
+
+    # processes one frame for all the tracked faces.
+    # Returns the list of (track, filtered pointer move, list of blink events)
+    def process(self, grayImg, prevGrayImg, frameStamp):
+        results = self.process_motion(grayImg, prevGrayImg)
+        classified = self.classifiable(results, grayImg.shape)
+        with self.timings.measure('blink'):
+            probs = self.bd.predict_faces(grayImg, [r[0].fd.detectedEyeAreas for r in classified])
+        self.analyze_eyes(classified, probs, frameStamp)
+        return results
+
+    # first part of process(): takes over the pending detection and runs the motion of all the tracks.
+    # Returns the list of (track, filtered pointer move, empty list for the blink events)
+    def process_motion(self, grayImg, prevGrayImg):
+        pending = self.__pendingDetection
+        if pending is not None:
+            self.__pendingDetection = None
+            if pending[1] == grayImg.shape:
+                self.update_detections(*pending)
+        tracks = [t for t in self.tracks if t.fd.isFaceDetected and t.fd.detectionFrameShape == grayImg.shape]
+        if not tracks:
+            return []
+
+        results = []
+        for i, track in enumerate(tracks):
+            track.fd.periodicLandmarksEnabled = (i - self.__landmarksTurn) % len(tracks) < self.landmarksPerFrame
+            with self.timings.measure('motion'):
+                relMove = track.fd.get_relative_motion(grayImg, prevGrayImg)
+            track.lastHeadMove = relMove
+            with self.timings.measure('pointer'):
+                relMoveFiltered = track.ma.get_mouse_pointer_move(relMove[0], relMove[1])
+            results.append((track, relMoveFiltered, []))
+        self.__landmarksTurn += 1
+        return results
+
+    # results of process_motion() which eyes are to be classified, faces with the eyes out of the frame are skipped
+    @staticmethod
+    def classifiable(results, frameShape):
+        return [r for r in results if eye_areas_in_frame(r[0].fd.detectedEyeAreas, frameShape)]
+
+    # last part of process(): analyzes the (left, right) eye probabilities of the classifiable results,
+    # the blink events are added to the results
+    def analyze_eyes(self, classified, probs, frameStamp):
+        stampMs = int(round(frameStamp * 1000))
+        for (track, relMoveFiltered, blinkEvents), (lblink, rblink) in zip(classified, probs):
+            with self.timings.measure('analysis'):
+                blinkEvent = track.ma.analyze_blink_event((lblink, rblink), stampMs)
+            if blinkEvent != BlinkEvent.NoBlink:
+                self.timings.add('frame to event', time.time() - frameStamp)
+                blinkEvents.append(blinkEvent)
+
+    # scans the frame for faces when the detection is due and the last result was taken over by process().
+    # Called from the background thread, or by the caller that runs the detections itself
+    def detect_faces_if_due(self, grayImg):
+        if self.__pendingDetection is None and self.is_detection_due(int(round(time.time() * 1000))):
+            self.__pendingDetection = (self.fd.detect_faces(grayImg), grayImg.shape)
+
+    # scans the latest frames of the FrameRingBuffer for faces in background thread
+    def start_detect_faces_async(self, frame_buffer):
+        self.isDetecting = True
+        self.__frame_buffer = frame_buffer
+        self.__backgroundThread = threading.Thread(target=self.__detectFacesAsync)
+        self.__backgroundThread.daemon = True
+        self.__backgroundThread.start()
+
+    def stop(self):
+        self.isDetecting = False
+        if self.__backgroundThread:
+            self.__backgroundThread.join(1)
+
+    def __detectFacesAsync(self):
+        while self.isDetecting:
+            self.detect_faces_if_due(self.__frame_buffer.latest().gray)
+            time.sleep(0.1)
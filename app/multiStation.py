@@ -0,0 +1,205 @@
+__author__ = "Roman Semenyk"
+__copyright__ = "Copyright 2017, VirtualMousePad"
+__license__ = "GPLv3"
+
+# Multi-camera service: one process reads several cameras or recorded sessions (stations) and shares
+# the processing between them, see sourcePool.SourcePool. The models are loaded once, the face detection
+# runs in one background thread, the optical flow in the worker threads and the eyes of all the stations
+# are classified in one batch. Runs headless, the blink events (and the pointer moves with --publish-moves)
+# of every station are published through the control API with the station "source" id, the index of the source
+# on the command line. One station may control the local pointer (--pointer-source).
+# usage:
+#   python ./app/multiStation.py 0 1 2 --control-port 7007
+#   python ./app/multiStation.py a.avi b.avi --pointer-source 0 --input-backend xtest
+
+import argparse
+import time
+import os
+import mouseAndKeyboard as mouse
+from metrics import StageTimings, MetricsLogger
+from controlServer import ControlServer, bool_field, number_field, int_field
+from motionAndBlinkAnalyzer import MotionAndBlinkAnalyzer, BlinkEvent
+
+landmarks_fn = './classifier/shape_predictor_68_face_landmarks.dat'
+nn_definition_file = 'classifier/model_deploy.prototxt'
+nn_weights_file = 'classifier/model_weights_97.22.caffemodel'
+
+
+# stations state shared by the main loop and the control API connection threads
+class MultiStationService:
+    def __init__(self, pool, timings, pointerSourceId=None, pointerOutput=None):
+        self.pool = pool
+        self.timings = timings
+        # station that controls the local pointer through pointerOutput, None - no pointer control
+        self.pointerSourceId = pointerSourceId
+        self.pointerOutput = pointerOutput
+        self.captureEnabled = pointerOutput is not None
+        self.publishMoves = False
+        self.controlServer = None
+        self.pointerSettings = {'sensitivity': 25, 'smoothness': 10., 'acceleration': 3}
+        self.quitRequested = False
+
+    # analyzer for a new face of any station, with the current pointer settings
+    def new_analyzer(self):
+        analyzer = MotionAndBlinkAnalyzer()
+        analyzer.subPixelMoves = self.pointerOutput is not None
+        analyzer.set_sensitivity(self.pointerSettings['sensitivity'])
+        analyzer.set_smoothness(self.pointerSettings['smoothness'])
+        analyzer.set_acceleration_level(self.pointerSettings['acceleration'])
+        return analyzer
+
+    def all_analyzers(self):
+        return [track.ma for station in self.pool.stations for track in station.tracker.tracks]
+
+    # control API requests, called from the connection threads. Returns the response dict
+    def handle_control(self, request):
+        cmd = request['cmd']
+        if cmd == 'capture':
+            self.captureEnabled = bool_field(request, 'enabled') and self.pointerOutput is not None
+            if self.pointerOutput is not None:
+                self.pointerOutput.clear()
+        elif cmd == 'sensitivity':
+            self.pointerSettings['sensitivity'] = min(max(number_field(request, 'value'), 0.), 50.)
+            for analyzer in self.all_analyzers():
+                analyzer.set_sensitivity(self.pointerSettings['sensitivity'])
+        elif cmd == 'smoothness':
+            self.pointerSettings['smoothness'] = min(max(number_field(request, 'value'), 2.), 20.)
+            for analyzer in self.all_analyzers():
+                analyzer.set_smoothness(self.pointerSettings['smoothness'])
+        elif cmd == 'acceleration':
+            self.pointerSettings['acceleration'] = min(max(int_field(request, 'value'), 0), 5)
+            for analyzer in self.all_analyzers():
+                analyzer.set_acceleration_level(self.pointerSettings['acceleration'])
+        elif cmd == 'user':
+            station = self.pool.station(int_field(request, 'source'))
+            if station is None:
+                raise ValueError('no source %s' % request['source'])
+            if not station.tracker.set_active_track(int_field(request, 'id')):
+                raise ValueError('no tracked user %s' % request['id'])
+            if station.sourceId == self.pointerSourceId:
+                self.pointerOutput.clear()
+        elif cmd == 'metrics':
+            return {'metrics': self.timings.summary(), 'counters': dict(self.timings.counters)}
+        elif cmd == 'quit':
+            self.quitRequested = True
+        elif cmd != 'status':
+            raise ValueError('unknown command %s' % cmd)
+        return {'capture': self.captureEnabled, 'pointerSource': self.pointerSourceId,
+                'settings': self.pointerSettings,
+                'sources': [{'source': station.sourceId,
+                             'spec': str(station.sourceSpec),
+                             'fps': station.frameBuffer.fps(),
+                             'users': [track.trackId for track in station.tracker.tracks],
+                             'activeUser': station.tracker.activeTrackId,
+                             'processedFrames': station.processedCount,
+                             'droppedFrames': station.droppedCount,
+                             'ended': station.isEnded} for station in self.pool.stations]}
+
+    # routes the results of the station frame: the events of every user and the moves of the active user
+    # go to the control API subscribers, the pointer station controls the local pointer as well
+    def route(self, station, frame, results):
+        hasSubscribers = self.controlServer is not None and self.controlServer.has_subscribers()
+        for track, relMoveFiltered, blinkEvents in results:
+            isActive = track.trackId == station.tracker.activeTrackId
+            if hasSubscribers:
+                for blinkEvent in blinkEvents:
+                    self.controlServer.publish({'source': station.sourceId, 'user': track.trackId,
+                                                'event': BlinkEvent.blink_event_to_text(blinkEvent),
+                                                'stamp': frame.timestamp})
+                if isActive and self.publishMoves:
+                    self.controlServer.publish({'source': station.sourceId, 'user': track.trackId,
+                                                'move': [relMoveFiltered[0], relMoveFiltered[1]],
+                                                'stamp': frame.timestamp})
+            if isActive and station.sourceId == self.pointerSourceId and self.captureEnabled:
+                self.pointerOutput.add_move(relMoveFiltered[0], relMoveFiltered[1], frame.timestamp)
+                for blinkEvent in blinkEvents:
+                    mouse.blink_event_to_action(blinkEvent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='VirtualMousePad for several cameras in one process')
+    parser.add_argument('sources', nargs='+', help='camera indexes, video files, image directories or .npz archives')
+    parser.add_argument('--control-port', type=int, default=7007, help='control API port on 127.0.0.1, 0 - disabled')
+    parser.add_argument('--workers', type=int, default=4, help='optical flow worker threads')
+    parser.add_argument('--max-faces', type=int, default=1, help='faces tracked per source')
+    parser.add_argument('--no-batch', action='store_true',
+                        help='classify the eyes of every source apart instead of one batch for all the sources')
+    parser.add_argument('--pointer-source', type=int, help='source index which active user moves the local pointer')
+    parser.add_argument('--input-backend', default='pymouse', help='mouse input backend: pymouse, xtest or null')
+    parser.add_argument('--publish-moves', action='store_true',
+                        help='publish the pointer moves of the active users through the control API')
+    parser.add_argument('--fast', action='store_true',
+                        help='read the recorded sources as fast as possible instead of their frame rate')
+    parser.add_argument('--metrics', help='save the stage timings with histograms on exit into .json or .csv file')
+    parser.add_argument('--backend', default='opencv', help='eye state classifier backend: opencv, numpy or caffe')
+    parser.add_argument('--landmarks', default=landmarks_fn)
+    parser.add_argument('--nn-definition', default=nn_definition_file)
+    parser.add_argument('--nn-weights', default=nn_weights_file)
+    args = parser.parse_args()
+    if args.pointer_source is not None and not 0 <= args.pointer_source < len(args.sources):
+        parser.error('--pointer-source must be an index of the sources')
+
+    from faceDetector import FaceAndMovementDetector
+    from blinkDetector import BlinkDetector
+    from sourcePool import SourcePool
+
+    timings = StageTimings(maxSamples=3000)
+    fd = FaceAndMovementDetector(args.landmarks)
+    fd.timings = timings
+    bd = BlinkDetector(args.nn_definition, args.nn_weights, args.backend)
+
+    pointerOutput = None
+    if args.pointer_source is not None:
+        from pointerOutput import PointerOutput
+        mouse.start(args.input_backend).timings = timings
+        pointerOutput = PointerOutput(mouse.move_mouse_pointer)
+        pointerOutput.start()
+    service = MultiStationService(None, timings, args.pointer_source, pointerOutput)
+    service.publishMoves = args.publish_moves
+
+    pool = SourcePool(fd, bd, timings, service.new_analyzer, args.workers)
+    pool.maxFacesPerSource = args.max_faces
+    pool.batchEnabled = not args.no_batch
+    service.pool = pool
+    for sourceId, spec in enumerate(args.sources):
+        pool.add_source(sourceId, spec)
+    pool.start_capture(realtime=not args.fast)
+    pool.start_detect_faces_async()
+
+    if args.control_port:
+        service.controlServer = ControlServer(service.handle_control, args.control_port)
+        service.controlServer.start()
+        print "Control API listening on %s:%d" % (service.controlServer.host, service.controlServer.port)
+
+    metricsLogger = MetricsLogger(timings)
+    lastMetricsPublish = 0.
+    try:
+        while not service.quitRequested and not pool.all_ended():
+            for station, frame, results in pool.process_frames(pool.wait_frames(0.1)):
+                service.route(station, frame, results)
+            timings.set_count('dropped frames', sum(station.droppedCount for station in pool.stations))
+            metricsLogger.update()
+            controlServer = service.controlServer
+            if controlServer is not None and controlServer.has_subscribers() and time.time() - lastMetricsPublish >= 1.:
+                lastMetricsPublish = time.time()
+                controlServer.publish({'metrics': timings.summary(), 'counters': dict(timings.counters)})
+    except KeyboardInterrupt:
+        pass
+
+    # stop all
+    if service.controlServer is not None:
+        service.controlServer.stop()
+    pool.stop()
+    if pointerOutput is not None:
+        pointerOutput.stop()
+        mouse.stop()
+    if args.metrics:
+        timings.save(args.metrics)
+    for station in pool.stations:
+        print "Source %d (%s): %d frames processed, %d dropped" % (
+            station.sourceId, station.sourceSpec, station.processedCount, station.droppedCount)
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import time
+import utils as u
+from motionAndBlinkAnalyzer import BlinkEvent
+from blinkDetector import eye_areas_in_frame
+from metrics import StageTimings
+
+
+# runs the per-frame processing chain: motion detection -> pointer filtering -> eye state classification -> analysis
+class FrameProcessor:
+    def __init__(self, faceDetector, blinkDetector, analyzer, timings=None):
+        self.fd = faceDetector
+        self.bd = blinkDetector
+        self.ma = analyzer
+        self.timings = timings if timings is not None else StageTimings()
+        # eye states are checked only if the pointer moves less than this, in pixels.
+        # Not used when the blink detector classifies asynchronously, then every frame is classified
+        self.stillMoveThreshold = 5
+        # tracked head move of the last frame, before the pointer filters
+        self.lastHeadMove = [0., 0.]
+        # analyzerTrace.TraceWriter recording the analyzer inputs and outputs, None - not recorded
+        self.trace = None
+
+    # processes one frame taken at frameStamp (seconds),
+    # returns filtered pointer move and the list of detected blink events
+    def process(self, grayImg, prevGrayImg, frameStamp):
+        with self.timings.measure('motion'):
+            relMove = self.fd.get_relative_motion(grayImg, prevGrayImg)
+        self.lastHeadMove = relMove
+        with self.timings.measure('pointer'):
+            relMoveFiltered = self.ma.get_mouse_pointer_move(relMove[0], relMove[1])
+        if self.trace is not None:
+            self.trace.add_move(frameStamp, relMove[0], relMove[1], relMoveFiltered[0], relMoveFiltered[1])
+
+        # eye openness probabilities as (frame stamp, left, right)
+        eyeStates = []
+        # eyes of a face at the frame edge may be out of the frame, they are not classified then
+        eyesInFrame = eye_areas_in_frame(self.fd.detectedEyeAreas, grayImg.shape)
+        if not eyesInFrame:
+            self.timings.count('eyes out of frame')
+        if self.bd.isAsync:
+            # the pointer never waits for the classifier, results of the earlier frames are picked up here
+            if eyesInFrame:
+                with self.timings.measure('blink submit'):
+                    self.bd.submit(grayImg, self.fd.detectedEyeAreas[0], self.fd.detectedEyeAreas[1], frameStamp)
+            eyeStates = self.bd.results()
+        # check state only if mouse is not moving
+        elif eyesInFrame and u.distance(relMoveFiltered, [0, 0]) < self.stillMoveThreshold:
+            with self.timings.measure('blink'):
+                lblink, rblink = self.bd.predict_states(grayImg, self.fd.detectedEyeAreas[0],
+                                                        self.fd.detectedEyeAreas[1], int(round(frameStamp * 1000)))
+            eyeStates = [(frameStamp, lblink, rblink)]
+
+        blinkEvents = []
+        for stamp, lblink, rblink in eyeStates:
+            with self.timings.measure('analysis'):
+                blinkEvent = self.ma.analyze_blink_event((lblink, rblink), int(round(stamp * 1000)))
+            if self.trace is not None:
+                self.trace.add_eyes(stamp, lblink, rblink, blinkEvent)
+            if blinkEvent != BlinkEvent.NoBlink:
+                self.timings.add('frame to event', time.time() - stamp)
+                blinkEvents.append(blinkEvent)
+
+        return relMoveFiltered, blinkEvents
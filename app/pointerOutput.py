@@ -0,0 +1,119 @@
+import threading
+import time
+
+
+# spreads the pointer moves of the processed frames over time and outputs them at a fixed rate (e.g. 60-120 Hz),
+# so that the pointer moves smoothly at any camera frame rate.
+# The pending move is output at the speed that completes it in one frame interval, measured from the frame stamps.
+# When the next frame is late, the pointer keeps moving at the head speed of the last frame for up to maxPrediction
+# seconds. The predicted excess is taken back from the later output: the next moves in the same direction are
+# shortened, so the pointer does not step back while the head keeps moving, a move in the opposite direction
+# is extended, and a frame without motion (the head stopped) returns the pointer and stops the prediction.
+# So the total pointer move equals the total of the frame moves. Fractions of pixels are carried over
+class PointerOutput:
+    def __init__(self, moveFunction, rate=120.):
+        # called with integer dx, dy from the output thread
+        self.moveFunction = moveFunction
+        self.rate = rate
+        self.maxPrediction = 0.04
+        # frame interval limits, seconds
+        self.minFrameInterval = 1. / 60
+        self.maxFrameInterval = 0.2
+        # frame moves not output yet
+        self.__pending = [0., 0.]
+        # output speed of the pending move, pixels per second
+        self.__outputSpeed = [0., 0.]
+        # head speed of the last frame, the prediction continues at it
+        self.__velocity = [0., 0.]
+        self.__remainder = [0., 0.]
+        # predicted move output beyond the frame moves, signed
+        self.__overshoot = [0., 0.]
+        self.__lastFrameStamp = None
+        self.__lock = threading.Lock()
+        self.__isRunning = False
+        self.__thread = None
+
+    # adds the move of the frame taken at stamp (seconds), in pixels, fractions included
+    def add_move(self, dx, dy, stamp):
+        with self.__lock:
+            interval = 1. / 25
+            if self.__lastFrameStamp is not None:
+                interval = min(max(stamp - self.__lastFrameStamp, self.minFrameInterval), self.maxFrameInterval)
+            self.__lastFrameStamp = stamp
+            for i, move in enumerate((dx, dy)):
+                self.__velocity[i] = move / interval
+                overshoot = self.__overshoot[i]
+                if overshoot * move > 0:
+                    # this part of the move was already output by the prediction
+                    taken = overshoot if abs(overshoot) < abs(move) else move
+                    move -= taken
+                    overshoot -= taken
+                else:
+                    # the head turned back or stopped, the predicted part is returned
+                    move -= overshoot
+                    overshoot = 0.
+                self.__overshoot[i] = overshoot
+                self.__pending[i] += move
+                self.__outputSpeed[i] = abs(self.__pending[i]) / interval
+
+    # drops the pending move, e.g. when the pointer control is disabled
+    def clear(self):
+        with self.__lock:
+            self.__pending = [0., 0.]
+            self.__outputSpeed = [0., 0.]
+            self.__velocity = [0., 0.]
+            self.__remainder = [0., 0.]
+            self.__overshoot = [0., 0.]
+
+    # advances the output by dt seconds, returns the integer move
+    def tick(self, dt):
+        move = [0, 0]
+        with self.__lock:
+            for i in range(2):
+                step = 0.
+                pending = self.__pending[i]
+                timeLeft = dt
+                if pending != 0:
+                    size = min(self.__outputSpeed[i] * dt, abs(pending))
+                    step = size if pending > 0 else -size
+                    self.__pending[i] -= step
+                    timeLeft = dt - size / self.__outputSpeed[i] if self.__outputSpeed[i] > 0 else 0.
+                velocity = self.__velocity[i]
+                if self.__pending[i] == 0 and velocity != 0 and timeLeft > 0:
+                    # at most maxPrediction seconds of the head speed ahead of the frame moves
+                    sign = 1. if velocity > 0 else -1.
+                    available = max(abs(velocity) * self.maxPrediction - sign * self.__overshoot[i], 0.)
+                    size = min(abs(velocity) * timeLeft, available)
+                    self.__overshoot[i] += sign * size
+                    step += sign * size
+                out = step + self.__remainder[i]
+                move[i] = int(round(out))
+                self.__remainder[i] = out - move[i]
+        if move[0] != 0 or move[1] != 0:
+            self.moveFunction(move[0], move[1])
+        return move
+
+    def start(self):
+        self.__isRunning = True
+        self.__thread = threading.Thread(target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        self.__isRunning = False
+        if self.__thread:
+            self.__thread.join(1)
+
+    def __run(self):
+        interval = 1. / self.rate
+        lastTime = time.time()
+        nextTime = lastTime + interval
+        while self.__isRunning:
+            delay = nextTime - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.time()
+            self.tick(now - lastTime)
+            lastTime = now
+            # keep the rate, but do not try to catch up after a long stall
+            nextTime = max(nextTime + interval, now)
@@ -0,0 +1,137 @@
+import multiprocessing
+import Queue
+import time
+from frameSource import open_frame_source, PacedSource
+
+
+# Multi-process mode: frame capture and face detection run in their own processes, so that they use other cores
+# and do not take the GIL from the pointer processing. Frames are shared through SharedFrameRingBuffer,
+# only small requests and results go through the queues.
+# Processes are started with fork on Linux and macOS. On Windows the main script would be re-imported
+# by every child process, the application does not support the mode there.
+
+
+# capture process main function: reads the frame source into the shared buffer.
+# Commands: (width, height, fps) changes the capture mode, None stops the process.
+# Mode changes are answered with (mode, True if the source took it), isLive tells if the source is a live camera
+def _capture_process(sourceSpec, frameBuffer, commands, modeResults, isLive):
+    cam = open_frame_source(sourceSpec)
+    isLive.value = cam.isLive
+    if not cam.isLive:
+        cam = PacedSource(cam)
+    while True:
+        try:
+            command = commands.get_nowait()
+            if command is None:
+                break
+            modeResults.put((command, cam.set_mode(*command)))
+        except Queue.Empty:
+            pass
+        ret, img = cam.read()
+        if not ret:
+            time.sleep(0.01)
+            continue
+        frameBuffer.publish(img)
+    cam.release()
+
+
+# grabs frames from the frame source into the SharedFrameRingBuffer in a separate process
+class CaptureProcess:
+    def __init__(self, sourceSpec, frameBuffer):
+        self.__commands = multiprocessing.Queue()
+        self.__modeResults = multiprocessing.Queue()
+        # set by the process once the source is open
+        self.__isLive = multiprocessing.Value('b', False)
+        self.__process = multiprocessing.Process(
+            target=_capture_process,
+            args=(sourceSpec, frameBuffer, self.__commands, self.__modeResults, self.__isLive))
+        self.__process.daemon = True
+
+    def start(self):
+        self.__process.start()
+
+    # true if the source is a live camera, recorded sources can't change their mode
+    def is_live(self):
+        return bool(self.__isLive.value)
+
+    # requests the capture resolution and frame rate change, the result comes with mode_result()
+    def set_mode(self, width, height, fps):
+        self.__commands.put((width, height, fps))
+
+    # returns ((width, height, fps), True if the source took it) of the last mode change, None if none came
+    def mode_result(self):
+        result = None
+        while True:
+            try:
+                result = self.__modeResults.get_nowait()
+            except Queue.Empty:
+                return result
+
+    def stop(self):
+        self.__commands.put(None)
+        self.__process.join(3)
+        if self.__process.is_alive():
+            self.__process.terminate()
+
+
+# face detection process main function. Requests are (frame sequence, current face area or None), None stops.
+# Results are (frame sequence, found face area or None, frame shape); frames overwritten during the detection
+# are reported with None shape
+def _face_detection_process(frameBuffer, requests, results):
+    from faceDetector import FaceAndMovementDetector
+    fd = FaceAndMovementDetector(None)
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        sequence, faceArea = request
+        frame = frameBuffer.get(sequence)
+        if frame is None:
+            results.put((sequence, None, None))
+            continue
+        # start from the face known to the main process, to search in the window around it first
+        if faceArea is not None:
+            fd.set_detected_face(faceArea, frame.gray.shape)
+        else:
+            fd.reset()
+        faceArea = fd.search_face(frame.gray)
+        results.put((sequence, faceArea, frame.gray.shape if frameBuffer.is_valid(frame) else None))
+
+
+# runs the face detection in a separate process, replaces FaceAndMovementDetector.start_detect_face_async().
+# update() is called from the main loop: it hands the results over to the detector
+# and requests a new detection when the detector policy says it is due
+class FaceDetectionProcess:
+    def __init__(self, frameBuffer):
+        self.__frameBuffer = frameBuffer
+        self.__requests = multiprocessing.Queue()
+        self.__results = multiprocessing.Queue()
+        self.__process = multiprocessing.Process(target=_face_detection_process,
+                                                 args=(frameBuffer, self.__requests, self.__results))
+        self.__process.daemon = True
+        self.__isPending = False
+
+    def start(self):
+        self.__process.start()
+
+    def update(self, fd):
+        try:
+            sequence, faceArea, frameShape = self.__results.get_nowait()
+            self.__isPending = False
+            if frameShape is not None:
+                fd.set_detected_face(faceArea, frameShape)
+        except Queue.Empty:
+            pass
+        if self.__isPending or not fd.is_detection_due(int(round(time.time() * 1000))):
+            return
+        frame = self.__frameBuffer.latest()
+        if frame is None:
+            return
+        self.__requests.put((frame.sequence, fd.current_face_area() if fd.isFaceDetected else None))
+        self.__isPending = True
+
+    def stop(self):
+        self.__requests.put(None)
+        self.__process.join(1)
+        if self.__process.is_alive():
+            self.__process.terminate()
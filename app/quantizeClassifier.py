@@ -0,0 +1,86 @@
+__author__ = "Roman Semenyk"
+__copyright__ = "Copyright 2017, VirtualMousePad"
+__license__ = "GPLv3"
+
+# Offline conversion of the eye state classifier to int8, see inferenceBackends.quantize_model().
+# Calibrates activation ranges on a directory of eye images and reports the int8 model accuracy
+# against the float model. The int8 model is simulated with float arithmetic, it is not faster here and
+# is not used by the application: the report shows the accuracy cost for a runtime with int8 kernels.
+# usage:
+#   python ./app/quantizeClassifier.py --calibration eyes_dir [--evaluation eyes_test_dir] [--output file.npz]
+
+import argparse
+import time
+import numpy as np
+from eyeDataset import load_eye_crops, preprocess_crops
+from inferenceBackends import create_backend, quantize_model, Int8Backend
+
+nn_definition_file = 'classifier/model_deploy.prototxt'
+nn_weights_file = 'classifier/model_weights_97.22.caffemodel'
+nn_int8_weights_file = 'classifier/model_weights_int8.npz'
+
+
+# runs the backend over data in batches, returns open eye probabilities and mean time per batch in ms
+def run_backend(backend, data, batchSize=2):
+    probs = np.empty(len(data), np.float32)
+    startTime = time.time()
+    for i in range(0, len(data), batchSize):
+        batch = data[i:i + batchSize]
+        buf = backend.input_buffer(len(batch))
+        buf[...] = batch
+        probs[i:i + len(batch)] = backend.forward(buf)[:, 1]
+    batches = (len(data) + batchSize - 1) // batchSize
+    return probs, (time.time() - startTime) * 1000. / max(batches, 1)
+
+
+# compares the int8 model with the float one on the preprocessed data, returns report dictionary
+def accuracy_report(floatBackend, int8Backend, data, labels, threshold=0.5):
+    floatProbs, floatMs = run_backend(floatBackend, data)
+    int8Probs, int8Ms = run_backend(int8Backend, data)
+    report = {'images': len(data),
+              'floatBatchMs': floatMs,
+              'int8BatchMs': int8Ms,
+              'maxProbDiff': float(np.abs(floatProbs - int8Probs).max()),
+              'meanProbDiff': float(np.abs(floatProbs - int8Probs).mean()),
+              'decisionAgreement': float(np.mean((floatProbs > threshold) == (int8Probs > threshold)))}
+    isLabelled = labels >= 0
+    if np.any(isLabelled):
+        report['floatAccuracy'] = float(np.mean((floatProbs[isLabelled] > threshold) == labels[isLabelled]))
+        report['int8Accuracy'] = float(np.mean((int8Probs[isLabelled] > threshold) == labels[isLabelled]))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Converts the eye state classifier to int8')
+    parser.add_argument('--calibration', required=True, help='directory with eye images for calibration')
+    parser.add_argument('--evaluation', help='directory with eye images for the accuracy report, '
+                                             'calibration images are used if not set')
+    parser.add_argument('--max-images', type=int, default=2000, help='max number of calibration images')
+    parser.add_argument('--clip-percentile', type=float, default=99.99, help='activation range percentile')
+    parser.add_argument('--output', default=nn_int8_weights_file)
+    parser.add_argument('--nn-definition', default=nn_definition_file)
+    parser.add_argument('--nn-weights', default=nn_weights_file)
+    args = parser.parse_args()
+
+    crops, labels = load_eye_crops(args.calibration, args.max_images)
+    if not crops:
+        parser.error('no eye images found in %s' % args.calibration)
+    model = quantize_model(args.nn_definition, args.nn_weights, preprocess_crops(crops), args.clip_percentile)
+    np.savez(args.output, **model)
+    print "Calibrated on %d images, int8 model saved to %s" % (len(crops), args.output)
+
+    if args.evaluation:
+        crops, labels = load_eye_crops(args.evaluation)
+    report = accuracy_report(create_backend('numpy', args.nn_definition, args.nn_weights),
+                             Int8Backend(args.nn_definition, args.output),
+                             preprocess_crops(crops), labels)
+    print "Evaluated on %d images" % report['images']
+    print "Batch of 2 time: float %.2f ms, int8 %.2f ms" % (report['floatBatchMs'], report['int8BatchMs'])
+    print "Open probability difference: max %.4f, mean %.4f" % (report['maxProbDiff'], report['meanProbDiff'])
+    print "Open/closed decision agreement: %.2f%%" % (report['decisionAgreement'] * 100)
+    if 'floatAccuracy' in report:
+        print "Accuracy: float %.2f%%, int8 %.2f%%" % (report['floatAccuracy'] * 100, report['int8Accuracy'] * 100)
+
+
+if __name__ == '__main__':
+    main()
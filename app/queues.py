@@ -0,0 +1,37 @@
+import threading
+import time
+from collections import deque
+
+
+# bounded queue between threads. When full, putting a new item drops the oldest one,
+# so a slow consumer always works on the most recent data
+class DropOldestQueue:
+    def __init__(self, maxSize=2):
+        self.__cond = threading.Condition()
+        self.__items = deque([], maxlen=maxSize)
+        self.droppedCount = 0
+
+    # adds the item, returns True if the oldest item was dropped to make room for it
+    def put(self, item):
+        with self.__cond:
+            isFull = len(self.__items) == self.__items.maxlen
+            if isFull:
+                self.droppedCount += 1
+            self.__items.append(item)
+            self.__cond.notify()
+            return isFull
+
+    # returns the oldest item, waits up to timeout seconds for it. Returns None on timeout
+    def get(self, timeout=None):
+        with self.__cond:
+            if timeout is not None:
+                endTime = time.time() + timeout
+            while not self.__items:
+                if timeout is None:
+                    self.__cond.wait()
+                else:
+                    remaining = endTime - time.time()
+                    if remaining <= 0:
+                        return None
+                    self.__cond.wait(remaining)
+            return self.__items.popleft()
@@ -0,0 +1,149 @@
+__author__ = "Roman Semenyk"
+__copyright__ = "Copyright 2017, VirtualMousePad"
+__license__ = "GPLv3"
+
+# Offline replay of the analyzer traces recorded by main.py (traceFile) or benchmark.py (--trace).
+# Re-runs MotionAndBlinkAnalyzer and the blink event to mouse action mapping over the recorded head moves
+# and eye states at CPU speed and compares the results with the recording, so that the pointer and blink settings
+# can be tuned without sitting in front of the camera. Every setting takes a comma separated list of values,
+# all the combinations are replayed.
+# usage:
+#   python ./app/replayTrace.py session.trace [--smoothness 6,10,14] [--long-blink-delay 300,400] [--json r.json]
+
+import argparse
+import itertools
+import json
+import math
+import time
+import numpy as np
+from analyzerTrace import read_trace, MoveRecord, EyesRecord
+from motionAndBlinkAnalyzer import MotionAndBlinkAnalyzer, BlinkEvent
+from mouseAndKeyboard import NullBackend, blink_event_actions
+
+# records are converted to Python lists in chunks, the memory-mapped trace is never loaded whole
+chunkSize = 65536
+
+
+# returns {'moves', 'eyeStates', 'events', 'pathLength', 'seconds'} of the trace as it was recorded
+def recorded_summary(trace):
+    moves = trace[trace['kind'] == MoveRecord]
+    eyes = trace[trace['kind'] == EyesRecord]
+    events = {}
+    for event, count in zip(*np.unique(eyes['event'], return_counts=True)):
+        if event != BlinkEvent.NoBlink:
+            events[BlinkEvent.blink_event_to_text(int(event))] = int(count)
+    return {'moves': len(moves),
+            'eyeStates': len(eyes),
+            'events': events,
+            'pathLength': float(np.hypot(moves['moveX'], moves['moveY']).sum()),
+            'seconds': float(trace[-1]['stamp'] - trace[0]['stamp']) if len(trace) else 0.}
+
+
+# replays the trace through a new analyzer with the settings {'sensitivity', 'smoothness', 'acceleration',
+# 'longBlinkDelay', 'doubleBlinkDelay', 'naturalBlinkDelay'}. Blink events are mapped to the actions of NullBackend.
+# Returns {'events', 'buttonActions', 'pathLength', 'moveDiff', 'eventMismatches', 'replaySeconds',
+# 'recordsPerSecond'}; moveDiff is the mean absolute difference from the recorded pointer moves in pixels,
+# eventMismatches is the number of eye states where the returned event differs from the recorded one
+def replay(trace, settings, subPixelMoves):
+    ma = MotionAndBlinkAnalyzer()
+    ma.subPixelMoves = subPixelMoves
+    ma.set_sensitivity(settings['sensitivity'])
+    ma.set_smoothness(settings['smoothness'])
+    ma.set_acceleration_level(settings['acceleration'])
+    ma.longBlinkDelay = settings['longBlinkDelay']
+    ma.doubleBlinkDelay = settings['doubleBlinkDelay']
+    ma.naturalBlinkDelay = settings['naturalBlinkDelay']
+    if len(trace):
+        ma.reset_blink_timing(int(round(trace[0]['stamp'] * 1000)))
+    backend = NullBackend()
+    events = {}
+    pathLength = 0.
+    moveDiff = 0.
+    moveCount = 0
+    eventMismatches = 0
+
+    startTime = time.time()
+    for begin in range(0, len(trace), chunkSize):
+        chunk = trace[begin:begin + chunkSize]
+        for kind, stamp, recordedEvent, headDx, headDy, moveX, moveY, openLeft, openRight in zip(
+                chunk['kind'].tolist(), chunk['stamp'].tolist(), chunk['event'].tolist(),
+                chunk['headDx'].tolist(), chunk['headDy'].tolist(), chunk['moveX'].tolist(), chunk['moveY'].tolist(),
+                chunk['openLeft'].tolist(), chunk['openRight'].tolist()):
+            if kind == MoveRecord:
+                move = ma.get_mouse_pointer_move(headDx, headDy)
+                pathLength += math.hypot(move[0], move[1])
+                moveDiff += abs(move[0] - moveX) + abs(move[1] - moveY)
+                moveCount += 1
+                continue
+            event = ma.analyze_blink_event((openLeft, openRight), int(round(stamp * 1000)))
+            if event != recordedEvent:
+                eventMismatches += 1
+            if event != BlinkEvent.NoBlink:
+                name = BlinkEvent.blink_event_to_text(event)
+                events[name] = events.get(name, 0) + 1
+                for method, args in blink_event_actions(event):
+                    getattr(backend, method)(*args)
+    elapsed = time.time() - startTime
+
+    return {'events': events,
+            'buttonActions': backend.buttonCount,
+            'pathLength': pathLength,
+            'moveDiff': moveDiff / moveCount if moveCount else 0.,
+            'eventMismatches': eventMismatches,
+            'replaySeconds': elapsed,
+            'recordsPerSecond': len(trace) / elapsed if elapsed > 0 else 0.}
+
+
+def format_events(events):
+    return ', '.join('%s: %d' % (k, v) for k, v in sorted(events.items())) or 'none'
+
+
+def main():
+    defaults = MotionAndBlinkAnalyzer()
+    parser = argparse.ArgumentParser(description='Replays the analyzer trace with different settings')
+    parser.add_argument('trace', help='trace file recorded by main.py or benchmark.py --trace')
+    parser.add_argument('--sensitivity', default='25', help='pointer sensitivity values, 0 - 50')
+    parser.add_argument('--smoothness', default='10', help='pointer smoothness values, 2 - 20')
+    parser.add_argument('--acceleration', default='3', help='pointer acceleration levels, 0 - 5')
+    parser.add_argument('--long-blink-delay', default=str(defaults.longBlinkDelay), help='ms')
+    parser.add_argument('--double-blink-delay', default=str(defaults.doubleBlinkDelay), help='ms')
+    parser.add_argument('--natural-blink-delay', default=str(defaults.naturalBlinkDelay), help='ms')
+    parser.add_argument('--json', help='write results to this json file')
+    args = parser.parse_args()
+
+    trace = read_trace(args.trace)
+    recorded = recorded_summary(trace)
+    moves = trace[trace['kind'] == MoveRecord]
+    # pointer moves in fractions of pixels were recorded with the pointer output enabled
+    subPixelMoves = bool(np.any(moves['moveX'] != np.round(moves['moveX'])) or
+                         np.any(moves['moveY'] != np.round(moves['moveY'])))
+    print "Trace: %d records, %d moves, %d eye states, %.1f s" % (
+        len(trace), recorded['moves'], recorded['eyeStates'], recorded['seconds'])
+    print "Recorded: path %.1f px, events: %s" % (recorded['pathLength'], format_events(recorded['events']))
+
+    names = ('sensitivity', 'smoothness', 'acceleration', 'longBlinkDelay', 'doubleBlinkDelay', 'naturalBlinkDelay')
+    values = [[float(v) for v in args.sensitivity.split(',')],
+              [float(v) for v in args.smoothness.split(',')],
+              [int(v) for v in args.acceleration.split(',')],
+              [int(v) for v in args.long_blink_delay.split(',')],
+              [int(v) for v in args.double_blink_delay.split(',')],
+              [int(v) for v in args.natural_blink_delay.split(',')]]
+    results = []
+    for combination in itertools.product(*values):
+        settings = dict(zip(names, combination))
+        result = replay(trace, settings, subPixelMoves)
+        result['settings'] = settings
+        results.append(result)
+        print "sens %g smooth %g accel %d long %d double %d natural %d:" % combination
+        print "    path %.1f px, move difference %.2f px, event mismatches %d, button actions %d, %.0f records/s" % (
+            result['pathLength'], result['moveDiff'], result['eventMismatches'], result['buttonActions'],
+            result['recordsPerSecond'])
+        print "    events: %s" % format_events(result['events'])
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'recorded': recorded, 'replays': results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
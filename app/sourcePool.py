@@ -0,0 +1,202 @@
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from frameSource import open_frame_source, PacedSource
+from frameBuffer import FrameRingBuffer
+from motionAndBlinkAnalyzer import MotionAndBlinkAnalyzer
+from multiFaceTracker import MultiFaceTracker
+from metrics import StageTimings
+
+
+# one camera station of the SourcePool: frames of its source go into its own frame buffer, its faces are tracked
+# by its own multi-face tracker. Results and events of the station carry its sourceId
+class SourceStation:
+    def __init__(self, sourceId, sourceSpec, tracker):
+        self.sourceId = sourceId
+        self.sourceSpec = sourceSpec
+        self.tracker = tracker
+        self.frameBuffer = FrameRingBuffer()
+        # last processed frame, optical flow of the next frame is calculated against it
+        self.prevFrame = None
+        self.processedCount = 0
+        # frames published while the pool was busy with the other stations
+        self.droppedCount = 0
+        # recorded source has no more frames
+        self.isEnded = False
+        self.__thread = None
+        self.__stopFlag = False
+
+    # grabs frames of the source into the frame buffer in background thread.
+    # Recorded sources are paced at their frame rate if realtime is set
+    def start_capture(self, realtime=True):
+        self.__stopFlag = False
+        self.__thread = threading.Thread(target=self.__grab_frames, args=(realtime,))
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop_capture(self):
+        self.__stopFlag = True
+        if self.__thread:
+            self.__thread.join(3)
+
+    def __grab_frames(self, realtime):
+        cam = open_frame_source(self.sourceSpec)
+        isRecorded = not cam.isLive
+        if realtime and isRecorded:
+            cam = PacedSource(cam)
+        while not self.__stopFlag:
+            ret, img = cam.read()
+            if not ret:
+                if isRecorded:
+                    self.isEnded = True
+                    break
+                time.sleep(0.01)
+                continue
+            self.frameBuffer.publish(img)
+        cam.release()
+
+    # returns (frame, previous frame) if a frame came since the last processed one, None otherwise
+    def next_frame(self):
+        frame = self.frameBuffer.latest()
+        prevFrame = self.prevFrame
+        if frame is None or (prevFrame is not None and frame.sequence == prevFrame.sequence):
+            return None
+        if prevFrame is None or not self.frameBuffer.is_valid(prevFrame) or prevFrame.gray.shape != frame.gray.shape:
+            prevFrame = frame
+        else:
+            self.droppedCount += frame.sequence - prevFrame.sequence - 1
+        return frame, prevFrame
+
+
+# motion part of the station frame processing, runs in the pool threads
+def _station_motion(request):
+    station, frame, prevFrame = request
+    return station.tracker.process_motion(frame.gray, prevFrame.gray)
+
+
+# Processes several camera stations in one process, e.g. of the workstations around one machine.
+# Every source is read by its own grabber thread, the rest is shared: one background thread scans the frames
+# of all the stations for faces, the optical flow of the stations runs in the pool of worker threads
+# (OpenCV releases the GIL), and the eyes of all the faces of all the stations are classified in one batch.
+# The dlib models and the classifier are loaded once for all the stations
+class SourcePool:
+    def __init__(self, faceDetector, blinkDetector, timings=None, analyzerFactory=MotionAndBlinkAnalyzer, workers=4):
+        # template detector with the dlib models, see MultiFaceTracker
+        self.fd = faceDetector
+        self.bd = blinkDetector
+        self.timings = timings if timings is not None else StageTimings()
+        self.analyzerFactory = analyzerFactory
+        self.stations = []
+        # faces tracked per station
+        self.maxFacesPerSource = 1
+        # the eyes of all the stations are classified in one batch, otherwise every station is classified apart
+        self.batchEnabled = True
+        self.__pool = ThreadPool(workers) if workers > 1 else None
+        self.__detectionThread = None
+        self.isDetecting = False
+
+    # adds the station for the source spec (see frameSource.open_frame_source), returns the SourceStation
+    def add_source(self, sourceId, sourceSpec):
+        tracker = MultiFaceTracker(self.fd, self.bd, self.timings, self.analyzerFactory)
+        tracker.maxFaces = self.maxFacesPerSource
+        station = SourceStation(sourceId, sourceSpec, tracker)
+        self.stations.append(station)
+        return station
+
+    # returns the station with the source id or None
+    def station(self, sourceId):
+        for station in self.stations:
+            if station.sourceId == sourceId:
+                return station
+        return None
+
+    # starts the grabber threads of all the stations
+    def start_capture(self, realtime=True):
+        for station in self.stations:
+            station.start_capture(realtime)
+
+    # true when all the sources are recorded ones and have no more frames
+    def all_ended(self):
+        return all(station.isEnded for station in self.stations)
+
+    # returns the list of (station, frame, previous frame) for the stations with new frames
+    def ready_frames(self):
+        ready = []
+        for station in self.stations:
+            frames = station.next_frame()
+            if frames is not None:
+                ready.append((station,) + frames)
+        return ready
+
+    # waits up to timeout seconds for new frames, returns ready_frames()
+    def wait_frames(self, timeout):
+        endTime = time.time() + timeout
+        while True:
+            ready = self.ready_frames()
+            if ready or time.time() >= endTime:
+                return ready
+            time.sleep(0.002)
+
+    # runs the face detection of the stations which are due for it, on their latest frames
+    def detect_faces(self):
+        for station in self.stations:
+            frame = station.frameBuffer.latest()
+            if frame is not None:
+                station.tracker.detect_faces_if_due(frame.gray)
+
+    # scans the stations for faces in background thread
+    def start_detect_faces_async(self):
+        self.isDetecting = True
+        self.__detectionThread = threading.Thread(target=self.__detectFacesAsync)
+        self.__detectionThread.daemon = True
+        self.__detectionThread.start()
+
+    def __detectFacesAsync(self):
+        while self.isDetecting:
+            self.detect_faces()
+            time.sleep(0.05)
+
+    # processes the frames returned by ready_frames().
+    # Returns the list of (station, frame, list of (track, filtered pointer move, list of blink events))
+    def process_frames(self, ready):
+        if not ready:
+            return []
+        with self.timings.measure('motion all sources'):
+            if self.__pool is not None and len(ready) > 1:
+                motionResults = self.__pool.map(_station_motion, ready)
+            else:
+                motionResults = [_station_motion(request) for request in ready]
+
+        # faces with the classifiable eyes as (station index, result), in the order of the batch
+        faces = []
+        for i, ((station, frame, prevFrame), results) in enumerate(zip(ready, motionResults)):
+            faces.extend((i, r) for r in station.tracker.classifiable(results, frame.gray.shape))
+        with self.timings.measure('blink'):
+            if self.batchEnabled:
+                probs = self.bd.predict_frames([(ready[i][1].gray, r[0].fd.detectedEyeAreas) for i, r in faces])
+            else:
+                probs = []
+                for i in range(len(ready)):
+                    probs.extend(self.bd.predict_faces(ready[i][1].gray,
+                                                       [r[0].fd.detectedEyeAreas for j, r in faces if j == i]))
+        self.timings.count('classified faces', len(faces))
+
+        processed = []
+        for i, ((station, frame, prevFrame), results) in enumerate(zip(ready, motionResults)):
+            station.tracker.analyze_eyes([r for j, r in faces if j == i],
+                                         [p for (j, r), p in zip(faces, probs) if j == i], frame.timestamp)
+            station.prevFrame = frame
+            if results:
+                station.processedCount += 1
+                self.timings.add('frame to move', time.time() - frame.timestamp)
+            processed.append((station, frame, results))
+        return processed
+
+    def stop(self):
+        self.isDetecting = False
+        if self.__detectionThread:
+            self.__detectionThread.join(1)
+        for station in self.stations:
+            station.stop_capture()
+        if self.__pool is not None:
+            self.__pool.close()
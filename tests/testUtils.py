@@ -0,0 +1,38 @@
+import os
+import sys
+
+# the application modules import each other by name, as when they are run from the app directory
+appDir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app'))
+if appDir not in sys.path:
+    sys.path.insert(0, appDir)
+
+classifierDir = os.path.abspath(os.path.join(appDir, '..', 'classifier'))
+
+
+# writes random weights of the eye state classifier into dirName as the .npz file the numpy backend reads,
+# returns (prototxt, weights) file names usable by BlinkDetector(..., backend='numpy')
+def write_random_classifier(dirName, seed=0):
+    import numpy as np
+    import inferenceBackends
+    definition = os.path.join(classifierDir, 'model_deploy.prototxt')
+    rng = np.random.RandomState(seed)
+    weights = {}
+    channels, size = 1, 32
+    for layer in inferenceBackends.parse_prototxt(definition)['layer']:
+        layerType = layer['type'][0]
+        if layerType == 'Convolution':
+            param = layer['convolution_param'][0]
+            outputs, kernel = param['num_output'][0], param['kernel_size'][0]
+            weights[layer['name'][0]] = [rng.randn(outputs, channels, kernel, kernel) * 0.1, rng.randn(outputs) * 0.1]
+            channels, size = outputs, size - kernel + 1
+        elif layerType == 'Pooling':
+            param = layer['pooling_param'][0]
+            kernel, stride = param['kernel_size'][0], param['stride'][0]
+            size = -(-(size - kernel) // stride) + 1
+        elif layerType == 'InnerProduct':
+            outputs = layer['inner_product_param'][0]['num_output'][0]
+            weights[layer['name'][0]] = [rng.randn(outputs, channels * size * size) * 0.05, rng.randn(outputs) * 0.1]
+            channels, size = outputs, 1
+    fileName = os.path.join(dirName, 'random_weights.npz')
+    inferenceBackends.save_weights(weights, fileName)
+    return definition, fileName
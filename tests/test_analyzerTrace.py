@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import testUtils
+from analyzerTrace import TraceWriter, read_trace, MoveRecord, EyesRecord, headerSize, traceDtype
+from motionAndBlinkAnalyzer import MotionAndBlinkAnalyzer, BlinkEvent
+from replayTrace import recorded_summary, replay
+
+defaultSettings = {'sensitivity': 25, 'smoothness': 10., 'acceleration': 3,
+                   'longBlinkDelay': 400, 'doubleBlinkDelay': 370, 'naturalBlinkDelay': 6000}
+
+
+class AnalyzerTraceTest(unittest.TestCase):
+    def setUp(self):
+        self.dirName = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.dirName, 'session.trace')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirName)
+
+    def test_round_trip(self):
+        writer = TraceWriter(self.fileName, bufferSize=4)
+        for i in range(10):
+            writer.add_move(i * 0.04, 0.5 * i, -0.25, i, -1)
+            writer.add_eyes(i * 0.04 + 0.01, 0.9, 0.1 * i, BlinkEvent.LeftEyeClosed if i == 5 else 0)
+        writer.close()
+        trace = read_trace(self.fileName)
+        self.assertEqual(len(trace), 20)
+        self.assertEqual(writer.recordCount, 20)
+        moves = trace[trace['kind'] == MoveRecord]
+        eyes = trace[trace['kind'] == EyesRecord]
+        np.testing.assert_array_equal(moves['stamp'], np.arange(10) * 0.04)
+        np.testing.assert_array_equal(moves['headDx'], np.arange(10) * 0.5)
+        np.testing.assert_array_equal(moves['moveX'], np.arange(10))
+        self.assertTrue(np.isnan(moves['openLeft']).all())
+        np.testing.assert_allclose(eyes['openRight'], np.arange(10) * 0.1, rtol=1e-6)
+        self.assertTrue(np.isnan(eyes['headDx']).all())
+        self.assertEqual(eyes['event'].tolist(), [0] * 5 + [BlinkEvent.LeftEyeClosed] + [0] * 4)
+
+    def test_records_are_readable_after_flush(self):
+        writer = TraceWriter(self.fileName, flushInterval=1000.)
+        writer.add_move(0., 1, 1, 1, 1)
+        self.assertEqual(len(read_trace(self.fileName)), 0)
+        writer.flush()
+        self.assertEqual(len(read_trace(self.fileName)), 1)
+        writer.close()
+
+    def test_append_drops_a_partial_record(self):
+        writer = TraceWriter(self.fileName)
+        writer.add_move(0., 1, 1, 1, 1)
+        writer.close()
+        with open(self.fileName, 'ab') as f:
+            f.write('\0' * (traceDtype.itemsize // 2))
+        writer = TraceWriter(self.fileName)
+        writer.add_eyes(1., 0.5, 0.5, 0)
+        writer.close()
+        self.assertEqual(os.path.getsize(self.fileName), headerSize + 2 * traceDtype.itemsize)
+        self.assertEqual(read_trace(self.fileName)['kind'].tolist(), [MoveRecord, EyesRecord])
+
+    def test_not_a_trace(self):
+        with open(self.fileName, 'wb') as f:
+            f.write('not a trace file at all')
+        self.assertRaises(ValueError, read_trace, self.fileName)
+        self.assertRaises(ValueError, TraceWriter, self.fileName)
+
+    # a session recorded with the analyzer replays to the same moves and events
+    def test_replay_reproduces_the_recording(self):
+        ma = MotionAndBlinkAnalyzer()
+        ma.reset_blink_timing(0)
+        writer = TraceWriter(self.fileName)
+        rng = np.random.RandomState(0)
+        for i in range(300):
+            stamp = i / 30.
+            headDx, headDy = rng.normal(0, 0.5, 2)
+            moveX, moveY = ma.get_mouse_pointer_move(headDx, headDy)
+            writer.add_move(stamp, headDx, headDy, moveX, moveY)
+            closed = 100 <= i < 106 or 200 <= i < 230
+            probs = (0.02, 0.02) if closed else (0.95, 0.95)
+            writer.add_eyes(stamp, probs[0], probs[1], ma.analyze_blink_event(probs, int(round(stamp * 1000))))
+        writer.close()
+
+        trace = read_trace(self.fileName)
+        summary = recorded_summary(trace)
+        self.assertEqual(summary['moves'], 300)
+        self.assertEqual(summary['events'], {'BlinkBoth': 1, 'LongBlink': 1})
+        result = replay(trace, defaultSettings, False)
+        self.assertEqual(result['eventMismatches'], 0)
+        self.assertEqual(result['moveDiff'], 0.)
+        self.assertEqual(result['events'], summary['events'])
+
+
+if __name__ == '__main__':
+    unittest.main()
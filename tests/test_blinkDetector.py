@@ -0,0 +1,156 @@
+import shutil
+import tempfile
+import time
+import unittest
+import numpy as np
+import testUtils
+import inferenceBackends
+from blinkDetector import BlinkDetector, eye_areas_in_frame
+from pipeline import FrameProcessor
+from motionAndBlinkAnalyzer import BlinkEvent
+from metrics import StageTimings
+
+# eye areas of a face at the left edge of a 160x120 frame: the left one reaches out of the frame
+inFrameAreas = [[20, 10, 40, 30], [50, 10, 70, 30]]
+edgeAreas = [[-5, 10, 3, 30], [50, 10, 70, 30]]
+
+
+# waits up to timeout seconds until the detector has n results, returns all of them
+def wait_results(bd, n, timeout=5.):
+    results = []
+    endTime = time.time() + timeout
+    while len(results) < n and time.time() < endTime:
+        results += bd.results()
+        time.sleep(0.01)
+    return results
+
+
+class EyeAreasTest(unittest.TestCase):
+    def test_eye_areas_in_frame(self):
+        shape = (120, 160)
+        self.assertTrue(eye_areas_in_frame(inFrameAreas, shape))
+        self.assertTrue(eye_areas_in_frame([[0, 0, 160, 120]], shape))
+        self.assertFalse(eye_areas_in_frame(edgeAreas, shape))
+        self.assertFalse(eye_areas_in_frame([[150, 10, 170, 30]], shape))
+        self.assertFalse(eye_areas_in_frame([[20, 110, 40, 121]], shape))
+        # empty area
+        self.assertFalse(eye_areas_in_frame([[20, 10, 20, 30]], shape))
+
+
+class BlinkDetectorTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        inferenceBackends.weightsCacheDir = None
+        cls.tmpDir = tempfile.mkdtemp()
+        cls.model = testUtils.write_random_classifier(cls.tmpDir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpDir)
+
+    def setUp(self):
+        self.bd = BlinkDetector(*self.model, backend='numpy')
+        self.img = np.random.RandomState(1).randint(0, 255, (120, 160)).astype(np.uint8)
+
+    def tearDown(self):
+        self.bd.stop_async()
+
+    def test_async_results_match_synchronous_ones(self):
+        expected = self.bd.predict_states(self.img, inFrameAreas[0], inFrameAreas[1], 1000)
+        self.bd = BlinkDetector(*self.model, backend='numpy')
+        self.bd.start_async()
+        self.bd.submit(self.img, inFrameAreas[0], inFrameAreas[1], 1.)
+        results = wait_results(self.bd, 1)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][0], 1.)
+        self.assertAlmostEqual(results[0][1], expected[0], places=5)
+        self.assertAlmostEqual(results[0][2], expected[1], places=5)
+
+    # regression: an empty eye image made cv2.resize raise and stopped the worker thread for good
+    def test_worker_survives_a_failed_request(self):
+        self.bd.start_async(maxQueueSize=4)
+        self.bd.submit(self.img, edgeAreas[0], edgeAreas[1], 1.)
+        self.bd.submit(self.img, inFrameAreas[0], inFrameAreas[1], 2.)
+        results = wait_results(self.bd, 1)
+        self.assertEqual([r[0] for r in results], [2.])
+        self.assertEqual(self.bd.failedCount, 1)
+        self.bd.submit(self.img, inFrameAreas[0], inFrameAreas[1], 3.)
+        self.assertEqual([r[0] for r in wait_results(self.bd, 1)], [3.])
+
+    # regression: the classifier process exited on the first empty eye image
+    def test_process_survives_a_failed_request(self):
+        bd = self.bd = BlinkDetector(*self.model, backend='numpy', loadModel=False)
+        bd.start_async(maxQueueSize=4, useProcess=True)
+        bd.submit(self.img, edgeAreas[0], edgeAreas[1], 1.)
+        bd.submit(self.img, inFrameAreas[0], inFrameAreas[1], 2.)
+        results = wait_results(bd, 1, timeout=20.)
+        self.assertEqual([r[0] for r in results], [2.])
+        self.assertEqual(bd.failedCount, 1)
+        self.assertTrue(bd.is_worker_alive())
+
+    def test_dead_process_is_detected(self):
+        bd = self.bd = BlinkDetector(*self.model, backend='numpy', loadModel=False)
+        bd.start_async(useProcess=True)
+        process = bd._BlinkDetector__workerProcess
+        process.terminate()
+        process.join(5)
+        self.assertFalse(bd.is_worker_alive())
+        # nothing is queued for the dead process
+        bd.submit(self.img, inFrameAreas[0], inFrameAreas[1], 1.)
+        self.assertTrue(bd._BlinkDetector__requests.empty())
+        self.assertEqual(bd.results(), [])
+
+
+class _FaceDetectorStub:
+    def __init__(self, eyeAreas):
+        self.detectedEyeAreas = eyeAreas
+
+    def get_relative_motion(self, grayImg, prevGrayImg):
+        return [0., 0.]
+
+
+class _AnalyzerStub:
+    def get_mouse_pointer_move(self, dx, dy):
+        return [dx, dy]
+
+    def analyze_blink_event(self, probs, stampMs):
+        return BlinkEvent.NoBlink
+
+
+class _BlinkDetectorStub:
+    def __init__(self, isAsync):
+        self.isAsync = isAsync
+        self.requests = []
+
+    def submit(self, grayImg, leftEyeArea, rightEyeArea, stamp):
+        self.requests.append(stamp)
+
+    def results(self):
+        return []
+
+    def predict_states(self, grayImg, leftEyeArea, rightEyeArea, nowMs=None):
+        self.requests.append(nowMs)
+        return 1., 1.
+
+
+class FrameProcessorEyeAreasTest(unittest.TestCase):
+    def check_eyes_out_of_frame_are_not_classified(self, isAsync):
+        img = np.zeros((120, 160), np.uint8)
+        bd = _BlinkDetectorStub(isAsync)
+        processor = FrameProcessor(_FaceDetectorStub(edgeAreas), bd, _AnalyzerStub(), StageTimings())
+        processor.process(img, img, 1.)
+        self.assertEqual(bd.requests, [])
+        self.assertEqual(processor.timings.counters['eyes out of frame'], 1)
+        processor.fd.detectedEyeAreas = inFrameAreas
+        processor.process(img, img, 2.)
+        self.assertEqual(len(bd.requests), 1)
+
+    def test_async_skips_eyes_out_of_frame(self):
+        self.check_eyes_out_of_frame_are_not_classified(True)
+
+    def test_sync_skips_eyes_out_of_frame(self):
+        self.check_eyes_out_of_frame_are_not_classified(False)
+
+
+if __name__ == '__main__':
+    unittest.main()
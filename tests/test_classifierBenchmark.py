@@ -0,0 +1,67 @@
+import unittest
+import numpy as np
+import testUtils
+from classifierBenchmark import closed_eye_roc, roc_auc, threshold_report, accuracy_report
+
+
+# probability that a random closed eye gets a lower open probability than a random open eye, ties count half
+def naive_auc(openProbs, labels):
+    closed = openProbs[labels == 0]
+    opened = openProbs[labels == 1]
+    wins = 0.
+    for c in closed:
+        wins += np.sum(c < opened) + 0.5 * np.sum(c == opened)
+    return wins / (len(closed) * len(opened))
+
+
+class RocTest(unittest.TestCase):
+    def test_separable(self):
+        openProbs = np.array([0.1, 0.2, 0.3, 0.7, 0.8, 0.9])
+        labels = np.array([0, 0, 0, 1, 1, 1])
+        thresholds, falseRates, trueRates = closed_eye_roc(openProbs, labels)
+        self.assertEqual(len(thresholds), 7)
+        self.assertTrue(np.all(np.diff(thresholds) > 0))
+        self.assertEqual((falseRates[0], trueRates[0]), (0., 0.))
+        self.assertEqual((falseRates[-1], trueRates[-1]), (1., 1.))
+        self.assertEqual(roc_auc(falseRates, trueRates), 1.)
+        self.assertEqual(roc_auc(*closed_eye_roc(openProbs, 1 - labels)[1:]), 0.)
+
+    def test_matches_pairwise_auc(self):
+        rng = np.random.RandomState(0)
+        labels = rng.randint(0, 2, 300)
+        # rounded, so that there are ties between the classes
+        openProbs = np.round(np.clip(rng.normal(0.35 + 0.3 * labels, 0.2), 0, 1), 2)
+        auc = roc_auc(*closed_eye_roc(openProbs, labels)[1:])
+        self.assertAlmostEqual(auc, naive_auc(openProbs, labels))
+        self.assertTrue(0.7 < auc < 0.95)
+
+    def test_equal_probabilities(self):
+        thresholds, falseRates, trueRates = closed_eye_roc(np.full(10, 0.5), np.array([0, 1] * 5))
+        self.assertEqual(falseRates.tolist(), [0., 1.])
+        self.assertAlmostEqual(roc_auc(falseRates, trueRates), 0.5)
+
+    def test_threshold_report(self):
+        openProbs = np.array([0.1, 0.6, 0.4, 0.9])
+        labels = np.array([0, 0, 1, 1])
+        report = threshold_report(openProbs, labels, 0.5)
+        self.assertEqual(report['accuracy'], 0.5)
+        self.assertEqual(report['falseClosedRate'], 0.5)
+        self.assertEqual(report['missedClosedRate'], 0.5)
+
+    def test_accuracy_report(self):
+        # unlabelled images are ignored, the best threshold separates the classes
+        openProbs = np.array([0.1, 0.2, 0.3, 0.5, 0.6, 0.7, 0.])
+        labels = np.array([0, 0, 0, 1, 1, 1, -1])
+        report = accuracy_report(openProbs, labels)
+        self.assertEqual(report['images'], 6)
+        self.assertEqual(report['auc'], 1.)
+        self.assertEqual(report['default']['accuracy'], 1.)
+        self.assertEqual(report['best']['accuracy'], 1.)
+        self.assertTrue(0.3 < report['best']['threshold'] <= 0.5)
+        report = accuracy_report(openProbs + 0.25, labels)
+        self.assertAlmostEqual(report['default']['accuracy'], 5 / 6.)
+        self.assertEqual(report['best']['accuracy'], 1.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import json
+import socket
+import time
+import unittest
+import testUtils
+from controlServer import ControlServer, bool_field, number_field, int_field
+
+
+class RequestFieldsTest(unittest.TestCase):
+    def test_bool_field_takes_json_booleans_only(self):
+        self.assertIs(bool_field({'enabled': False}, 'enabled'), False)
+        for value in ('false', '0', 0, 1, None, []):
+            self.assertRaises(ValueError, bool_field, {'enabled': value}, 'enabled')
+        self.assertRaises(KeyError, bool_field, {}, 'enabled')
+
+    def test_number_field(self):
+        self.assertEqual(number_field({'value': 3}, 'value'), 3.)
+        self.assertEqual(number_field({'value': 2.5}, 'value'), 2.5)
+        for value in (None, [], '3', True):
+            self.assertRaises(ValueError, number_field, {'value': value}, 'value')
+
+    def test_int_field(self):
+        self.assertEqual(int_field({'id': 2}, 'id'), 2)
+        for value in (None, [1], '2', 1.5, True):
+            self.assertRaises(ValueError, int_field, {'id': value}, 'id')
+
+
+class ControlServerTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = {}
+        self.server = ControlServer(self.handle, port=0)
+        self.server.start()
+        self.connections = []
+
+    def tearDown(self):
+        for sock, f in self.connections:
+            sock.close()
+        self.server.stop()
+
+    def handle(self, request):
+        cmd = request['cmd']
+        if cmd == 'set':
+            self.settings['value'] = number_field(request, 'value')
+        elif cmd == 'raw':
+            # unchecked conversion, as a handler may still do
+            self.settings['value'] = int(request['value'])
+        return {'settings': self.settings}
+
+    def connect(self):
+        sock = socket.create_connection(('127.0.0.1', self.server.port), 5)
+        f = sock.makefile('rw')
+        self.connections.append((sock, f))
+        return f
+
+    def request(self, f, request):
+        f.write(json.dumps(request) + '\n')
+        f.flush()
+        return json.loads(f.readline())
+
+    # regression: a TypeError in the handler killed the connection thread
+    def test_wrong_field_types_get_errors_and_keep_the_connection(self):
+        f = self.connect()
+        self.assertIn('error', self.request(f, {'cmd': 'set', 'value': None}))
+        self.assertIn('error', self.request(f, {'cmd': 'raw', 'value': [1]}))
+        self.assertIn('error', self.request(f, {'cmd': 'set'}))
+        self.assertIn('error', self.request(f, {'cmd': 'subscribe', 'source': 'all'}))
+        self.assertEqual(self.request(f, {'cmd': 'set', 'value': 3}), {'settings': {'value': 3.}})
+
+    def test_subscriber_receives_published_messages(self):
+        f = self.connect()
+        self.assertEqual(self.request(f, {'cmd': 'subscribe', 'source': 1}), {'ok': True})
+        self.server.publish({'source': 2, 'event': 'skipped'})
+        self.server.publish({'source': 1, 'event': 'click'})
+        self.assertEqual(json.loads(f.readline()), {'source': 1, 'event': 'click'})
+
+    def test_stalled_subscriber_does_not_block_publish(self):
+        f = self.connect()
+        self.request(f, {'cmd': 'subscribe'})
+        message = {'payload': 'x' * 10000}
+        startTime = time.time()
+        for i in range(2000):
+            self.server.publish(message)
+        self.assertLess(time.time() - startTime, 2.)
+        self.assertIn('settings', self.request(self.connect(), {'cmd': 'status'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
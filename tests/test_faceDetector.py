@@ -0,0 +1,53 @@
+import sys
+import time
+import types
+import unittest
+import numpy as np
+import testUtils
+
+# the tests do not run the dlib models, a stand-in module is used where dlib is not installed
+try:
+    import dlib
+except ImportError:
+    dlib = types.ModuleType('dlib')
+    dlib.get_frontal_face_detector = lambda: (lambda image, upsample: [])
+    sys.modules['dlib'] = dlib
+
+from faceDetector import FaceAndMovementDetector
+from frameBuffer import FrameRingBuffer
+
+
+# face search replaced by a scripted one: the first scan lasts while the grabber overwrites the whole buffer
+class _SlowScanDetector(FaceAndMovementDetector):
+    def __init__(self, frameBuffer):
+        FaceAndMovementDetector.__init__(self, None)
+        self.frameBuffer = frameBuffer
+        self.scannedFrames = []
+
+    def search_face(self, grayImg):
+        self.scannedFrames.append(self.frameBuffer.latest().sequence)
+        if len(self.scannedFrames) == 1:
+            for i in range(self.frameBuffer.size):
+                self.frameBuffer.publish(np.zeros((120, 160, 3), np.uint8))
+            return 1, 1, 20, 20
+        return 40, 30, 100, 90
+
+
+class BackgroundFaceDetectionTest(unittest.TestCase):
+    # regression: the result of a scan on an overwritten frame was applied
+    def test_result_of_an_overwritten_frame_is_dropped(self):
+        buf = FrameRingBuffer(size=4)
+        buf.publish(np.zeros((120, 160, 3), np.uint8))
+        fd = _SlowScanDetector(buf)
+        fd.start_detect_face_async(frame_buffer=buf)
+        endTime = time.time() + 5.
+        while not fd.isFaceDetected and time.time() < endTime:
+            time.sleep(0.01)
+        fd.stop()
+        self.assertEqual(fd.scannedFrames[:2], [1, 5])
+        self.assertEqual(fd.detectedFaceArea, (40, 30, 100, 90))
+        self.assertEqual(fd.timings.counters['overwritten face detections'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import multiprocessing
+import threading
+import time
+import unittest
+import numpy as np
+import testUtils
+from frameBuffer import FrameRingBuffer, SharedFrameRingBuffer
+
+
+def image(value, shape=(12, 16, 3)):
+    return np.full(shape, value, np.uint8)
+
+
+class FrameRingBufferTest(unittest.TestCase):
+    def test_published_frame_is_flipped_gray_and_read_only(self):
+        buf = FrameRingBuffer(size=4)
+        bgr = np.zeros((12, 16, 3), np.uint8)
+        bgr[:, 0] = 255
+        frame = buf.publish(bgr, timestamp=1.5)
+        self.assertIs(buf.latest(), frame)
+        self.assertEqual((frame.sequence, frame.timestamp), (1, 1.5))
+        self.assertEqual(frame.gray.shape, (12, 16))
+        self.assertTrue((frame.color[:, -1] == 255).all())
+        self.assertTrue((frame.gray[:, -1] == 255).all())
+        self.assertRaises(ValueError, frame.gray.fill, 0)
+        self.assertRaises(ValueError, frame.color.fill, 0)
+
+    def test_slot_is_overwritten_after_size_frames(self):
+        buf = FrameRingBuffer(size=4)
+        first = buf.publish(image(10))
+        for i in range(3):
+            buf.publish(image(20 + i))
+        self.assertTrue(buf.is_valid(first))
+        self.assertIs(buf.get(1), first)
+        buf.publish(image(50))
+        self.assertFalse(buf.is_valid(first))
+        self.assertIsNone(buf.get(1))
+        # the slot memory is reused, the old frame views see the new data
+        self.assertTrue((first.gray == 50).all())
+        self.assertEqual(buf.get(5).sequence, 5)
+
+    def test_wait_next_returns_the_next_frame(self):
+        buf = FrameRingBuffer(size=8, maxLag=2)
+        buf.publish(image(1))
+        buf.publish(image(2))
+        self.assertEqual(buf.wait_next(0).sequence, 1)
+        self.assertEqual(buf.wait_next(1).sequence, 2)
+        self.assertEqual(buf.droppedCount, 0)
+
+    def test_wait_next_skips_frames_beyond_max_lag(self):
+        buf = FrameRingBuffer(size=8, maxLag=2)
+        for i in range(6):
+            buf.publish(image(i))
+        frame = buf.wait_next(1)
+        self.assertEqual(frame.sequence, 5)
+        self.assertEqual(buf.droppedCount, 3)
+
+    def test_wait_next_takes_the_latest_when_the_next_is_overwritten(self):
+        buf = FrameRingBuffer(size=4, maxLag=10)
+        for i in range(9):
+            buf.publish(image(i))
+        self.assertEqual(buf.wait_next(2).sequence, 9)
+
+    def test_wait_next_times_out_and_wakes_up(self):
+        buf = FrameRingBuffer()
+        self.assertIsNone(buf.wait_next(0, 0.05))
+        timer = threading.Timer(0.05, buf.publish, (image(1),))
+        timer.start()
+        self.assertEqual(buf.wait_next(0, 2.).sequence, 1)
+        timer.join()
+
+    def test_resolution_change(self):
+        buf = FrameRingBuffer(size=2)
+        buf.publish(image(1))
+        frame = buf.publish(image(2, (24, 32, 3)))
+        self.assertEqual(frame.gray.shape, (24, 32))
+        self.assertEqual(buf.publish(image(3)).gray.shape, (12, 16))
+
+    def test_face_region_converts_only_around_the_face(self):
+        buf = FrameRingBuffer(size=2)
+        buf.roi = (4, 2, 8, 6)
+        frame = buf.publish(image(100))
+        self.assertEqual(frame.roi, (4, 2, 8, 6))
+        self.assertTrue((frame.gray[2:6, 4:8] == 100).all())
+        self.assertEqual(int(frame.gray.sum()), 100 * 16)
+        self.assertEqual(buf.convertedPixels, 16)
+        self.assertEqual(buf.totalPixels, 12 * 16)
+
+    def test_fps(self):
+        buf = FrameRingBuffer()
+        self.assertEqual(buf.fps(), 0.)
+        for i in range(6):
+            buf.publish(image(i), timestamp=i * 0.04)
+        self.assertAlmostEqual(buf.fps(), 25.)
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import cv2
+import testUtils
+from frameSource import NpzSource, ImageDirectorySource, VideoFileSource, open_frame_source, record_npz
+
+
+class FrameSourceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def frames(self, n=3, shape=(24, 32)):
+        return np.array([np.full(shape, 10 * i, np.uint8) for i in range(n)])
+
+    def test_npz_source_converts_gray_frames_to_bgr(self):
+        fileName = os.path.join(self.tmpDir, 'gray.npz')
+        np.savez(fileName, frames=self.frames(), fps=15.)
+        source = NpzSource(fileName)
+        self.assertEqual(source.fps, 15.)
+        self.assertFalse(source.isLive)
+        for i in range(3):
+            ret, img = source.read()
+            self.assertTrue(ret)
+            self.assertEqual(img.shape, (24, 32, 3))
+            self.assertTrue((img == 10 * i).all())
+        self.assertEqual(source.read(), (False, None))
+
+    def test_npz_source_default_fps(self):
+        fileName = os.path.join(self.tmpDir, 'nofps.npz')
+        np.savez(fileName, frames=self.frames(1))
+        self.assertEqual(NpzSource(fileName).fps, 25.)
+
+    def test_record_npz_round_trip(self):
+        fileName = os.path.join(self.tmpDir, 'in.npz')
+        np.savez(fileName, frames=self.frames(5), fps=20.)
+        recorded = os.path.join(self.tmpDir, 'out.npz')
+        self.assertEqual(record_npz(NpzSource(fileName), recorded, 3), 3)
+        source = NpzSource(recorded)
+        self.assertEqual(source.fps, 20.)
+        images = []
+        while True:
+            ret, img = source.read()
+            if not ret:
+                break
+            images.append(img)
+        self.assertEqual(len(images), 3)
+        self.assertTrue((images[2] == 20).all())
+
+    def test_image_directory_reads_images_in_name_order(self):
+        for i, name in enumerate(['b.png', 'a.png', 'c.png']):
+            cv2.imwrite(os.path.join(self.tmpDir, name), np.full((8, 8, 3), 10 * i, np.uint8))
+        with open(os.path.join(self.tmpDir, 'notes.txt'), 'w') as f:
+            f.write('not an image')
+        source = open_frame_source(self.tmpDir)
+        self.assertIsInstance(source, ImageDirectorySource)
+        values = []
+        while True:
+            ret, img = source.read()
+            if not ret:
+                break
+            values.append(int(img[0, 0, 0]))
+        self.assertEqual(values, [10, 0, 20])
+
+    def test_open_frame_source_by_spec(self):
+        fileName = os.path.join(self.tmpDir, 'session.NPZ')
+        with open(fileName, 'wb') as f:
+            np.savez(f, frames=self.frames(1))
+        self.assertIsInstance(open_frame_source(fileName), NpzSource)
+        self.assertRaises(IOError, open_frame_source, os.path.join(self.tmpDir, 'missing.avi'))
+        self.assertRaises(IOError, VideoFileSource, os.path.join(self.tmpDir, 'missing.avi'))
+
+
+if __name__ == '__main__':
+    unittest.main()
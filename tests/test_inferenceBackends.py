@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import testUtils
+import inferenceBackends
+from inferenceBackends import create_backend, quantize_model, Int8Backend, parse_prototxt, read_layers, \
+    _conv2d, _max_pool, _inner_product, _softmax
+
+
+# straightforward loops over the output positions, the reference for the vectorised layers
+def naive_conv2d(x, w, b, stride, pad):
+    x = np.pad(x, ((0, 0), (0, 0), (pad, pad), (pad, pad)), 'constant')
+    n, c, h, wd = x.shape
+    f, _, kh, kw = w.shape
+    out = np.zeros((n, f, (h - kh) // stride + 1, (wd - kw) // stride + 1))
+    for i in range(out.shape[2]):
+        for j in range(out.shape[3]):
+            window = x[:, :, i * stride:i * stride + kh, j * stride:j * stride + kw]
+            out[:, :, i, j] = np.tensordot(window, w, axes=([1, 2, 3], [1, 2, 3])) + b
+    return out
+
+
+# Caffe max pooling: the output size is rounded up, the last windows may reach past the input
+def naive_max_pool(x, k, stride):
+    n, c, h, w = x.shape
+    oh = -(-(h - k) // stride) + 1
+    ow = -(-(w - k) // stride) + 1
+    out = np.zeros((n, c, oh, ow), x.dtype)
+    for i in range(oh):
+        for j in range(ow):
+            out[:, :, i, j] = x[:, :, i * stride:i * stride + k, j * stride:j * stride + k].max(axis=(2, 3))
+    return out
+
+
+class NumpyLayersTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(3)
+
+    def test_conv2d_matches_the_naive_one(self):
+        for stride, pad in ((1, 0), (2, 0), (1, 1), (2, 2)):
+            x = self.rng.randn(2, 3, 11, 9).astype(np.float32)
+            w = self.rng.randn(4, 3, 3, 3).astype(np.float32)
+            b = self.rng.randn(4).astype(np.float32)
+            out = _conv2d(x, w, b, stride, pad)
+            expected = naive_conv2d(x, w, b, stride, pad)
+            self.assertEqual(out.shape, expected.shape)
+            self.assertTrue(np.allclose(out, expected, atol=1e-4), 'stride %d, pad %d' % (stride, pad))
+
+    def test_conv2d_without_bias(self):
+        x = self.rng.randn(1, 2, 6, 6).astype(np.float32)
+        w = self.rng.randn(3, 2, 2, 2).astype(np.float32)
+        self.assertTrue(np.allclose(_conv2d(x, w, None, 1, 0), naive_conv2d(x, w, np.zeros(3), 1, 0), atol=1e-4))
+
+    def test_max_pool_rounds_the_output_size_up(self):
+        # sizes where the windows fit exactly and where the last window is cut by the input border
+        for size, k, stride in ((27, 4, 2), (11, 2, 2), (8, 2, 2), (9, 3, 3), (7, 3, 2)):
+            x = self.rng.randn(2, 3, size, size + 1).astype(np.float32)
+            out = _max_pool(x, k, stride)
+            expected = naive_max_pool(x, k, stride)
+            self.assertEqual(out.shape, expected.shape, 'size %d, kernel %d, stride %d' % (size, k, stride))
+            self.assertTrue(np.array_equal(out, expected))
+
+    def test_max_pool_on_uint8(self):
+        x = self.rng.randint(0, 256, (1, 2, 7, 7)).astype(np.uint8)
+        out = _max_pool(x, 2, 2)
+        self.assertEqual(out.dtype, np.uint8)
+        self.assertTrue(np.array_equal(out, naive_max_pool(x, 2, 2)))
+
+    def test_inner_product_and_softmax(self):
+        x = self.rng.randn(3, 2, 2, 2).astype(np.float32)
+        w = self.rng.randn(5, 8).astype(np.float32)
+        b = self.rng.randn(5).astype(np.float32)
+        self.assertTrue(np.allclose(_inner_product(x, w.T, b), x.reshape(3, -1).dot(w.T) + b, atol=1e-5))
+        probs = _softmax(np.array([[1000., 1000.], [0., np.log(3.)]]))
+        self.assertTrue(np.allclose(probs, [[0.5, 0.5], [0.25, 0.75]]))
+
+
+class PrototxtTest(unittest.TestCase):
+    def test_classifier_definition(self):
+        definition = parse_prototxt(os.path.join(testUtils.classifierDir, 'model_deploy.prototxt'))
+        self.assertEqual(definition['layer'][0]['name'], ['data'])
+        layers = read_layers(os.path.join(testUtils.classifierDir, 'model_deploy.prototxt'))
+        self.assertEqual([layer['type'] for layer in layers],
+                         ['Input', 'Convolution', 'ReLU', 'Pooling', 'Convolution', 'ReLU', 'Pooling',
+                          'InnerProduct', 'ReLU', 'InnerProduct', 'Softmax'])
+        self.assertEqual((layers[3]['kernel'], layers[3]['stride']), (4, 2))
+
+    def test_numpy_backend_output(self):
+        inferenceBackends.weightsCacheDir = None
+        tmpDir = tempfile.mkdtemp()
+        try:
+            backend = create_backend('numpy', *testUtils.write_random_classifier(tmpDir))
+            data = backend.input_buffer(5)
+            data[...] = np.random.RandomState(4).uniform(-0.5, 0.5, data.shape)
+            probs = backend.forward(data)
+        finally:
+            shutil.rmtree(tmpDir)
+        self.assertEqual(probs.shape, (5, 2))
+        self.assertTrue(np.allclose(probs.sum(axis=1), 1.))
+
+
+class Int8ModelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        inferenceBackends.weightsCacheDir = None
+        cls.tmpDir = tempfile.mkdtemp()
+        cls.definition, cls.weights = testUtils.write_random_classifier(cls.tmpDir)
+        cls.data = np.random.RandomState(2).uniform(-0.5, 0.5, (64, 1, 32, 32)).astype(np.float32)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpDir)
+
+    def test_int8_model_follows_the_float_one(self):
+        modelFile = os.path.join(self.tmpDir, 'int8.npz')
+        np.savez(modelFile, **quantize_model(self.definition, self.weights, self.data))
+        floatProbs = create_backend('numpy', self.definition, self.weights).forward(self.data)
+        int8Probs = Int8Backend(self.definition, modelFile).forward(self.data)
+        self.assertEqual(int8Probs.shape, (64, 2))
+        self.assertLess(np.abs(int8Probs - floatProbs).max(), 0.02)
+
+    # the int8 simulation is slower than the float backends, it is used only by the accuracy report
+    def test_int8_is_not_a_runtime_backend(self):
+        self.assertRaises(ValueError, create_backend, 'int8', self.definition, self.weights)
+
+
+if __name__ == '__main__':
+    unittest.main()
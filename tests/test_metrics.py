@@ -0,0 +1,105 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from collections import deque
+import testUtils
+import metrics
+from metrics import StageTimings, histogramBins
+
+
+class StageTimingsTest(unittest.TestCase):
+    def test_summary_in_milliseconds(self):
+        timings = StageTimings()
+        for seconds in (0.001, 0.002, 0.003, 0.004):
+            timings.add('motion', seconds)
+        s = timings.summary()['motion']
+        self.assertEqual(s['count'], 4)
+        self.assertAlmostEqual(s['mean'], 2.5)
+        self.assertAlmostEqual(s['p50'], 2.5)
+        self.assertAlmostEqual(s['max'], 4.)
+
+    def test_stages_keep_the_order_of_the_first_measurement(self):
+        timings = StageTimings()
+        for stage in ('motion', 'pointer', 'motion', 'blink'):
+            with timings.measure(stage):
+                pass
+        self.assertEqual(timings.stages, ['motion', 'pointer', 'blink'])
+        self.assertEqual(timings.summary()['motion']['count'], 2)
+
+    def test_samples_are_bounded(self):
+        timings = StageTimings(maxSamples=10)
+        for i in range(25):
+            timings.add('motion', 0.001)
+        self.assertEqual(timings.summary()['motion']['count'], 10)
+
+    def test_counters_and_reset(self):
+        timings = StageTimings()
+        timings.count('dropped frames')
+        timings.count('dropped frames', 2)
+        timings.set_count('dropped blink requests', 5)
+        timings.add('motion', 0.001)
+        self.assertEqual(timings.counters, {'dropped frames': 3, 'dropped blink requests': 5})
+        self.assertIn('dropped frames', timings.report())
+        timings.reset()
+        self.assertEqual(timings.stages, [])
+        self.assertEqual(timings.counters, {})
+        self.assertEqual(timings.summary(), {})
+
+    def test_histogram_bins(self):
+        timings = StageTimings()
+        for ms in (0.05, 0.15, 5000.):
+            timings.add('motion', ms / 1000.)
+        histogram = timings.histogram('motion')
+        self.assertEqual(len(histogram), len(histogramBins) + 1)
+        self.assertEqual(histogram[0], 1)
+        self.assertEqual(histogram[1], 1)
+        self.assertEqual(histogram[-1], 1)
+
+    def test_save_json_and_csv(self):
+        timings = StageTimings()
+        timings.add('motion', 0.002)
+        timings.count('dropped frames')
+        tmpDir = tempfile.mkdtemp()
+        try:
+            jsonFile = os.path.join(tmpDir, 'metrics.json')
+            timings.save(jsonFile)
+            with open(jsonFile) as f:
+                saved = json.load(f)
+            self.assertEqual(saved['counters'], {'dropped frames': 1})
+            self.assertEqual(saved['stages']['motion']['count'], 1)
+            csvFile = os.path.join(tmpDir, 'metrics.csv')
+            timings.save(csvFile)
+            with open(csvFile) as f:
+                rows = f.read().splitlines()
+            self.assertEqual(rows[0], 'stage,count,mean,p50,p90,p99,max')
+            self.assertTrue(rows[1].startswith('motion,1,'))
+            self.assertEqual(rows[2], 'dropped frames,1')
+        finally:
+            shutil.rmtree(tmpDir)
+
+    # regression: add() registered a new stage and appended its first sample after releasing the lock,
+    # summary() in between took the percentiles of the empty samples and raised
+    def test_summary_while_a_stage_is_added(self):
+        class SlowDeque(deque):
+            def append(self, value):
+                time.sleep(0.2)
+                deque.append(self, value)
+
+        timings = StageTimings()
+        metrics.deque = SlowDeque
+        try:
+            thread = threading.Thread(target=timings.add, args=('motion', 0.001))
+            thread.start()
+            time.sleep(0.05)
+            summary = timings.summary()
+            thread.join()
+        finally:
+            metrics.deque = deque
+        self.assertEqual(summary['motion']['count'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import math
+import unittest
+import numpy as np
+import testUtils
+from motionAndBlinkAnalyzer import BlinkEvent, EyeStateFilter, MotionAndBlinkAnalyzer, TransferFunction
+
+frameRates = [10, 15, 30, 60]
+
+
+# classifier output sequence: list of (duration ms, left eye open probability, right eye open probability)
+# segments sampled at fps, as (timestamp ms, probabilities) frames
+def sample(segments, fps):
+    frames = []
+    stamp = 0.
+    for duration, openL, openR in segments:
+        endStamp = stamp + duration
+        while stamp < endStamp:
+            frames.append((stamp, (openL, openR)))
+            stamp += 1000. / fps
+    return frames
+
+
+# runs the frames through an analyzer starting at timestamp 0, returns the reported events
+def blink_events(frames, filterNaturalBlinks=False):
+    analyzer = MotionAndBlinkAnalyzer()
+    analyzer.filterNaturalBlinks = filterNaturalBlinks
+    analyzer.reset_blink_timing(0)
+    events = []
+    for stamp, probs in frames:
+        event = analyzer.analyze_blink_event(probs, stamp)
+        if event != BlinkEvent.NoBlink:
+            events.append(event)
+    return events
+
+
+class EyeStateFilterTest(unittest.TestCase):
+    def test_state_switches_within_the_same_time_at_any_fps(self):
+        for fps in frameRates:
+            eyeFilter = EyeStateFilter()
+            closedAt = openedAt = None
+            for stamp, probs in sample([(500, 0.95, 0), (300, 0.02, 0), (500, 0.95, 0)], fps):
+                isOpen = eyeFilter.update(probs[0], stamp)
+                if not isOpen and closedAt is None:
+                    closedAt = stamp
+                if isOpen and closedAt is not None and openedAt is None:
+                    openedAt = stamp
+            self.assertTrue(500 <= closedAt < 650, (fps, closedAt))
+            self.assertTrue(800 <= openedAt < 950, (fps, openedAt))
+
+    def test_single_misclassification_is_ignored(self):
+        for fps in frameRates:
+            eyeFilter = EyeStateFilter()
+            states = [eyeFilter.update(probs[0], stamp)
+                      for stamp, probs in sample([(500, 0.95, 0), (1, 0.01, 0), (500, 0.95, 0)], fps)]
+            self.assertTrue(all(states), fps)
+
+    def test_long_gap_lets_one_frame_count(self):
+        eyeFilter = EyeStateFilter()
+        eyeFilter.update(0.95, 0)
+        self.assertTrue(eyeFilter.update(0.02, 30))
+        eyeFilter = EyeStateFilter()
+        eyeFilter.update(0.95, 0)
+        self.assertFalse(eyeFilter.update(0.02, 2000))
+
+
+class BlinkEventTest(unittest.TestCase):
+    def test_blink(self):
+        for fps in frameRates:
+            frames = sample([(500, 0.95, 0.95), (200, 0.02, 0.02), (500, 0.95, 0.95)], fps)
+            self.assertEqual(blink_events(frames), [BlinkEvent.BlinkBoth], fps)
+
+    def test_long_blink(self):
+        for fps in frameRates:
+            frames = sample([(500, 0.95, 0.95), (800, 0.02, 0.02), (500, 0.95, 0.95)], fps)
+            self.assertEqual(blink_events(frames), [BlinkEvent.LongBlink], fps)
+
+    # the blinks end within doubleBlinkDelay only when the filter sees a few frames of each 150 ms state
+    def test_double_blink(self):
+        for fps in [20, 30, 60]:
+            frames = sample([(500, 0.95, 0.95), (150, 0.02, 0.02), (150, 0.95, 0.95),
+                             (150, 0.02, 0.02), (500, 0.95, 0.95)], fps)
+            self.assertEqual(blink_events(frames), [BlinkEvent.BlinkBoth, BlinkEvent.DoubleBlink], fps)
+
+    def test_natural_blink(self):
+        for fps in frameRates:
+            frames = sample([(6500, 0.95, 0.95), (200, 0.02, 0.02), (500, 0.95, 0.95)], fps)
+            self.assertEqual(blink_events(frames, filterNaturalBlinks=True), [BlinkEvent.NaturalBlink], fps)
+
+    def test_one_eye_closed(self):
+        for fps in frameRates:
+            frames = sample([(500, 0.95, 0.95), (1000, 0.02, 0.95), (500, 0.95, 0.95)], fps)
+            self.assertEqual(blink_events(frames), [BlinkEvent.LeftEyeClosed, BlinkEvent.LeftEyeOpened], fps)
+            frames = sample([(500, 0.95, 0.95), (1000, 0.95, 0.02), (500, 0.95, 0.95)], fps)
+            self.assertEqual(blink_events(frames), [BlinkEvent.RightEyeClosed, BlinkEvent.RightEyeOpened], fps)
+
+    def test_skipped_classifications(self):
+        # every third frame is classified only, at irregular intervals
+        frames = sample([(500, 0.95, 0.95), (200, 0.02, 0.02), (500, 0.95, 0.95)], 60)
+        self.assertEqual(blink_events(frames[::3]), [BlinkEvent.BlinkBoth])
+        self.assertEqual(blink_events(frames[::4] + frames[-1:]), [BlinkEvent.BlinkBoth])
+
+    def test_open_eyes_do_not_blink(self):
+        for fps in frameRates:
+            frames = sample([(3000, 0.8, 0.7)], fps)
+            self.assertEqual(blink_events(frames), [], fps)
+
+
+
+# gain of the earlier 10 entry acceleration table, indexed by the rounded speed
+def legacy_gain(level, speed):
+    table = [1] * 10
+    if level > 0:
+        factor1 = 1.5 if level in (1, 3) else 2.
+        # the second stage from speed 14 was beyond the table end
+        for i in range(7, 10):
+            table[i] = factor1
+    return table[min(int(round(speed)), len(table) - 1)]
+
+
+class TransferFunctionTest(unittest.TestCase):
+    def test_levels_match_the_legacy_table(self):
+        speeds = np.random.RandomState(0).uniform(0, 30, 2000).tolist() + [0., 6.45, 6.5, 6.55, 9.5, 14., 100.]
+        for level in range(6):
+            analyzer = MotionAndBlinkAnalyzer()
+            analyzer.set_acceleration_level(level)
+            tf = analyzer.transferFunction
+            for speed in speeds:
+                self.assertEqual(tf.gain(speed), legacy_gain(level, speed), (level, speed))
+            np.testing.assert_array_equal(tf.gains(speeds), [legacy_gain(level, s) for s in speeds])
+
+    def test_interpolation(self):
+        tf = TransferFunction([(10., 3.), (0., 1.)], maxSpeed=20.)
+        self.assertAlmostEqual(tf.gain(0.), 1.)
+        self.assertAlmostEqual(tf.gain(5.), 2.)
+        self.assertAlmostEqual(tf.gain(5.04), 2.)
+        self.assertAlmostEqual(tf.gain(7.5), 2.5)
+        self.assertAlmostEqual(tf.gain(15.), 3.)
+        self.assertAlmostEqual(tf.gain(1000.), 3.)
+
+    def test_replay_matches_the_per_move_filter(self):
+        rng = np.random.RandomState(1)
+        relMoves = rng.normal(0, 0.5, (500, 2))
+        for level in [0, 2, 5]:
+            analyzer = MotionAndBlinkAnalyzer()
+            analyzer.set_acceleration_level(level)
+            replayed = analyzer.replay_pointer_moves(relMoves)
+            moves = [analyzer.get_mouse_pointer_move(dx, dy) for dx, dy in relMoves]
+            np.testing.assert_array_equal(replayed, moves)
+
+    def test_custom_transfer_function(self):
+        analyzer = MotionAndBlinkAnalyzer()
+        analyzer.set_smoothness(2.)
+        analyzer.set_sensitivity(0)
+        analyzer.set_transfer_function([(0., 2.), (50., 2.)])
+        analyzer.subPixelMoves = True
+        dx, dy = analyzer.get_mouse_pointer_move(5., 0.)
+        self.assertAlmostEqual(dx, 2. * 5. * (1. - math.log10(1.05)))
+        self.assertEqual(dy, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
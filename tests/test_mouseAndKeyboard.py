@@ -0,0 +1,65 @@
+import time
+import unittest
+import testUtils
+from mouseAndKeyboard import InputInjector, NullBackend
+
+
+# Null backend that fails on the given methods
+class _FailingBackend(NullBackend):
+    def __init__(self, failingMethods):
+        NullBackend.__init__(self)
+        self.failingMethods = failingMethods
+        self.calls = []
+
+    def move_relative(self, dx, dy):
+        self.calls.append(('move_relative', (dx, dy)))
+        if 'move_relative' in self.failingMethods:
+            raise IOError('display connection lost')
+
+    def click(self, button, n=1):
+        self.calls.append(('click', (button, n)))
+        if 'click' in self.failingMethods:
+            raise ValueError('bad button')
+
+
+# waits up to timeout seconds until the backend got n calls
+def wait_calls(backend, n, timeout=2.):
+    endTime = time.time() + timeout
+    while len(backend.calls) < n and time.time() < endTime:
+        time.sleep(0.01)
+    return backend.calls
+
+
+class InputInjectorTest(unittest.TestCase):
+    def test_actions_keep_their_order(self):
+        backend = _FailingBackend(())
+        injector = InputInjector(backend)
+        try:
+            injector.move(1, 2)
+            injector.add('click', 1)
+            injector.move(3, 4)
+            calls = wait_calls(backend, 3)
+        finally:
+            injector.stop()
+        self.assertEqual(calls[1], ('click', (1, 1)))
+        self.assertEqual(calls[-1], ('move_relative', (3, 4)))
+
+    # regression: an exception in the backend stopped the injector thread, all later input was dropped
+    def test_failed_actions_do_not_stop_the_injector(self):
+        backend = _FailingBackend(('click',))
+        injector = InputInjector(backend)
+        try:
+            injector.add('click', 1)
+            injector.add('no_such_method')
+            wait_calls(backend, 1)
+            injector.move(5, 0)
+            calls = wait_calls(backend, 2)
+        finally:
+            injector.stop()
+        self.assertEqual(calls[-1], ('move_relative', (5, 0)))
+        self.assertEqual(injector.failedCount, 2)
+        self.assertEqual(injector.timings.counters['failed input actions'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
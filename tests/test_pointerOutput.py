@@ -0,0 +1,64 @@
+import unittest
+import testUtils
+from pointerOutput import PointerOutput
+
+
+class PointerOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.moves = []
+        self.output = PointerOutput(lambda dx, dy: self.moves.append((dx, dy)), rate=120.)
+
+    # replays (stamp, dx) frames, ticking the output at its rate until endTime. Returns the output x moves
+    def replay(self, frames, endTime):
+        frames = list(frames)
+        dt = 1. / self.output.rate
+        t = 0.
+        while t < endTime:
+            while frames and frames[0][0] <= t:
+                stamp, dx = frames.pop(0)
+                self.output.add_move(dx, 0., stamp)
+            self.output.tick(dt)
+            t += dt
+        return [m[0] for m in self.moves]
+
+    def test_moves_are_spread_over_the_frame_interval(self):
+        xs = self.replay([(0., 12.), (0.04, 0.)], 0.2)
+        self.assertEqual(sum(xs), 12)
+        self.assertEqual(max(xs), 3)
+
+    # late frames make the pointer predict, the head stop returns the predicted excess
+    def test_total_output_equals_total_input(self):
+        frames = [(i * 0.04, 5.) for i in range(40)]
+        # every fifth frame is late
+        frames = [(stamp + (0.03 if i % 5 == 4 else 0.), dx) for i, (stamp, dx) in enumerate(frames)]
+        frames += [(1.6 + i * 0.04, 0.) for i in range(5)]
+        xs = self.replay(frames, 2.)
+        self.assertEqual(sum(xs), 200)
+        self.assertTrue(all(x >= 0 for x in xs[:int(1.6 * 120)]))
+
+    def test_moves_queued_before_a_tick(self):
+        self.output.add_move(10., 0., 0.)
+        self.output.add_move(10., 0., 0.04)
+        xs = self.replay([(0.08, 0.), (0.12, 0.)], 0.3)
+        self.assertEqual(sum(xs), 20)
+
+    def test_back_and_forth_returns_to_the_start(self):
+        # the frame after the moves to the left is late, the pointer predicts further left meanwhile
+        frames = [(i * 0.04, -5.) for i in range(5)] + [(0.3 + i * 0.04, 5.) for i in range(5)]
+        frames += [(0.5 + i * 0.04, 0.) for i in range(3)]
+        xs = self.replay(frames, 1.)
+        self.assertEqual(sum(xs), 0)
+
+    def test_no_prediction_after_the_head_stopped(self):
+        xs = self.replay([(0., 8.), (0.04, 0.)], 0.5)
+        self.assertEqual(sum(xs), 8)
+        self.assertEqual(sum(self.replay([], 0.5)), 8)
+
+    def test_clear_drops_the_pending_move(self):
+        self.output.add_move(10., 0., 0.)
+        self.output.clear()
+        self.assertEqual(sum(self.replay([], 0.2)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
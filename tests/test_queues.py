@@ -0,0 +1,39 @@
+import threading
+import time
+import unittest
+import testUtils
+from queues import DropOldestQueue
+
+
+class DropOldestQueueTest(unittest.TestCase):
+    def test_fifo_order(self):
+        q = DropOldestQueue(3)
+        for i in range(3):
+            self.assertFalse(q.put(i))
+        self.assertEqual([q.get(0), q.get(0), q.get(0)], [0, 1, 2])
+
+    def test_full_queue_drops_the_oldest(self):
+        q = DropOldestQueue(2)
+        q.put(1)
+        q.put(2)
+        self.assertTrue(q.put(3))
+        self.assertTrue(q.put(4))
+        self.assertEqual(q.droppedCount, 2)
+        self.assertEqual([q.get(0), q.get(0)], [3, 4])
+
+    def test_get_times_out_on_empty_queue(self):
+        q = DropOldestQueue()
+        start = time.time()
+        self.assertIsNone(q.get(0.05))
+        self.assertGreaterEqual(time.time() - start, 0.04)
+
+    def test_get_wakes_up_on_put(self):
+        q = DropOldestQueue()
+        timer = threading.Timer(0.05, q.put, ('item',))
+        timer.start()
+        self.assertEqual(q.get(2.), 'item')
+        timer.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+import numpy as np
+import testUtils
+import utils as u
+from motionAndBlinkAnalyzer import BlinkEvent
+
+
+class DrawBlinkEventTest(unittest.TestCase):
+    def setUp(self):
+        u.shownBlinkEvents.clear()
+
+    def drawn(self, blinkEvent, key=None, origin=(10, 40)):
+        img = np.zeros((60, 400, 3), np.uint8)
+        u.draw_blink_event(img, blinkEvent, key=key, origin=origin)
+        return img.any()
+
+    def test_event_is_held_for_a_few_frames(self):
+        self.assertFalse(self.drawn(BlinkEvent.NoBlink))
+        self.assertTrue(self.drawn(BlinkEvent.BlinkBoth))
+        held = [self.drawn(BlinkEvent.NoBlink) for i in range(40)]
+        self.assertEqual(held.count(True), 29)
+        self.assertEqual(u.shownBlinkEvents, {})
+
+    # regression: the shown event was one for all the users, the events of the other tracks were never drawn
+    def test_users_have_their_own_events(self):
+        self.assertTrue(self.drawn(BlinkEvent.BlinkBoth, key=1))
+        self.assertTrue(self.drawn(BlinkEvent.LeftEyeClosed, key=2))
+        self.assertEqual(u.shownBlinkEvents[1][0], BlinkEvent.blink_event_to_text(BlinkEvent.BlinkBoth))
+        self.assertEqual(u.shownBlinkEvents[2][0], BlinkEvent.blink_event_to_text(BlinkEvent.LeftEyeClosed))
+        self.assertTrue(self.drawn(BlinkEvent.NoBlink, key=1))
+        self.assertFalse(self.drawn(BlinkEvent.NoBlink, key=3))
+
+
+if __name__ == '__main__':
+    unittest.main()